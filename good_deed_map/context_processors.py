@@ -9,4 +9,5 @@ def public_settings(request):
     return {
         "YANDEX_MAPS_API_KEY": getattr(settings, "YANDEX_MAPS_API_KEY", ""),
         "YANDEX_MAPS_GEO_API_KEY": getattr(settings, "YANDEX_MAPS_GEO_API_KEY", ""),
+        "MAP_TILES_URL": getattr(settings, "MAP_TILES_URL", ""),
     }
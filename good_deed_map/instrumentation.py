@@ -0,0 +1,197 @@
+"""
+Per-request timing for good_deed_map.
+
+``request_metrics_middleware`` collects, for each request:
+
+- ``db``: the number and total time of SQL queries (a wrapper added to
+  ``connection.execute_wrappers`` of every connection);
+- ``tpl``: template rendering time (the ``DjangoTemplates`` backend below);
+- ``yandex``, ``smtp``, ...: any block wrapped in ``timer(name)``.
+
+The figures go to the ``Server-Timing`` response header (browser devtools
+show them next to the request), and the total goes to the per-view latency
+histogram of ``good_deed_map.metrics``. Requests slower than
+``SLOW_REQUEST_MS`` are logged with their slowest queries. The collector lives in a context
+variable, so it follows the request into ``sync_to_async`` threads; work
+in other threads (background email sending) is not attributed to it.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends import django as django_backend
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics as prometheus
+
+logger = logging.getLogger(__name__)
+
+# Длина SQL в логе медленных запросов
+SQL_LOG_LENGTH = 300
+
+_metrics = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    __slots__ = ("started", "timings", "counts", "depth", "queries")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.counts = {}
+        self.depth = {}
+        self.queries = []
+
+    def add(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+@contextmanager
+def timer(name):
+    """Добавить время блока к метрике name текущего запроса"""
+    metrics = _metrics.get()
+    if metrics is None:
+        yield
+        return
+    # Вложенные замеры одной метрики (шаблон внутри шаблона) не суммируются
+    depth = metrics.depth.get(name, 0)
+    metrics.depth[name] = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth[name] = depth
+        if depth == 0:
+            metrics.add(name, time.perf_counter() - start)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        metrics.add("db", duration)
+        metrics.queries.append((duration, sql))
+
+
+def install_query_wrapper(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(install_query_wrapper)
+
+
+class Template:
+    """Шаблон бэкенда DjangoTemplates с замером render()"""
+
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        with timer("tpl"):
+            return self.template.render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Стандартный бэкенд шаблонов, время отрисовки идёт в метрику tpl"""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name))
+
+
+def _server_timing(metrics, total):
+    entries = []
+    for name, duration in metrics.timings.items():
+        entry = f"{name};dur={duration * 1000:.1f}"
+        if name == "db":
+            entry += f';desc="{metrics.counts[name]} queries"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def _log_slow(request, response, metrics, total):
+    top = sorted(metrics.queries, key=lambda q: q[0], reverse=True)
+    top = top[: settings.SLOW_REQUEST_TOP_QUERIES]
+    logger.warning(
+        "Slow request %s %s: %d in %.0f ms (%s)%s",
+        request.method,
+        request.path,
+        response.status_code,
+        total * 1000,
+        ", ".join(
+            f"{name} {duration * 1000:.0f} ms"
+            for name, duration in metrics.timings.items()
+        )
+        or "no I/O",
+        "".join(
+            f"\n  {duration * 1000:.1f} ms: {sql[:SQL_LOG_LENGTH]}"
+            for duration, sql in top
+        ),
+    )
+
+
+def _start():
+    # Соединения, открытые до импорта модуля (например, в тестах)
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
+    metrics = RequestMetrics()
+    return metrics, _metrics.set(metrics)
+
+
+def _finish(request, response, metrics):
+    total = metrics.elapsed()
+    prometheus.observe_request(request, response, total)
+    if settings.SERVER_TIMING:
+        response["Server-Timing"] = _server_timing(metrics, total)
+    if total * 1000 >= settings.SLOW_REQUEST_MS:
+        _log_slow(request, response, metrics, total)
+    return response
+
+
+@sync_and_async_middleware
+def request_metrics_middleware(get_response):
+    """Замеры запроса: заголовок Server-Timing и лог медленных запросов"""
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            metrics, token = _start()
+            try:
+                response = await get_response(request)
+            finally:
+                _metrics.reset(token)
+            return _finish(request, response, metrics)
+
+    else:
+
+        def middleware(request):
+            metrics, token = _start()
+            try:
+                response = get_response(request)
+            finally:
+                _metrics.reset(token)
+            return _finish(request, response, metrics)
+
+    return middleware
@@ -0,0 +1,101 @@
+"""
+Logging setup for good_deed_map (see LOGGING in settings).
+
+- ``QueueStreamHandler``: a ``QueueHandler`` that formats the record in the
+  calling thread and puts it on a queue; a ``QueueListener`` thread writes it
+  to the stream, so request threads never wait on stdout/stderr or journald.
+- ``JsonFormatter``: one JSON object per line, with the fields passed in
+  ``extra=`` kept as top-level keys.
+- ``DebugSampler``: lets through only a fraction of DEBUG records, so debug
+  logging can stay on in production without flooding the log.
+
+Call sites use %-style arguments (``logger.debug("city: %s", name)``): when
+the level is off the message is never built, and a disabled DEBUG call costs
+one cached ``isEnabledFor`` check.
+
+The handler is configured with ``"()"`` rather than ``"class"``: from Python
+3.12 on, ``dictConfig`` builds its own listener for ``QueueHandler``
+subclasses given by class.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Атрибуты любой записи; всё остальное пришло через extra=
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRS and not key.startswith("_")
+        )
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает долю rate записей DEBUG, записи остальных уровней — все"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return (
+            record.levelno > logging.DEBUG
+            or self.rate >= 1
+            or random.random() < self.rate
+        )
+
+
+class QueueStreamHandler(logging.handlers.QueueHandler):
+    """Записи выводит в stream фоновый QueueListener"""
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.stream = stream
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.listener = logging.handlers.QueueListener(
+            self.queue, logging.StreamHandler(self.stream or sys.stderr)
+        )
+        self.listener.start()
+        self.running = True
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            # Поток слушателя не переживает fork (воркеры gunicorn с --preload)
+            self.queue = queue.SimpleQueue()
+            self._start()
+        super().emit(record)
+
+    def close(self):
+        # Дописать очередь перед завершением процесса
+        if self.running and self.pid == os.getpid():
+            self.running = False
+            self.listener.stop()
+        super().close()
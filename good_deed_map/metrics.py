@@ -0,0 +1,369 @@
+"""
+Prometheus metrics for good_deed_map.
+
+Counters and histograms are declared at module level next to the code they
+measure::
+
+    UPSTREAM_ERRORS = metrics.Counter(
+        "gdm_upstream_errors_total", "Failed upstream calls", ["upstream", "reason"]
+    )
+    UPSTREAM_ERRORS.inc(upstream="suggest", reason="ReadTimeout")
+
+Every process (gunicorn or uvicorn worker, background worker) keeps its
+samples in memory; a daemon thread writes them every METRICS_FLUSH_INTERVAL
+seconds to the process's own file in METRICS_DIR (atomic replace), so a
+request only updates a dict and nothing is shared between processes on the
+hot path. ``metrics_view`` sums the files of all
+processes, so counters and histograms aggregate across workers. Files of
+exited processes (worker restarts after max_requests) are folded into
+``archive.json``, so their counts are kept and the directory does not grow.
+Values that live in the database, such as the moderation queue, are read at
+scrape time by collectors added with ``register_collector``.
+
+The endpoint answers only direct requests from METRICS_ALLOWED_IPS: the
+scraper talks to gunicorn itself, requests proxied by nginx get 404.
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows: нет блокировок и проверки процессов
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+ARCHIVE_NAME = "archive.json"
+LOCK_NAME = ".lock"
+_PROCESS_FILE = re.compile(r"^(\d+)-[0-9a-f]+\.json$")
+
+# Границы корзин гистограмм: время в секундах и размер в байтах
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 5e6)
+
+_families = {}
+_collectors = []
+
+
+def _write(directory, name, items):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(items, f)
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except ValueError:
+        logger.warning("Corrupted metrics file %s", path)
+        return []
+
+
+class _Store:
+    """Сэмплы текущего процесса: (имя, метки) -> значение"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.name = f"{self.pid}-{os.urandom(4).hex()}.json"
+        self.values = {}
+        self.dirty = False
+        self.flusher = None
+
+    def add(self, updates):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Значения родителя после fork принадлежат его файлу
+                self._reset()
+            for key, amount in updates:
+                self.values[key] = self.values.get(key, 0) + amount
+            self.dirty = True
+            if self.flusher is None and settings.METRICS_DIR:
+                self.flusher = threading.Thread(
+                    target=self._flush_loop, name="metrics-flush", daemon=True
+                )
+                self.flusher.start()
+
+    def _flush_loop(self):
+        # Запись идёт в фоне: запрос только меняет словарь в памяти
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            if self.pid != os.getpid():
+                return
+            if self.dirty:
+                self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    def flush(self):
+        """Записать значения в файл процесса в METRICS_DIR"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty or not settings.METRICS_DIR:
+                    return
+                self.dirty = False
+                items = [
+                    [name, labels, value]
+                    for (name, labels), value in self.values.items()
+                ]
+                name = self.name
+            try:
+                _write(settings.METRICS_DIR, name, items)
+            except OSError:
+                self.dirty = True
+                logger.exception("Cannot write metrics to %s", settings.METRICS_DIR)
+
+
+_store = _Store()
+# Несохранённые значения завершающегося процесса (штатный перезапуск воркера)
+atexit.register(_store.flush)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _families[name] = self
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        _store.add([((self.name, self._labels(labels)), amount)])
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = [(bound, _format(bound)) for bound in (*buckets, math.inf)]
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        # Пустые корзины тоже пишутся, чтобы у каждого набора меток был
+        # полный набор границ для histogram_quantile()
+        updates = [
+            ((f"{self.name}_bucket", labels + (("le", le),)), int(value <= bound))
+            for bound, le in self.buckets
+        ]
+        updates.append(((f"{self.name}_sum", labels), value))
+        updates.append(((f"{self.name}_count", labels), 1))
+        _store.add(updates)
+
+    @contextmanager
+    def time(self, **labels):
+        """Наблюдать длительность блока в секундах"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def register_collector(collector):
+    """
+    Добавить функцию, вычисляющую значения при каждом опросе.
+
+    collector() возвращает список (имя, тип, описание, [(метки, значение)]).
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(total, items):
+    for name, labels, value in items:
+        key = (name, tuple(map(tuple, labels)))
+        total[key] = total.get(key, 0) + value
+
+
+@contextmanager
+def _lock(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_NAME), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _collect_files(directory):
+    """Сумма сэмплов всех процессов из каталога METRICS_DIR"""
+    with _lock(directory):
+        archived = {}
+        _merge(archived, _read(os.path.join(directory, ARCHIVE_NAME)))
+        live, dead = {}, []
+        for entry in os.scandir(directory):
+            match = _PROCESS_FILE.match(entry.name)
+            if match is None:
+                continue
+            pid = int(match.group(1))
+            finished = fcntl is not None and pid != os.getpid() and not _alive(pid)
+            _merge(archived if finished else live, _read(entry.path))
+            if finished:
+                dead.append(entry.path)
+        if dead:
+            _write(
+                directory,
+                ARCHIVE_NAME,
+                [[name, labels, value] for (name, labels), value in archived.items()],
+            )
+            for path in dead:
+                os.remove(path)
+    for key, value in live.items():
+        archived[key] = archived.get(key, 0) + value
+    return archived
+
+
+def collect():
+    """Значения всех процессов: (имя, метки) -> значение"""
+    if not settings.METRICS_DIR:
+        return _store.snapshot()
+    _store.flush()
+    return _collect_files(settings.METRICS_DIR)
+
+
+def _format(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return repr(value)
+
+
+def _escape(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += "{%s}" % ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+    return f"{name} {_format(value)}"
+
+
+def _family(sample):
+    if sample in _families:
+        return sample
+    base, _, suffix = sample.rpartition("_")
+    metric = _families.get(base)
+    if (
+        suffix in ("bucket", "sum", "count")
+        and getattr(metric, "type", None) == "histogram"
+    ):
+        return base
+    return sample
+
+
+def _order(sample):
+    name, labels, _ = sample
+    le = dict(labels).get("le")
+    return (
+        tuple(label for label in labels if label[0] != "le"),
+        name,
+        float(le) if le is not None else 0.0,
+    )
+
+
+def _header(name, kind, documentation):
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    families = {}
+    for (name, labels), value in collect().items():
+        families.setdefault(_family(name), []).append((name, labels, value))
+
+    lines = []
+    for family in sorted(families):
+        metric = _families.get(family)
+        if metric is not None:
+            lines += _header(family, metric.type, metric.documentation)
+        for sample in sorted(families[family], key=_order):
+            lines.append(_sample(*sample))
+
+    for collector in _collectors:
+        try:
+            collected = collector()
+        except Exception:
+            logger.exception("Metrics collector %s failed", collector.__name__)
+            continue
+        for name, kind, documentation, values in collected:
+            lines += _header(name, kind, documentation)
+            for labels, value in values:
+                lines.append(_sample(name, tuple(sorted(labels.items())), value))
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_DURATION = Histogram(
+    "gdm_request_duration_seconds", "Request latency by view", ["view"]
+)
+RESPONSE_SIZE = Histogram(
+    "gdm_response_size_bytes",
+    "Response body size of METRICS_RESPONSE_SIZE_VIEWS",
+    ["view"],
+    buckets=SIZE_BUCKETS,
+)
+
+
+def observe_request(request, response, duration):
+    """Записать время ответа (вызывается из request_metrics_middleware)"""
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name if match is not None else "<unresolved>"
+    REQUEST_DURATION.observe(duration, view=view)
+    if view in settings.METRICS_RESPONSE_SIZE_VIEWS and not response.streaming:
+        RESPONSE_SIZE.observe(len(response.content), view=view)
+
+
+def metrics_view(request):
+    """Метрики для Prometheus; только прямые запросы с METRICS_ALLOWED_IPS"""
+    proxied = "HTTP_X_FORWARDED_FOR" in request.META
+    if proxied or request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
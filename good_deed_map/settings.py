@@ -57,6 +57,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # Первым: замеряет весь запрос (см. SERVER_TIMING ниже)
+    "good_deed_map.instrumentation.request_metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     # LocaleMiddleware must be after SessionMiddleware and before CommonMiddleware
@@ -72,7 +74,8 @@ ROOT_URLCONF = "good_deed_map.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates с замером времени отрисовки для Server-Timing
+        "BACKEND": "good_deed_map.instrumentation.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -93,13 +96,118 @@ WSGI_APPLICATION = "good_deed_map.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+#
+# DB_BACKEND selects the database profile:
+#   sqlite   - local development (default)
+#   postgres - production PostgreSQL
+#   postgis  - production PostgreSQL with PostGIS (adds a geography column for NKO)
+
+DB_BACKEND = os.environ.get("DB_BACKEND", "sqlite").lower()
+USE_POSTGIS = DB_BACKEND == "postgis"
+
+if DB_BACKEND in ("postgres", "postgresql", "postgis"):
+    # psycopg's connection pool cannot be combined with persistent connections
+    DB_POOL = os.environ.get("DB_POOL", "False").lower() in ("1", "true", "yes")
+
+    DATABASES = {
+        "default": {
+            "ENGINE": (
+                "django.contrib.gis.db.backends.postgis"
+                if USE_POSTGIS
+                else "django.db.backends.postgresql"
+            ),
+            "NAME": os.environ.get("DB_NAME", "good_deed_map"),
+            "USER": os.environ.get("DB_USER", "good_deed_map"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "127.0.0.1"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            "CONN_MAX_AGE": (
+                0 if DB_POOL else int(os.environ.get("DB_CONN_MAX_AGE", 60))
+            ),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", 5)),
+            },
+        }
     }
-}
 
+    if DB_POOL:
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        }
+
+    if USE_POSTGIS:
+        INSTALLED_APPS.append("django.contrib.gis")
+elif DB_BACKEND == "sqlite":
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 20))  # секунды
+
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # WAL: читатели не блокируются во время записи; busy_timeout:
+                # писатели ждут блокировку вместо "database is locked"
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000};"
+                    f"PRAGMA mmap_size={int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))};"
+                    f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_KB', 20000))};"
+                    "PRAGMA temp_store=MEMORY;"
+                ),
+                # Берём блокировку записи в начале транзакции, а не при первом
+                # UPDATE: иначе SQLite отвечает BUSY сразу, минуя busy_timeout
+                "transaction_mode": "IMMEDIATE",
+                "timeout": SQLITE_BUSY_TIMEOUT,
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_BACKEND: {DB_BACKEND}")
+
+TEST_RUNNER = "good_deed_map.test_runner.TestRunner"
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Кэш общий для всех воркеров gunicorn и переживает их перезапуск:
+# Redis, если задан REDIS_URL, иначе файловый кэш на диске. В файловом кэше
+# add()/incr() не атомарны между процессами (см. nko/cache.py), поэтому в
+# продакшене с несколькими воркерами нужен Redis.
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "good_deed_map",
+            "TIMEOUT": 300,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / ".cache" / "django"),
+            "TIMEOUT": 300,
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Сессии: "cached_db" (по умолчанию) — чтение из общего кэша, запись в БД;
+# "cache" — только кэш; "signed_cookies" — подписанная cookie без хранения
+# на сервере; "db" — только таблица django_session
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "cached_db").lower()
+SESSION_ENGINE = f"django.contrib.sessions.backends.{SESSION_BACKEND}"
+
+# Сообщения (django.contrib.messages) хранятся в cookie, а не в сессии
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -146,9 +254,23 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# collectstatic сохраняет файлы с хэшем содержимого в имени и сжатые копии
+# (.gz, .br при установленном brotli) для gzip_static/brotli_static в nginx
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "good_deed_map.storage.CompressedManifestStaticFilesStorage"
+    },
+}
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Логотипы НКО: ограничения загрузки. Миниатюры для карточек и меток карты
+# строит фоновый воркер (python manage.py process_logo_thumbnails)
+NKO_LOGO_MAX_SIZE = int(os.environ.get("NKO_LOGO_MAX_SIZE", 5 * 1024 * 1024))
+NKO_LOGO_MAX_PIXELS = 25_000_000
+
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
@@ -171,6 +293,27 @@ AUTHENTICATION_BACKENDS = [
     "users.backends.EmailOnlyBackend",
 ]
 
+# Защита входа (users/backends.py): лимиты попыток за окно в секундах по IP
+# (все попытки) и по учётной записи (неудачные), счётчики в общем кэше.
+# Точно считает только Redis, в файловом кэше лимиты приблизительные (nko.W001)
+LOGIN_THROTTLE_WINDOW = int(os.environ.get("LOGIN_THROTTLE_WINDOW", "300"))
+LOGIN_IP_LIMIT = int(os.environ.get("LOGIN_IP_LIMIT", "30"))
+LOGIN_ACCOUNT_LIMIT = int(os.environ.get("LOGIN_ACCOUNT_LIMIT", "10"))
+# Одновременных проверок пароля на все воркеры сервера (по умолчанию половина
+# CPU, остальные остаются обычным запросам) и сколько секунд ждать свободного
+# слота, прежде чем отказать во входе. Ожидающий sync-воркер тоже занят,
+# поэтому ждут не больше LOGIN_HASH_CONCURRENCY запросов сразу
+LOGIN_HASH_CONCURRENCY = int(
+    os.environ.get("LOGIN_HASH_CONCURRENCY", str(max(1, (os.cpu_count() or 1) // 2)))
+)
+LOGIN_HASH_WAIT = float(os.environ.get("LOGIN_HASH_WAIT", "2"))
+# Файлы слотов (блокировки flock), общие для воркеров одного сервера
+LOGIN_HASH_SLOTS_DIR = os.environ.get(
+    "LOGIN_HASH_SLOTS_DIR", str(BASE_DIR / ".cache" / "login-slots")
+)
+# Заголовок с IP клиента от прокси; пусто — REMOTE_ADDR
+LOGIN_CLIENT_IP_HEADER = os.environ.get("LOGIN_CLIENT_IP_HEADER", "")
+
 EMAIL_BACKEND = os.environ.get(
     "EMAIL_BACKEND",
     "django.core.mail.backends.console.EmailBackend"
@@ -189,9 +332,93 @@ DEFAULT_FROM_EMAIL = os.environ.get(
     "DEFAULT_FROM_EMAIL", EMAIL_HOST_USER or "no-reply@good-deed-map.local"
 )
 
+# Письма подтверждения и сброса пароля отправляются фоновыми потоками,
+# чтобы запрос не ждал SMTP
+EMAIL_ASYNC = os.environ.get("EMAIL_ASYNC", "True").lower() in ("1", "true", "yes")
+EMAIL_SENDER_THREADS = int(os.environ.get("EMAIL_SENDER_THREADS", "2"))
+
+# Токены подтверждения email: "signed" — подписанные ссылки без записи в БД,
+# "db" — прежние UUID-токены в таблице EmailConfirmationToken
+EMAIL_CONFIRMATION_TOKENS = os.environ.get(
+    "EMAIL_CONFIRMATION_TOKENS", "signed"
+).lower()
+EMAIL_CONFIRMATION_MAX_AGE = 24 * 60 * 60  # секунды
+
 YANDEX_MAPS_API_KEY = os.environ.get("YANDEX_MAPS_API_KEY", "")
 YANDEX_MAPS_GEO_API_KEY = os.environ.get("YANDEX_MAPS_GEO_API_KEY", "")
 
+# Массовые действия модерации больше этого числа объектов выполняются
+# фоновой задачей (python manage.py run_moderation_jobs), а не в запросе
+MODERATION_INLINE_LIMIT = int(os.environ.get("MODERATION_INLINE_LIMIT", "100"))
+
+# Хранение снимков в версиях НКО: "full" — полная копия; "compact" — только
+# изменённые относительно опорной версии поля, длинные тексты сжаты zlib
+NKO_VERSION_STORAGE = os.environ.get("NKO_VERSION_STORAGE", "full").lower()
+
+# Статические тайлы точек карты (nko/tiles.py): JSON-файлы z/x/y в
+# MAP_TILES_ROOT, которые nginx отдаёт по MAP_TILES_URL. Пустой URL — тайлы
+# не публикуются, карта берёт данные из /nko/api/nko-list/
+MAP_TILES_URL = os.environ.get("MAP_TILES_URL", "")
+MAP_TILES_ROOT = os.environ.get("MAP_TILES_ROOT", os.path.join(BASE_DIR, "map_tiles"))
+MAP_TILES_ZOOM = int(os.environ.get("MAP_TILES_ZOOM", "4"))
+
+# Замеры запросов (good_deed_map/instrumentation.py): время SQL, шаблонов,
+# запросов к Яндексу и SMTP в заголовке Server-Timing; запросы дольше
+# SLOW_REQUEST_MS пишутся в лог вместе с самыми медленными SQL-запросами
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "True").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_TOP_QUERIES = 5
+
+# Метрики Prometheus (good_deed_map/metrics.py, /metrics/): каждый процесс
+# раз в METRICS_FLUSH_INTERVAL секунд пишет свои значения в METRICS_DIR,
+# ответ складывает файлы всех процессов. Отдаются только прямым запросам
+# с METRICS_ALLOWED_IPS (не через nginx)
+METRICS_DIR = os.environ.get("METRICS_DIR", str(BASE_DIR / ".cache" / "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1"))
+METRICS_ALLOWED_IPS = os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+# Представления, для которых собирается гистограмма размера ответа
+METRICS_RESPONSE_SIZE_VIEWS = ("nko_list_api", "index")
+
+# Журнал (good_deed_map/log.py): записи в JSON, в stderr их пишет фоновый
+# поток, так что запрос не ждёт вывода. LOG_LEVELS задаёт уровни отдельных
+# логгеров, например "nko.views=DEBUG,users=DEBUG"; из записей DEBUG
+# выводится доля LOG_DEBUG_SAMPLE_RATE
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = {
+    name.strip(): level.strip().upper()
+    for name, _, level in (
+        item.partition("=") for item in os.environ.get("LOG_LEVELS", "").split(",")
+    )
+    if name.strip() and level.strip()
+}
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"json": {"()": "good_deed_map.log.JsonFormatter"}},
+    "filters": {
+        "debug_sampler": {
+            "()": "good_deed_map.log.DebugSampler",
+            "rate": LOG_DEBUG_SAMPLE_RATE,
+        }
+    },
+    "handlers": {
+        "queue": {
+            "()": "good_deed_map.log.QueueStreamHandler",
+            "formatter": "json",
+            "filters": ["debug_sampler"],
+        }
+    },
+    "root": {"handlers": ["queue"], "level": LOG_LEVEL},
+    "loggers": {
+        # Без консольного обработчика Django по умолчанию: его записи идут
+        # в общий JSON-журнал один раз
+        "django": {"handlers": [], "level": "INFO"},
+        **{name: {"level": level} for name, level in LOG_LEVELS.items()},
+    },
+}
+
 # Site URL for email links (should be set in production)
 SITE_URL = os.environ.get("SITE_URL", "http://localhost:8000")
 
@@ -204,11 +431,23 @@ CAPTCHA_FOREGROUND_COLOR = "#15256D"
 CAPTCHA_NOISE_FUNCTIONS = ("captcha.helpers.noise_dots",)
 CAPTCHA_CHALLENGE_FUNCT = "captcha.helpers.math_challenge"  # Математическая капча
 CAPTCHA_TIMEOUT = 5  # Время действия капчи в минутах
+# Пул готовых капч (python manage.py refill_captcha_pool): форма берёт задачу
+# из пула, которая действует ещё не меньше CAPTCHA_GET_FROM_POOL_TIMEOUT минут
+CAPTCHA_GET_FROM_POOL = os.environ.get("CAPTCHA_POOL", "False").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+CAPTCHA_GET_FROM_POOL_TIMEOUT = CAPTCHA_TIMEOUT
+CAPTCHA_POOL_SIZE = int(os.environ.get("CAPTCHA_POOL_SIZE", "500"))
+CAPTCHA_POOL_LIFETIME = 30  # минуты
 
 # Security settings for production behind reverse proxy
 if not DEBUG:
     # Trust the X-Forwarded-Proto header from Nginx
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+    # Nginx передаёт адрес клиента в X-Real-IP (см. nginx.conf)
+    LOGIN_CLIENT_IP_HEADER = LOGIN_CLIENT_IP_HEADER or "HTTP_X_REAL_IP"
 
     # CSRF settings for reverse proxy
     CSRF_TRUSTED_ORIGINS = [
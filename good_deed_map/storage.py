@@ -0,0 +1,68 @@
+"""
+Static files storage for good_deed_map.
+
+``collectstatic`` writes content-hashed copies of every file (``main_tsx.js``
+-> ``main_tsx.3f2a1c9b0d4e.js``) plus a manifest, and ``{% static %}`` renders
+the hashed names, so nginx can cache ``/static/`` as immutable. Text assets
+also get precompressed siblings: ``.gz`` for ``gzip_static`` and, when the
+optional ``brotli`` package is installed, ``.br`` for ``brotli_static``.
+"""
+
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    ".css",
+    ".js",
+    ".json",
+    ".map",
+    ".svg",
+    ".txt",
+    ".html",
+    ".xml",
+)
+# Меньше этого сжатие не окупается
+MIN_SIZE = 256
+# Сжатая копия нужна, только если она заметно меньше оригинала
+MAX_RATIO = 0.95
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run=dry_run, **options
+        ):
+            if hashed_name and not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self._compress(name)
+
+    def _compress(self, name):
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < MIN_SIZE:
+            return
+
+        variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content)))
+        for suffix, compressed in variants:
+            if len(compressed) > len(content) * MAX_RATIO:
+                # Не оставляем устаревшую копию от прошлой сборки
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                continue
+            with open(self.path(name + suffix), "wb") as f:
+                f.write(compressed)
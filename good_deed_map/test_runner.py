@@ -0,0 +1,104 @@
+"""
+Test runner for good_deed_map.
+
+Runs the suite on the configured database (SQLite by default). With
+``TEST_POSTGRESQL=1`` and the ``testing.postgresql`` package installed the
+suite runs against a throwaway PostgreSQL cluster started from the local
+``initdb``/``postgres`` binaries, so no Docker is needed. If the package is
+missing, the PostgreSQL run is skipped and the configured database is used.
+
+Shared services are replaced by local fakes for the duration of the run
+(see TEST_SETTINGS), so tests never touch the production cache.
+"""
+
+import logging
+import os
+
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+TEST_SETTINGS = {
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    # Письма уходят в mail.outbox сразу, без фоновых потоков
+    "EMAIL_ASYNC": False,
+    # Метрики остаются в памяти процесса тестов
+    "METRICS_DIR": "",
+    # Манифест статики появляется только после collectstatic
+    "STORAGES": {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+}
+
+
+class TestRunner(DiscoverRunner):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._postgresql = None
+        self._test_settings = override_settings(**TEST_SETTINGS)
+        self._log_handlers = []
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings.enable()
+        # Ожидаемые в тестах 404 и 500 из django.request не попадают в вывод;
+        # записи журнала проверяются через assertLogs
+        root = logging.getLogger()
+        self._log_handlers = root.handlers[:]
+        root.handlers = [logging.NullHandler()]
+
+    def teardown_test_environment(self, **kwargs):
+        logging.getLogger().handlers = self._log_handlers
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        if os.environ.get("TEST_POSTGRESQL", "").lower() in ("1", "true", "yes"):
+            self._start_postgresql()
+        return super().setup_databases(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        super().teardown_databases(old_config, **kwargs)
+        if self._postgresql is not None:
+            self._postgresql.stop()
+            self._postgresql = None
+
+    def _start_postgresql(self):
+        try:
+            import testing.postgresql
+        except ImportError:
+            self.log(
+                "TEST_POSTGRESQL is set but testing.postgresql is not installed; "
+                "skipping PostgreSQL and using the configured database."
+            )
+            return
+
+        self._postgresql = testing.postgresql.Postgresql()
+        dsn = self._postgresql.dsn()
+
+        db = connections.settings["default"]
+        if "postgresql" not in db["ENGINE"] and "postgis" not in db["ENGINE"]:
+            db["ENGINE"] = "django.db.backends.postgresql"
+            db["OPTIONS"] = {}
+        db.update(
+            {
+                "NAME": dsn["database"],
+                "USER": dsn["user"],
+                "PASSWORD": "",
+                "HOST": dsn["host"],
+                "PORT": dsn["port"],
+            }
+        )
+        # Drop the already created (SQLite) connection object so the next
+        # access builds one from the updated settings.
+        connections.close_all()
+        try:
+            del connections["default"]
+        except AttributeError:
+            pass
+        self.log(
+            f"Running tests on temporary PostgreSQL cluster {dsn['host']}:{dsn['port']}"
+        )
@@ -16,25 +16,43 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
+from good_deed_map import metrics
 from nko import views as nko_views
 from users import views as users_views
-from users.forms import CustomPasswordResetForm, CustomPasswordResetTsxForm
+from users.forms import (
+    CustomAuthenticationForm,
+    CustomPasswordResetForm,
+    CustomPasswordResetTsxForm,
+)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", metrics.metrics_view, name="metrics"),
     path("", nko_views.index_tsx, name="index"),
     path("old/", nko_views.index, name="index_old"),
     path("nko/", include("nko.urls")),
     path("users/", include("users.urls")),
+    # Картинки капчи отдаются из кэша пула (users/captcha_pool.py)
+    re_path(
+        r"^captcha/image/(?P<key>\w+)/$",
+        users_views.captcha_image,
+        kwargs={"scale": 1},
+    ),
+    re_path(
+        r"^captcha/image/(?P<key>\w+)@2/$",
+        users_views.captcha_image,
+        kwargs={"scale": 2},
+    ),
     path("captcha/", include("captcha.urls")),
     path(
         "accounts/login/",
         auth_views.LoginView.as_view(
             template_name="registration/login_tsx.html",
+            authentication_form=CustomAuthenticationForm,
         ),
         name="login",
     ),
@@ -47,6 +65,11 @@ urlpatterns = [
         users_views.confirm_email,
         name="confirm_email",
     ),
+    path(
+        "accounts/confirm-email/s/<str:token>/",
+        users_views.confirm_email_signed,
+        name="confirm_email_signed",
+    ),
     path(
         "accounts/resend-confirmation/",
         users_views.resend_confirmation,
@@ -120,3 +143,7 @@ urlpatterns = [
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    if settings.MAP_TILES_URL.startswith("/"):
+        urlpatterns += static(
+            settings.MAP_TILES_URL, document_root=settings.MAP_TILES_ROOT
+        )
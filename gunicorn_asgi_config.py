@@ -0,0 +1,9 @@
+# Gunicorn configuration for the ASGI mode (uvicorn workers)
+#
+# A sync worker is held by a slow client for the whole request; uvicorn
+# workers serve many connections from one event loop, so slow mobile
+# clients and slow Yandex API calls don't block the read endpoints.
+from gunicorn_config import *  # noqa: F401,F403
+
+wsgi_app = "good_deed_map.asgi:application"
+worker_class = "uvicorn_worker.UvicornWorker"
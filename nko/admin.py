@@ -1,14 +1,31 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from django import forms
+from django.db.models import Count, Max, Min
+from django.http import HttpResponseRedirect
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
 
 # from unfold.admin import ModelAdmin
-from .models import Region, City, Category, NKO, NKOVersion
-from .email_utils import (
-    send_application_decision_notification,
-    send_transfer_notification_to_new_owner,
+from .models import (
+    Region,
+    City,
+    Category,
+    NKO,
+    NKOVersion,
+    NKOVersionArchive,
+    ModerationJob,
+    SNAPSHOT_FIELDS,
 )
+from .admin_utils import EstimatedCountPaginator, InputFilter
+from .db import serialized_write
+from . import cache as nko_cache, jobs, moderation, moderation_queue, tiles
+
+# Сколько отдельных сообщений по элементам показывать после массового действия
+MAX_ITEM_MESSAGES = 20
 
 
 class ColorPickerWidget(forms.TextInput):
@@ -55,6 +72,72 @@ class CategoryAdminForm(forms.ModelForm):
         }
 
 
+def enqueue_job(model_admin, request, kind, object_ids, params=None):
+    """Поставить массовое действие в очередь фоновых задач и перейти к её статусу"""
+    job = jobs.enqueue(kind, object_ids, user=request.user, params=params)
+    url = reverse("admin:nko_moderationjob_change", args=[job.pk])
+    model_admin.message_user(
+        request,
+        format_html(
+            'Выбрано {} объектов — действие выполняется в фоне: <a href="{}">{}</a>',
+            len(job.object_ids),
+            url,
+            job,
+        ),
+    )
+    return HttpResponseRedirect(url)
+
+
+class CityNameFilter(InputFilter):
+    """Фильтр по началу названия города вместо списка всех городов"""
+
+    title = "город"
+    parameter_name = "city_name"
+    lookup = "city__name__istartswith"
+
+
+class LeaseFilter(admin.SimpleListFilter):
+    """Фильтр версий по аренде в очереди модерации"""
+
+    title = "очередь модерации"
+    parameter_name = "lease"
+
+    def lookups(self, request, model_admin):
+        return (
+            ("mine", "Взятые мной"),
+            ("free", "Свободные"),
+            ("others", "У других модераторов"),
+        )
+
+    def queryset(self, request, queryset):
+        now = timezone.now()
+        if self.value() == "mine":
+            return queryset.filter(
+                lease__moderator=request.user, lease__expires_at__gt=now
+            )
+        if self.value() == "free":
+            return queryset.filter(is_approved=False, is_rejected=False).exclude(
+                lease__expires_at__gt=now
+            )
+        if self.value() == "others":
+            return queryset.filter(lease__expires_at__gt=now).exclude(
+                lease__moderator=request.user
+            )
+        return queryset
+
+
+def exclude_leased_by_others(model_admin, request, version_ids):
+    """Убрать из выборки версии, которые рассматривают другие модераторы"""
+    busy = moderation_queue.leased_by_others(version_ids, request.user)
+    if busy:
+        model_admin.message_user(
+            request,
+            f"Пропущено версий, взятых в работу другими модераторами: {len(busy)}",
+            level="warning",
+        )
+    return [pk for pk in version_ids if int(pk) not in busy]
+
+
 class RejectVersionForm(forms.Form):
     """Форма для указания причины отказа"""
 
@@ -77,7 +160,9 @@ class RegionAdmin(admin.ModelAdmin):
 class CityAdmin(admin.ModelAdmin):
     list_display = ["name", "region"]
     list_filter = ["region"]
+    list_select_related = ["region"]
     search_fields = ["name", "region__name"]
+    ordering = ["name"]
 
 
 @admin.register(Category)
@@ -111,16 +196,23 @@ class NKOAdmin(admin.ModelAdmin):
     list_filter = [
         "is_approved",
         "has_pending_changes",
-        "categories",
-        "city",
+        ("categories", admin.RelatedOnlyFieldListFilter),
+        CityNameFilter,
         "created_at",
     ]
     search_fields = ["name", "description"]
     list_editable = ["is_approved"]
     filter_horizontal = ["categories"]
+    autocomplete_fields = ["city", "owner"]
+    list_select_related = ["city__region", "owner"]
     list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     actions = ["approve_nko", "disapprove_nko", "reject_nko_action"]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("categories")
+
     def get_categories(self, obj):
         return ", ".join([c.name for c in obj.categories.all()])
 
@@ -128,44 +220,113 @@ class NKOAdmin(admin.ModelAdmin):
 
     def approve_nko(self, request, queryset):
         """Одобрить выбранные НКО"""
-        count_success = 0
-        count_error = 0
+        # Число запросов не зависит от размера выборки: выборка, два
+        # агрегирующих запроса для конфликтов и один update()
+        selected = NKO.objects.filter(pk__in=queryset.values("pk"))
+
+        def approve():
+            rows = list(
+                selected.values(
+                    "pk",
+                    "name",
+                    "owner_id",
+                    "owner__username",
+                    "owner__first_name",
+                    "owner__last_name",
+                )
+            )
+            selected_owners = selected.values("owner_id")
+
+            # Владельцы, у которых больше одного НКО (в том числе внутри выборки)
+            other_owners = (
+                NKO.objects.filter(owner_id__in=selected_owners)
+                .values("owner_id")
+                .annotate(count=Count("pk"), first_pk=Min("pk"), last_pk=Max("pk"))
+                .filter(count__gt=1)
+            )
+            owned = {
+                row["owner_id"]: (row["first_pk"], row["last_pk"])
+                for row in other_owners
+            }
+
+            # Ожидающие заявки на передачу прав владельцам из выборки
+            transfers = (
+                NKOVersion.objects.filter(
+                    new_owner_id__in=selected_owners,
+                    is_approved=False,
+                    is_rejected=False,
+                )
+                .values("new_owner_id")
+                .annotate(nko_name=Min("nko__name"))
+            )
+            pending_transfers = {
+                row["new_owner_id"]: row["nko_name"] for row in transfers
+            }
+
+            count = (
+                selected.exclude(owner_id__in=other_owners.values("owner_id"))
+                .exclude(owner_id__in=transfers.values("new_owner_id"))
+                .update(is_approved=True, updated_at=timezone.now())
+            )
+            return rows, owned, pending_transfers, count
+
+        rows, owned, pending_transfers, count_success = serialized_write(approve)
+
+        errors = []
+        approved_owner_ids = []
+        approved_ids = []
+        for row in rows:
+            owner_id = row["owner_id"]
+            if owner_id in owned:
+                first_pk, last_pk = owned[owner_id]
+                other_pk = last_pk if first_pk == row["pk"] else first_pk
+                errors.append((row, "owned", other_pk))
+            elif owner_id in pending_transfers:
+                errors.append((row, "transfer", pending_transfers[owner_id]))
+            else:
+                approved_owner_ids.append(owner_id)
+                approved_ids.append(row["pk"])
 
-        for nko in queryset:
-            # Проверяем, нет ли у владельца уже другого НКО
-            existing_nko = (
-                NKO.objects.filter(owner=nko.owner).exclude(pk=nko.pk).first()
+        if count_success > 0:
+            nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG)
+            nko_cache.invalidate_user_nko(*approved_owner_ids)
+            tiles.schedule(approved_ids)
+
+        # Подробно сообщаем только о первых ошибках
+        shown = errors[:MAX_ITEM_MESSAGES]
+        existing_names = dict(
+            NKO.objects.filter(
+                pk__in=[value for _, kind, value in shown if kind == "owned"]
+            ).values_list("pk", "name")
+        )
+        for row, kind, value in shown:
+            owner = (
+                f"{row['owner__first_name']} {row['owner__last_name']}".strip()
+                or row["owner__username"]
             )
-            if existing_nko:
+            if kind == "owned":
                 self.message_user(
                     request,
-                    f"Невозможно одобрить НКО '{nko.name}': пользователь {nko.owner.get_full_name() or nko.owner.username} "
-                    f"уже владеет НКО '{existing_nko.name}'",
+                    f"Невозможно одобрить НКО '{row['name']}': пользователь {owner} "
+                    f"уже владеет НКО '{existing_names.get(value, value)}'",
                     level="error",
                 )
-                count_error += 1
-                continue
-
-            # Проверяем, нет ли ожидающих заявок на передачу прав этому пользователю
-            pending_transfer = NKOVersion.objects.filter(
-                new_owner=nko.owner, is_approved=False, is_rejected=False
-            ).first()
-
-            if pending_transfer:
+            else:
                 self.message_user(
                     request,
-                    f"Внимание: У пользователя {nko.owner.get_full_name() or nko.owner.username} есть ожидающая заявка "
-                    f"на передачу прав на НКО '{pending_transfer.nko.name}'. "
+                    f"Внимание: У пользователя {owner} есть ожидающая заявка "
+                    f"на передачу прав на НКО '{value}'. "
                     f"Одобрите или отклоните её перед одобрением нового НКО.",
                     level="warning",
                 )
-                count_error += 1
-                continue
-
-            nko.is_approved = True
-            nko.save()
-            count_success += 1
+        if len(errors) > MAX_ITEM_MESSAGES:
+            self.message_user(
+                request,
+                f"…и ещё {len(errors) - MAX_ITEM_MESSAGES} сообщений",
+                level="warning",
+            )
 
+        count_error = len(errors)
         if count_success > 0:
             self.message_user(request, f"Одобрено НКО: {count_success}")
         if count_error > 0:
@@ -177,7 +338,11 @@ class NKOAdmin(admin.ModelAdmin):
 
     def disapprove_nko(self, request, queryset):
         """Снять одобрение с выбранных НКО (не удаляет)"""
-        count = queryset.update(is_approved=False)
+        rows = list(queryset.values_list("pk", "owner_id"))
+        count = serialized_write(queryset.update, is_approved=False)
+        nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG)
+        nko_cache.invalidate_user_nko(*(owner_id for _, owner_id in rows))
+        tiles.schedule(pk for pk, _ in rows)
         self.message_user(request, f"Снято одобрение с НКО: {count}")
 
     disapprove_nko.short_description = "⏸ Снять одобрение с выбранных НКО"
@@ -211,15 +376,17 @@ class NKOAdmin(admin.ModelAdmin):
                     changelist_url = reverse("admin:nko_nko_changelist")
                     return HttpResponseRedirect(changelist_url)
 
-                # Получаем заново queryset по ID
-                nko_to_delete = NKO.objects.filter(
-                    id__in=selected_ids, is_approved=False
-                )
-                count = nko_to_delete.count()
+                if jobs.should_enqueue(len(selected_ids)):
+                    return enqueue_job(
+                        self,
+                        request,
+                        ModerationJob.KIND_REJECT_NKO,
+                        [int(pk) for pk in selected_ids],
+                    )
 
                 # Можно отправить уведомление владельцам НКО о причине отказа
                 # Пока просто удаляем
-                nko_to_delete.delete()
+                count = moderation.reject_nkos(selected_ids)
 
                 self.message_user(request, f"Отклонено и удалено НКО: {count}")
                 changelist_url = reverse("admin:nko_nko_changelist")
@@ -266,8 +433,15 @@ class NKOVersionAdmin(admin.ModelAdmin):
         "is_current",
         "created_at",
         "change_description_preview",
+        "lease_display",
+    ]
+    list_filter = [
+        LeaseFilter,
+        "is_approved",
+        "is_rejected",
+        "is_current",
+        "created_at",
     ]
-    list_filter = ["is_approved", "is_rejected", "is_current", "created_at"]
     search_fields = [
         "nko__name",
         "created_by__username",
@@ -275,8 +449,13 @@ class NKOVersionAdmin(admin.ModelAdmin):
         "city_name",
         "region_name",
     ]
+    autocomplete_fields = ["nko", "created_by", "new_owner"]
+    list_select_related = ["nko__city", "created_by", "new_owner", "lease__moderator"]
     list_per_page = 20
-    actions = ["approve_versions", "reject_versions_action"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ["approve_versions", "reject_versions_action", "release_versions"]
+    change_list_template = "admin/nko/nkoversion/change_list.html"
     filter_horizontal = ["categories"]
     readonly_fields = ["rejection_reason_display"]
 
@@ -328,48 +507,80 @@ class NKOVersionAdmin(admin.ModelAdmin):
 
     change_description_preview.short_description = "Описание изменений"
 
-    def approve_versions(self, request, queryset):
-        """Одобрить и применить выбранные версии"""
-        count_success = 0
-        count_error = 0
+    def lease_display(self, obj):
+        """Кто из модераторов рассматривает версию"""
+        lease = getattr(obj, "lease", None)
+        if lease is None or lease.expires_at <= timezone.now():
+            return "—"
+        return f"{lease.moderator} до {timezone.localtime(lease.expires_at):%H:%M}"
+
+    lease_display.short_description = "В работе"
+
+    def get_urls(self):
+        return [
+            path(
+                "claim/",
+                self.admin_site.admin_view(self.claim_view),
+                name="nko_nkoversion_claim",
+            ),
+        ] + super().get_urls()
 
-        for version in queryset:
-            if version.is_rejected:
-                self.message_user(
-                    request,
-                    f"Версия {version} уже была отклонена и не может быть одобрена",
-                    level="warning",
-                )
-                continue
+    @method_decorator(require_POST)
+    def claim_view(self, request):
+        """Взять в работу пакет свободных версий из очереди (только POST)"""
+        versions = moderation_queue.claim(request.user)
+        if versions:
+            self.message_user(
+                request,
+                f"В работе заявок: {len(versions)}. Аренда действует "
+                f"{int(moderation_queue.LEASE_DURATION.total_seconds() // 60)} минут.",
+            )
+        else:
+            self.message_user(request, "Свободных заявок нет", level="warning")
+        return HttpResponseRedirect(
+            reverse("admin:nko_nkoversion_changelist") + "?lease=mine"
+        )
+
+    def release_versions(self, request, queryset):
+        """Вернуть выбранные версии в очередь"""
+        count = moderation_queue.release(
+            request.user, queryset.values_list("pk", flat=True)
+        )
+        self.message_user(request, f"Возвращено в очередь: {count}")
 
-            version.is_approved = True
-            version.is_rejected = False
-            version.rejection_reason = ""
-            version.save()
+    release_versions.short_description = "↩ Вернуть в очередь модерации"
 
-            try:
-                if version.apply_changes():
-                    count_success += 1
+    def approve_versions(self, request, queryset):
+        """Одобрить и применить выбранные версии (одним пакетом)"""
+        version_ids = exclude_leased_by_others(
+            self, request, list(queryset.values_list("pk", flat=True))
+        )
+        if jobs.should_enqueue(len(version_ids)):
+            return enqueue_job(
+                self, request, ModerationJob.KIND_APPROVE_VERSIONS, version_ids
+            )
 
-                    # Отправляем уведомление автору заявки об одобрении
-                    send_application_decision_notification(version, approved=True)
+        report = moderation.approve_versions(version_ids)
 
-                    # Если это передача прав, отправляем уведомление новому владельцу
-                    if version.new_owner:
-                        send_transfer_notification_to_new_owner(version)
-                else:
-                    count_error += 1
-            except ValueError as e:
-                # Откатываем одобрение если возникла ошибка
-                version.is_approved = False
-                version.save()
+        problems = report.skipped + report.failed
+        for result in problems[:MAX_ITEM_MESSAGES]:
+            if result.status == moderation.SKIPPED:
+                self.message_user(request, result.message, level="warning")
+            else:
                 self.message_user(
                     request,
-                    f"Ошибка при одобрении версии {version}: {str(e)}",
+                    f"Ошибка при одобрении версии {result.version}: {result.message}",
                     level="error",
                 )
-                count_error += 1
+        if len(problems) > MAX_ITEM_MESSAGES:
+            self.message_user(
+                request,
+                f"…и ещё {len(problems) - MAX_ITEM_MESSAGES} сообщений",
+                level="warning",
+            )
 
+        count_success = len(report.done)
+        count_error = len(report.failed)
         if count_success > 0:
             self.message_user(request, f"Успешно одобрено и применено: {count_success}")
         if count_error > 0:
@@ -384,7 +595,6 @@ class NKOVersionAdmin(admin.ModelAdmin):
         from django.shortcuts import render
         from django.http import HttpResponseRedirect
         from django.urls import reverse
-        from django.db import transaction
 
         # Проверяем, была ли отправлена форма с причиной отказа
         if request.POST.get("post") == "yes":
@@ -418,42 +628,29 @@ class NKOVersionAdmin(admin.ModelAdmin):
                     changelist_url = reverse("admin:nko_nkoversion_changelist")
                     return HttpResponseRedirect(changelist_url)
 
-                count = 0
-                errors = []
-
-                # Получаем заново queryset по ID
-                versions_to_reject = NKOVersion.objects.filter(id__in=selected_ids)
-
-                # Используем транзакцию для атомарности операции
-                with transaction.atomic():
-                    for version in versions_to_reject:
-                        if version.is_approved:
-                            self.message_user(
-                                request,
-                                f"Версия {version} уже была одобрена и не может быть отклонена",
-                                level="warning",
-                            )
-                            continue
-
-                        try:
-                            if version.reject_changes(reason):
-                                count += 1
-
-                                # Отправляем уведомление автору заявки об отклонении
-                                send_application_decision_notification(
-                                    version, approved=False
-                                )
-                            else:
-                                errors.append(f"Не удалось отклонить {version}")
-                        except Exception as e:
-                            errors.append(f"Ошибка при отклонении {version}: {str(e)}")
+                selected_ids = exclude_leased_by_others(self, request, selected_ids)
+                if jobs.should_enqueue(len(selected_ids)):
+                    return enqueue_job(
+                        self,
+                        request,
+                        ModerationJob.KIND_REJECT_VERSIONS,
+                        [int(pk) for pk in selected_ids],
+                        params={"reason": reason},
+                    )
+
+                # Все отклонения — одна транзакция через очередь записи,
+                # уведомления отправляются после её фиксации
+                report = moderation.reject_versions(selected_ids, reason)
+
+                for result in report.skipped[:MAX_ITEM_MESSAGES]:
+                    self.message_user(request, result.message, level="warning")
 
+                count = len(report.done)
                 if count > 0:
                     self.message_user(request, f"Отклонено заявок: {count}")
 
-                if errors:
-                    for error in errors:
-                        self.message_user(request, error, level="error")
+                for result in report.failed[:MAX_ITEM_MESSAGES]:
+                    self.message_user(request, result.message, level="error")
 
                 # Редирект на список версий
                 changelist_url = reverse("admin:nko_nkoversion_changelist")
@@ -475,6 +672,33 @@ class NKOVersionAdmin(admin.ModelAdmin):
 
     reject_versions_action.short_description = "✗ Отклонить выбранные версии"
 
+    def get_form(self, request, obj=None, **kwargs):
+        form_class = super().get_form(request, obj, **kwargs)
+        user = request.user
+
+        class LeaseCheckedForm(form_class):
+            def clean(self):
+                # Решение по версии, взятой в работу другим модератором,
+                # не принимается — как и в массовых действиях
+                cleaned_data = super().clean()
+                deciding = any(
+                    cleaned_data.get(field) and not self.initial.get(field)
+                    for field in ("is_approved", "is_rejected")
+                )
+                if (
+                    deciding
+                    and self.instance.pk
+                    and moderation_queue.leased_by_others([self.instance.pk], user)
+                ):
+                    raise forms.ValidationError(
+                        "Версию рассматривает другой модератор. Решение можно "
+                        "принять после того, как он вернёт её в очередь или "
+                        "истечёт аренда."
+                    )
+                return cleaned_data
+
+        return form_class if obj is None else LeaseCheckedForm
+
     def save_model(self, request, obj, form, change):
         """Обработка сохранения модели в админке"""
         prev = None
@@ -492,6 +716,7 @@ class NKOVersionAdmin(admin.ModelAdmin):
             obj.rejection_reason = ""
             try:
                 if obj.apply_changes():
+                    moderation_queue.release(request.user, [obj.pk])
                     self.message_user(request, f"Версия {obj} одобрена и применена")
                 else:
                     self.message_user(
@@ -525,6 +750,7 @@ class NKOVersionAdmin(admin.ModelAdmin):
                 nko.has_pending_changes = False
                 nko.save()
 
+            moderation_queue.release(request.user, [obj.pk])
             self.message_user(request, f"Версия {obj} отклонена")
 
     def get_fieldsets(self, request, obj=None):
@@ -559,6 +785,7 @@ class NKOVersionAdmin(admin.ModelAdmin):
                         "address",
                         "latitude",
                         "longitude",
+                        "logo",
                     )
                 },
             ),
@@ -579,7 +806,123 @@ class NKOVersionAdmin(admin.ModelAdmin):
     def get_readonly_fields(self, request, obj=None):
         """Поля только для чтения"""
         readonly = ["created_at", "created_by", "nko"]
-        # Если версия одобрена, блокируем изменение статуса отклонения
+        # Если версия одобрена, блокируем изменение статуса отклонения и
+        # данных: одобренные версии служат опорными для компактных снимков
         if obj and obj.is_approved:
-            readonly.extend(["is_rejected", "rejection_reason"])
+            readonly.extend(["is_rejected", "rejection_reason", *SNAPSHOT_FIELDS])
         return readonly
+
+
+@admin.register(ModerationJob)
+class ModerationJobAdmin(admin.ModelAdmin):
+    """Статус и прогресс фоновых задач модерации"""
+
+    list_display = [
+        "__str__",
+        "status",
+        "progress_display",
+        "succeeded",
+        "skipped",
+        "failed",
+        "created_by",
+        "created_at",
+        "finished_at",
+    ]
+    list_filter = ["status", "kind"]
+    list_select_related = ["created_by"]
+    list_per_page = 20
+    actions = ["retry_jobs"]
+    # Страница задачи сама обновляется, пока задача не завершена
+    change_form_template = "admin/nko/moderationjob/change_form.html"
+    fields = [
+        "kind",
+        "status",
+        "progress_display",
+        "succeeded",
+        "skipped",
+        "failed",
+        "messages_display",
+        "error",
+        "params",
+        "created_by",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "worker",
+        "heartbeat_at",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress_display(self, obj):
+        return format_html(
+            '<progress value="{}" max="{}" style="width: 150px;"></progress> {} / {}',
+            obj.cursor,
+            obj.total,
+            obj.cursor,
+            obj.total,
+        )
+
+    progress_display.short_description = "Прогресс"
+
+    def messages_display(self, obj):
+        if not obj.messages:
+            return "—"
+        return format_html(
+            "<ul>{}</ul>",
+            format_html_join("", "<li>{}</li>", ((m,) for m in obj.messages)),
+        )
+
+    messages_display.short_description = "Сообщения"
+
+    def retry_jobs(self, request, queryset):
+        """Перезапустить упавшие задачи с контрольной точки"""
+        count = jobs.retry(queryset)
+        self.message_user(request, f"Возвращено в очередь задач: {count}")
+
+    retry_jobs.short_description = "↻ Перезапустить упавшие задачи"
+
+
+@admin.register(NKOVersionArchive)
+class NKOVersionArchiveAdmin(admin.ModelAdmin):
+    """Просмотр архивных версий (python manage.py archive_versions)"""
+
+    list_display = ["original_id", "nko", "created_at", "is_approved", "is_rejected"]
+    list_filter = ["is_approved", "is_rejected"]
+    list_select_related = ["nko"]
+    search_fields = ["=original_id", "nko__name"]
+    autocomplete_fields = ["nko"]
+    list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    fields = [
+        "original_id",
+        "nko",
+        "created_at",
+        "is_approved",
+        "is_rejected",
+        "archived_at",
+        "snapshot_display",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def snapshot_display(self, obj):
+        import json
+
+        return format_html(
+            '<pre style="white-space: pre-wrap;">{}</pre>',
+            json.dumps(obj.snapshot, ensure_ascii=False, indent=2),
+        )
+
+    snapshot_display.short_description = "Снимок версии"
@@ -0,0 +1,82 @@
+"""
+Вспомогательные классы для админки на больших таблицах
+"""
+
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Ниже этого порога оценка не используется — точный COUNT(*) дешёвый
+ESTIMATE_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор с приблизительным числом строк для больших таблиц.
+
+    На PostgreSQL для списка без фильтров число строк берётся из статистики
+    планировщика (pg_class.reltuples) вместо COUNT(*) по всей таблице. Для
+    отфильтрованных выборок и остальных СУБД считается точно.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate()
+        if estimate is not None and estimate > ESTIMATE_THRESHOLD:
+            return estimate
+        return super().count
+
+    def _estimate(self):
+        queryset = self.object_list
+        query = getattr(queryset, "query", None)
+        if query is None or query.where or query.is_sliced:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] > 0 else None
+
+
+class InputFilter(admin.SimpleListFilter):
+    """
+    Фильтр с текстовым полем вместо списка всех значений.
+
+    Подклассы задают parameter_name, title и lookup (например,
+    "city__name__istartswith").
+    """
+
+    template = "admin/input_filter.html"
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        # Ссылка «Все» и скрытые поля с остальными параметрами запроса
+        params = {
+            key: value
+            for key, value in changelist.params.items()
+            if key != self.parameter_name
+        }
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": "Все",
+            "params": params,
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            return queryset.filter(**{self.lookup: value.strip()})
+        return queryset
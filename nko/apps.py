@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class NkoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'nko'
+
+    def ready(self):
+        from good_deed_map import metrics
+
+        from . import checks  # noqa: F401
+        from .moderation_queue import pending_metrics
+
+        metrics.register_collector(pending_metrics)
@@ -0,0 +1,142 @@
+"""
+Архив истории версий НКО
+
+Старые рассмотренные версии переносятся из NKOVersion в NKOVersionArchive
+(полный снимок в виде сжатого JSON) и, по желанию, дописываются в файл
+JSONL.gz. В основной таблице остаются текущие версии, ожидающие модерации,
+опорные версии компактных снимков и недавняя история.
+"""
+
+import gzip
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .db import serialized_write
+from .models import SNAPSHOT_FIELDS, NKOVersion, NKOVersionArchive
+
+# Поля версии, которые сохраняются в архиве помимо снимка
+META_FIELDS = [
+    "id",
+    "nko_id",
+    "city_name",
+    "region_name",
+    "new_owner_id",
+    "created_by_id",
+    "created_at",
+    "is_approved",
+    "is_rejected",
+    "rejection_reason",
+    "is_current",
+    "change_description",
+]
+
+
+def _history():
+    """Рассмотренные (одобренные или отклонённые) не текущие версии"""
+    return NKOVersion.objects.filter(is_current=False).exclude(
+        is_approved=False, is_rejected=False
+    )
+
+
+def archivable_versions(cutoff, keep_recent):
+    """
+    Версии, которые можно перенести в архив.
+
+    Рассмотренные, не текущие, созданные раньше cutoff и не служащие
+    опорными для других версий; keep_recent самых новых рассмотренных версий
+    каждого НКО остаются в основной таблице независимо от возраста.
+    """
+    newer = (
+        _history()
+        .filter(nko_id=OuterRef("nko_id"), created_at__gt=OuterRef("created_at"))
+        .order_by()
+        .values("nko_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return (
+        _history()
+        .filter(created_at__lt=cutoff)
+        .exclude(Exists(NKOVersion.objects.filter(parent=OuterRef("pk"))))
+        .annotate(newer_count=Coalesce(Subquery(newer), 0))
+        .filter(newer_count__gte=keep_recent)
+    )
+
+
+def serialize(version):
+    """Полный снимок версии в виде словаря"""
+    data = {name: getattr(version, name) for name in META_FIELDS + SNAPSHOT_FIELDS}
+    data["logo"] = version.logo.name
+    data["categories"] = [category.pk for category in version.categories.all()]
+    return data
+
+
+def _pack(data):
+    return zlib.compress(
+        json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    )
+
+
+def archive_batch(version_ids, export=None):
+    """
+    Перенести версии в архив одной транзакцией; возвращает число версий.
+
+    Args:
+        version_ids: id версий (отбираются заранее через archivable_versions)
+        export: открытый на дозапись текстовый файл JSONL (например, gzip.open)
+    """
+
+    def run():
+        # Повторная проверка внутри транзакции: версия могла стать текущей
+        # или опорной после отбора
+        versions = list(
+            NKOVersion.objects.filter(pk__in=version_ids, is_current=False)
+            .exclude(Exists(NKOVersion.objects.filter(parent=OuterRef("pk"))))
+            .select_related("parent")
+            .prefetch_related("categories")
+        )
+        snapshots = [serialize(version) for version in versions]
+        NKOVersionArchive.objects.bulk_create(
+            [
+                NKOVersionArchive(
+                    original_id=version.pk,
+                    nko_id=version.nko_id,
+                    created_at=version.created_at,
+                    is_approved=version.is_approved,
+                    is_rejected=version.is_rejected,
+                    data=_pack(snapshot),
+                )
+                for version, snapshot in zip(versions, snapshots)
+            ]
+        )
+        NKOVersion.objects.filter(pk__in=[version.pk for version in versions]).delete()
+        return snapshots
+
+    snapshots = serialized_write(run)
+    if export is not None:
+        for snapshot in snapshots:
+            export.write(
+                json.dumps(snapshot, cls=DjangoJSONEncoder, ensure_ascii=False)
+            )
+            export.write("\n")
+    return len(snapshots)
+
+
+def open_export(path):
+    """Открыть файл JSONL.gz на дозапись (каждый запуск — отдельный gzip-поток)"""
+    return gzip.open(path, "at", encoding="utf-8")
+
+
+def get_archived(version_id):
+    """Снимок архивной версии по её исходному id или None"""
+    archived = NKOVersionArchive.objects.filter(original_id=version_id).first()
+    return archived.snapshot if archived else None
+
+
+def history(nko):
+    """Архивные снимки версий НКО, новые сверху"""
+    return [archived.snapshot for archived in nko.archived_versions.all()]
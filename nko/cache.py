@@ -0,0 +1,205 @@
+"""
+Кэш приложения поверх django.core.cache
+
+- версионированные ключи: KEY_VERSION меняется при смене формата данных;
+- инвалидация по тегам: запись хранит версии своих тегов, invalidate_tags()
+  меняет версию тега, и все записи с этим тегом перестают считаться валидными;
+- защита от эффекта толпы (stampede): пересчёт выполняет только владелец
+  блокировки, а незадолго до истечения срока запись обновляется заранее,
+  пока остальные получают ещё действующее значение.
+
+Блокировка и создание версий тегов опираются на cache.add(). В Redis и
+Memcached он атомарен; в файловом кэше (по умолчанию без REDIS_URL) это
+проверка и запись, поэтому между процессами блокировка лишь снижает число
+одновременных пересчётов, а не исключает их. Для нескольких воркеров нужен
+Redis (проверка nko.W001 при manage.py check --deploy).
+"""
+
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from good_deed_map import metrics
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "nko"
+KEY_VERSION = 1
+
+# Теги, которые используются в приложении
+CATALOGUE_TAG = "catalogue"  # НКО, города, регионы
+CATEGORIES_TAG = "categories"
+
+DEFAULT_TIMEOUT = 300  # секунды
+USER_NKO_TIMEOUT = 60
+# Доля срока жизни, в течение которой запись обновляется заранее
+EARLY_REFRESH_RATIO = 0.2
+LOCK_TIMEOUT = 30
+# Сколько ждать чужой пересчёт, прежде чем посчитать самостоятельно
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+# Доля попаданий: hit / (hit + miss) по имени записи (часть name ключа)
+CACHE_LOOKUPS = metrics.Counter(
+    "gdm_cache_lookups_total", "Application cache lookups", ["name", "result"]
+)
+
+
+# Бэкенды, в которых cache.add() и cache.incr() атомарны между процессами
+ATOMIC_BACKENDS = (
+    "django.core.cache.backends.redis.RedisCache",
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+)
+
+
+def is_atomic():
+    """Атомарны ли add()/incr() общего кэша между процессами"""
+    return settings.CACHES["default"]["BACKEND"] in ATOMIC_BACKENDS
+
+
+def make_key(name, *parts):
+    """Собрать ключ кэша: nko:v<версия>:<name>:<part>..."""
+    return ":".join([KEY_PREFIX, f"v{KEY_VERSION}", name, *map(str, parts)])
+
+
+def _count_lookup(key, hit):
+    parts = key.split(":")
+    name = parts[2] if len(parts) > 2 and parts[0] == KEY_PREFIX else key
+    CACHE_LOOKUPS.inc(name=name, result="hit" if hit else "miss")
+
+
+def _tag_key(tag):
+    return make_key("tag", tag)
+
+
+def get_tag_versions(tags):
+    """Текущие версии тегов; отсутствующие теги получают новую версию"""
+    if not tags:
+        return {}
+    keys = {_tag_key(tag): tag for tag in tags}
+    stored = cache.get_many(list(keys))
+    missing = {key: uuid.uuid4().hex for key in keys if key not in stored}
+    if missing:
+        # Версию создаёт только первый процесс; остальные читают записанную,
+        # иначе записи под «проигравшей» версией никогда не находились бы
+        for key, version in missing.items():
+            cache.add(key, version, timeout=None)
+        missing.update(cache.get_many(list(missing)))
+        stored.update(missing)
+    return {keys[key]: version for key, version in stored.items()}
+
+
+def invalidate_tags(*tags):
+    """Сделать невалидными все записи, помеченные любым из тегов"""
+    cache.set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, timeout=None)
+
+
+def _acquire_lock(key):
+    return cache.add(f"{key}:lock", 1, timeout=LOCK_TIMEOUT)
+
+
+def _release_lock(key):
+    cache.delete(f"{key}:lock")
+
+
+def _store(key, compute, timeout, tag_versions):
+    value = compute()
+    cache.set(key, (value, time.time() + timeout, tag_versions), timeout=timeout)
+    return value
+
+
+def _read(key, tag_versions):
+    """Вернуть (value, expires_at) валидной записи или None"""
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    value, expires_at, entry_tags = entry
+    if entry_tags != tag_versions:
+        return None
+    return value, expires_at
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, tags=()):
+    """
+    Получить значение по ключу или вычислить его через compute().
+
+    Args:
+        key: ключ (см. make_key)
+        compute: функция без аргументов, возвращающая сериализуемое значение
+        timeout: срок жизни записи в секундах
+        tags: теги для инвалидации через invalidate_tags()
+    """
+    tag_versions = get_tag_versions(tags)
+    entry = _read(key, tag_versions)
+    _count_lookup(key, entry is not None)
+
+    if entry is not None:
+        value, expires_at = entry
+        if expires_at - time.time() > timeout * EARLY_REFRESH_RATIO:
+            return value
+        # Запись скоро истечёт: обновляет только тот, кто взял блокировку
+        if not _acquire_lock(key):
+            return value
+        try:
+            return _store(key, compute, timeout, tag_versions)
+        finally:
+            _release_lock(key)
+
+    if _acquire_lock(key):
+        try:
+            return _store(key, compute, timeout, tag_versions)
+        finally:
+            _release_lock(key)
+
+    # Кто-то уже пересчитывает значение — ждём его результат
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = _read(key, tag_versions)
+        if entry is not None:
+            return entry[0]
+
+    logger.warning("Cache lock wait timed out for %s, computing without lock", key)
+    return _store(key, compute, timeout, tag_versions)
+
+
+_MISSING = object()
+
+
+def _user_nko_key(user_id):
+    return make_key("user_nko", user_id)
+
+
+def get_user_nko(request):
+    """
+    НКО текущего пользователя или None.
+
+    Результат запоминается на время запроса и хранится в кэше
+    USER_NKO_TIMEOUT секунд; сбрасывается через invalidate_user_nko().
+    """
+    if hasattr(request, "_user_nko"):
+        return request._user_nko
+
+    user = getattr(request, "user", None)
+    nko = None
+    if user is not None and user.is_authenticated:
+        key = _user_nko_key(user.pk)
+        nko = cache.get(key, _MISSING)
+        _count_lookup(key, nko is not _MISSING)
+        if nko is _MISSING:
+            from .models import NKO
+
+            nko = NKO.objects.filter(owner=user).first()
+            cache.set(key, nko, timeout=USER_NKO_TIMEOUT)
+
+    request._user_nko = nko
+    return nko
+
+
+def invalidate_user_nko(*user_ids):
+    """Сбросить закэшированное НКО пользователей (создание, удаление, передача прав)"""
+    cache.delete_many([_user_nko_key(user_id) for user_id in user_ids if user_id])
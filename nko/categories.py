@@ -0,0 +1,73 @@
+"""
+Реестр категорий в памяти процесса
+
+Категорий немного и они почти не меняются, поэтому каждый воркер держит их
+список у себя: со слагами и в порядке отображения («Другое» — последней).
+Актуальность проверяется по версии тега CATEGORIES_TAG в общем кэше, которую
+меняют сигналы сохранения/удаления Category (в том числе из CategoryAdmin),
+так что изменения доходят до всех воркеров.
+"""
+
+import threading
+
+from django.utils.text import slugify
+
+from . import cache as nko_cache
+
+OTHER_CATEGORY_NAME = "другое"
+
+
+def _sort_key(category):
+    return (category.name.strip().lower() == OTHER_CATEGORY_NAME, category.name)
+
+
+class CategoryRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._categories = []
+        self._by_pk = {}
+
+    def _ensure_fresh(self):
+        version = nko_cache.get_tag_versions((nko_cache.CATEGORIES_TAG,))[
+            nko_cache.CATEGORIES_TAG
+        ]
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            from .models import Category
+
+            categories = sorted(Category.objects.all(), key=_sort_key)
+            for category in categories:
+                category.slug = slugify(category.name, allow_unicode=True)
+            self._categories = categories
+            self._by_pk = {category.pk: category for category in categories}
+            self._version = version
+
+    def all(self):
+        """Все категории в порядке отображения; у каждой есть атрибут slug"""
+        self._ensure_fresh()
+        return self._categories
+
+    def get(self, pk):
+        """Категория по id или None"""
+        self._ensure_fresh()
+        return self._by_pk.get(pk)
+
+    @staticmethod
+    def as_dict(category):
+        return {
+            "id": category.id,
+            "name": category.name,
+            "slug": category.slug,
+            "icon": category.icon,
+            "color": category.color,
+        }
+
+    def as_dicts(self):
+        return [self.as_dict(category) for category in self.all()]
+
+
+category_registry = CategoryRegistry()
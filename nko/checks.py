@@ -0,0 +1,20 @@
+from django.core import checks
+
+from . import cache as nko_cache
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_atomic_cache(app_configs, **kwargs):
+    """Блокировки кэша и счётчики входа требуют атомарных add()/incr()"""
+    if nko_cache.is_atomic():
+        return []
+    return [
+        checks.Warning(
+            "Общий кэш не поддерживает атомарные add()/incr() между процессами.",
+            hint=(
+                "Блокировка пересчёта кэша и ограничения попыток входа работают "
+                "приблизительно. Для нескольких воркеров задайте REDIS_URL."
+            ),
+            id="nko.W001",
+        )
+    ]
@@ -0,0 +1,69 @@
+"""
+Утилиты для записи в БД под конкурентной нагрузкой
+"""
+
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Очередь записи внутри процесса: массовые действия админки из разных потоков
+# одного воркера не конкурируют друг с другом за блокировку SQLite
+_write_lock = threading.Lock()
+
+WRITE_RETRY_ATTEMPTS = 5
+WRITE_RETRY_BASE_DELAY = 0.1  # секунды
+
+
+def is_lock_error(exc):
+    """Ошибка блокировки SQLite ("database is locked" / "database table is locked")"""
+    return isinstance(exc, OperationalError) and "locked" in str(exc).lower()
+
+
+def serialized_write(func, *args, **kwargs):
+    """
+    Выполнить func(*args, **kwargs) в отдельной транзакции через очередь записи.
+
+    На SQLite при "database is locked" транзакция повторяется с
+    экспоненциальной задержкой. Внутри уже открытой транзакции повтор
+    невозможен, поэтому там функция просто вызывается один раз.
+    """
+    if connection.in_atomic_block:
+        return func(*args, **kwargs)
+
+    use_queue = connection.vendor == "sqlite"
+    for attempt in range(1, WRITE_RETRY_ATTEMPTS + 1):
+        try:
+            if use_queue:
+                with _write_lock, transaction.atomic():
+                    return func(*args, **kwargs)
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except OperationalError as e:
+            if not is_lock_error(e) or attempt == WRITE_RETRY_ATTEMPTS:
+                raise
+            delay = WRITE_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            delay += random.uniform(0, delay)
+            logger.warning(
+                "%s: database is locked, retry %d/%d in %.2fs",
+                getattr(func, "__name__", func),
+                attempt,
+                WRITE_RETRY_ATTEMPTS - 1,
+                delay,
+            )
+            time.sleep(delay)
+
+
+def retry_on_locked(func):
+    """Декоратор-обёртка над serialized_write"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return serialized_write(func, *args, **kwargs)
+
+    return wrapper
@@ -2,12 +2,93 @@
 Утилиты для отправки email-уведомлений
 """
 
-from django.core.mail import send_mail
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.mail import EmailMultiAlternatives, send_mail
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils.html import strip_tags
 
+from good_deed_map import metrics
+from good_deed_map.instrumentation import timer
+
+logger = logging.getLogger(__name__)
+
+# kind: "background" — письма из send_email_async, остальные — синхронные
+# уведомления (new_application, decision, transfer)
+EMAIL_SEND_DURATION = metrics.Histogram(
+    "gdm_email_send_duration_seconds", "SMTP send time", ["kind"]
+)
+EMAIL_FAILURES = metrics.Counter(
+    "gdm_email_failures_total", "Failed email sends", ["kind"]
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.EMAIL_SENDER_THREADS,
+                    thread_name_prefix="email-sender",
+                )
+    return _executor
+
+
+@contextmanager
+def _smtp(kind):
+    """Замер отправки: Server-Timing текущего запроса и метрики писем"""
+    start = time.perf_counter()
+    try:
+        with timer("smtp"):
+            yield
+    except Exception:
+        EMAIL_FAILURES.inc(kind=kind)
+        raise
+    finally:
+        EMAIL_SEND_DURATION.observe(time.perf_counter() - start, kind=kind)
+
+
+def _send(message):
+    try:
+        with _smtp("background"):
+            message.send(fail_silently=False)
+    except Exception:
+        logger.exception("Failed to send email %r to %s", message.subject, message.to)
+
+
+def send_email_async(message):
+    """
+    Отправить письмо (EmailMessage) в фоновом потоке после коммита транзакции.
+
+    Запрос не ждёт SMTP: ошибки отправки только логируются. При
+    EMAIL_ASYNC=False письмо отправляется сразу в текущем потоке.
+    """
+    if not settings.EMAIL_ASYNC:
+        transaction.on_commit(lambda: _send(message))
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_send, message))
+
+
+def send_mail_async(subject, message, recipient_list, html_message=None):
+    """Аналог django.core.mail.send_mail с отправкой через send_email_async"""
+    email = EmailMultiAlternatives(
+        subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list
+    )
+    if html_message:
+        email.attach_alternative(html_message, "text/html")
+    send_email_async(email)
+
 
 def send_new_application_notification(nko_version):
     """
@@ -16,23 +97,11 @@ def send_new_application_notification(nko_version):
     Args:
         nko_version: объект NKOVersion - новая заявка на создание/изменение НКО
     """
-    print(
-        f"[DEBUG send_new_application_notification] Called for NKO: {nko_version.nko.name}"
-    )
-
     # Получаем всех администраторов, которые хотят получать уведомления
     admin_users = User.objects.filter(
         is_staff=True, is_active=True, profile__receive_nko_notifications=True
     ).exclude(email="")
 
-    print(
-        f"[DEBUG send_new_application_notification] Found {admin_users.count()} admin users with notifications enabled"
-    )
-    for admin in admin_users:
-        print(
-            f"  - {admin.username} ({admin.email}), is_staff={admin.is_staff}, receive_nko_notifications={admin.profile.receive_nko_notifications}"
-        )
-
     # Определяем тип заявки
     is_new_nko = not nko_version.nko.is_approved
     is_transfer = nko_version.new_owner is not None
@@ -65,7 +134,7 @@ def send_new_application_notification(nko_version):
 
     # Формируем список получателей. Если нет админов с включёнными уведомлениями,
     # пытаемся отправить суперюзерам или использовать settings.ADMINS как запасной вариант.
-    recipient_list = [user.email for user in admin_users]
+    recipient_list = list(admin_users.values_list("email", flat=True))
 
     if not recipient_list:
         # Попробуем суперпользователей
@@ -84,35 +153,31 @@ def send_new_application_notification(nko_version):
 
     if not recipient_list:
         # Нечего отправлять — логируем и выходим
-        print(
-            "send_new_application_notification: no recipients found for new application notification"
-        )
+        logger.warning("No recipients for new application %s", nko_version.pk)
         return
 
-    # Логируем получателей для диагностики
-    try:
-        print(f"send_new_application_notification: sending to: {recipient_list}")
-    except Exception:
-        pass
+    logger.debug("Notifying about application %s: %s", nko_version.pk, recipient_list)
 
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=False,
-        )
-        print(
-            f"send_new_application_notification: email sent successfully to {len(recipient_list)} recipients"
+        with _smtp("new_application"):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=recipient_list,
+                html_message=html_message,
+                fail_silently=False,
+            )
+        logger.info(
+            "Application %s notification sent to %d recipients",
+            nko_version.pk,
+            len(recipient_list),
         )
-    except Exception as e:
+    except Exception:
         # Логируем ошибку, но не прерываем выполнение
-        print(f"Ошибка отправки email администраторам: {e}")
-        import traceback
-
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception(
+            "Failed to send application %s notification to admins", nko_version.pk
+        )
 
 
 def send_application_decision_notification(nko_version, approved=True):
@@ -168,17 +233,18 @@ def send_application_decision_notification(nko_version, approved=True):
     subject = f"Ваша заявка {status}: {application_type} - {nko_version.nko.name}"
 
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-    except Exception as e:
+        with _smtp("decision"):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[user.email],
+                html_message=html_message,
+                fail_silently=False,
+            )
+    except Exception:
         # Логируем ошибку, но не прерываем выполнение
-        print(f"Ошибка отправки email пользователю {user.email}: {e}")
+        logger.exception("Failed to send decision email to %s", user.email)
 
 
 def send_transfer_notification_to_new_owner(nko_version):
@@ -206,15 +272,16 @@ def send_transfer_notification_to_new_owner(nko_version):
     subject = f"Вам переданы права на НКО: {nko_version.nko.name}"
 
     try:
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[nko_version.new_owner.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-    except Exception as e:
-        print(
-            f"Ошибка отправки email новому владельцу {nko_version.new_owner.email}: {e}"
+        with _smtp("transfer"):
+            send_mail(
+                subject=subject,
+                message=plain_message,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[nko_version.new_owner.email],
+                html_message=html_message,
+                fail_silently=False,
+            )
+    except Exception:
+        logger.exception(
+            "Failed to send transfer email to %s", nko_version.new_owner.email
         )
@@ -1,8 +1,14 @@
 from django import forms
-from django.db.models import Case, When, IntegerField
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
 from .models import NKO, Category, NKOVersion
+from .categories import category_registry
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
 
 def validate_russian_phone(phone):
     """
@@ -14,23 +20,16 @@ def validate_russian_phone(phone):
     - 8XXXXXXXXXX
     - 7XXXXXXXXXX
     """
-    print(
-        f"[DEBUG validate_russian_phone] called with phone: '{phone}' (type: {type(phone)}, len: {len(phone) if phone else 0})"
-    )
     # Handle empty, None, or whitespace-only strings
     if not phone or not phone.strip():
-        print(f"[DEBUG validate_russian_phone] phone is empty, returning empty string")
         return ""
 
     # Удаляем все нецифровые символы кроме +
     cleaned = re.sub(r"[^\d+]", "", phone)
-    print(f"[DEBUG validate_russian_phone] cleaned: '{cleaned}'")
+    logger.debug("validate_russian_phone: %r cleaned to %r", phone, cleaned)
 
     # If cleaned value is just "+7" or "7" or empty, treat as empty phone
     if cleaned in ["", "+7", "7", "+", "8"]:
-        print(
-            f"[DEBUG validate_russian_phone] cleaned value is just prefix/empty, returning empty string"
-        )
         return ""
 
     # Проверяем различные форматы
@@ -55,14 +54,72 @@ def validate_russian_phone(phone):
     )
 
 
+def validate_logo(logo):
+    """
+    Ограничения загруженного логотипа: размер файла и число пикселей.
+    Уменьшает логотип фоновый воркер (nko/logos.py), не запрос.
+    """
+    if not logo or not hasattr(logo, "image"):
+        # Не новый файл — проверен при загрузке
+        return logo
+    if logo.size > settings.NKO_LOGO_MAX_SIZE:
+        raise forms.ValidationError(
+            "Файл логотипа слишком большой (не более %(size)s МБ).",
+            params={"size": settings.NKO_LOGO_MAX_SIZE // (1024 * 1024)},
+        )
+    width, height = logo.image.size
+    if width * height > settings.NKO_LOGO_MAX_PIXELS:
+        raise forms.ValidationError("Изображение логотипа слишком большое.")
+    return logo
+
+
 class StyledCheckboxSelectMultiple(forms.CheckboxSelectMultiple):
     template_name = "nko/widgets/checkbox_select.html"
     option_template_name = "nko/widgets/checkbox_option.html"
 
 
+class CategoryChoiceIterator(ModelChoiceIterator):
+    """Варианты выбора из реестра категорий, без запроса к БД"""
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in category_registry.all():
+            yield self.choice(category)
+
+    def __len__(self):
+        return len(category_registry.all()) + (
+            1 if self.field.empty_label is not None else 0
+        )
+
+
+class CategoryMultipleChoiceField(forms.ModelMultipleChoiceField):
+    """Выбор категорий: варианты и проверка значений идут через реестр"""
+
+    iterator = CategoryChoiceIterator
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Category.objects.all(), **kwargs)
+
+    def _check_values(self, value):
+        selected = []
+        for pk in value:
+            try:
+                category = category_registry.get(int(pk))
+            except (TypeError, ValueError):
+                category = None
+            if category is None:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": pk},
+                )
+            selected.append(category)
+        return selected
+
+
 class NKOForm(forms.ModelForm):
-    categories = forms.ModelMultipleChoiceField(
-        queryset=Category.objects.all(),
+    categories = CategoryMultipleChoiceField(
         widget=StyledCheckboxSelectMultiple(attrs={"class": "grid gap-2"}),
         required=True,
         label="Направления деятельности",
@@ -104,27 +161,16 @@ class NKOForm(forms.ModelForm):
                 attrs.update({"class": common_classes})
 
         if "categories" in self.fields:
-            qs = Category.objects.annotate(
-                is_other=Case(
-                    When(name__iexact="Другое", then=1),
-                    default=0,
-                    output_field=IntegerField(),
-                )
-            ).order_by("is_other", "name")
-            self.fields["categories"].queryset = qs
             self.fields["categories"].widget.attrs.update({"class": "grid gap-2"})
 
     def clean_phone(self):
         phone = self.cleaned_data.get("phone", "").strip()
-        print(
-            f"[DEBUG NKOForm.clean_phone] phone value: '{phone}' (type: {type(phone)}, len: {len(phone)})"
-        )
-        if phone:
-            result = validate_russian_phone(phone)
-            print(f"[DEBUG NKOForm.clean_phone] validated result: '{result}'")
-            return result
-        print(f"[DEBUG NKOForm.clean_phone] returning empty string")
-        return ""
+        result = validate_russian_phone(phone) if phone else ""
+        logger.debug("NKOForm.clean_phone: %r -> %r", phone, result)
+        return result
+
+    def clean_logo(self):
+        return validate_logo(self.cleaned_data.get("logo"))
 
     class Meta:
         model = NKO
@@ -142,6 +188,7 @@ class NKOForm(forms.ModelForm):
             "vk_link",
             "telegram_link",
             "other_social",
+            "logo",
         ]
         widgets = {
             "description": forms.Textarea(
@@ -153,6 +200,7 @@ class NKOForm(forms.ModelForm):
             "address": forms.Textarea(attrs={"rows": 2}),
             "latitude": forms.HiddenInput(attrs={"id": "id_lat"}),
             "longitude": forms.HiddenInput(attrs={"id": "id_lon"}),
+            "logo": forms.FileInput(attrs={"id": "logo", "accept": ".png,.jpg,.jpeg"}),
             "phone": forms.TextInput(
                 attrs={
                     "placeholder": "+7 (XXX) XXX-XX-XX",
@@ -164,8 +212,7 @@ class NKOForm(forms.ModelForm):
 
 
 class NKOEditForm(forms.ModelForm):
-    categories = forms.ModelMultipleChoiceField(
-        queryset=Category.objects.all(),
+    categories = CategoryMultipleChoiceField(
         widget=StyledCheckboxSelectMultiple(attrs={"class": "grid gap-2"}),
         required=True,
         label="Направления деятельности",
@@ -194,6 +241,7 @@ class NKOEditForm(forms.ModelForm):
             "vk_link",
             "telegram_link",
             "other_social",
+            "logo",
             "change_description",
         ]
         widgets = {
@@ -202,6 +250,7 @@ class NKOEditForm(forms.ModelForm):
             "address": forms.Textarea(attrs={"rows": 2}),
             "latitude": forms.HiddenInput(attrs={"id": "id_lat"}),
             "longitude": forms.HiddenInput(attrs={"id": "id_lon"}),
+            "logo": forms.FileInput(attrs={"id": "logo", "accept": ".png,.jpg,.jpeg"}),
             "phone": forms.TextInput(
                 attrs={
                     "placeholder": "+7 (XXX) XXX-XX-XX",
@@ -241,14 +290,6 @@ class NKOEditForm(forms.ModelForm):
                 self.fields[textarea].widget.attrs.update({"class": common_classes})
 
         if "categories" in self.fields:
-            qs = Category.objects.annotate(
-                is_other=Case(
-                    When(name__iexact="Другое", then=1),
-                    default=0,
-                    output_field=IntegerField(),
-                )
-            ).order_by("is_other", "name")
-            self.fields["categories"].queryset = qs
             self.fields["categories"].widget.attrs.update({"class": "grid gap-2"})
 
     def clean_phone(self):
@@ -257,6 +298,9 @@ class NKOEditForm(forms.ModelForm):
             return validate_russian_phone(phone)
         return ""
 
+    def clean_logo(self):
+        return validate_logo(self.cleaned_data.get("logo"))
+
 
 class TransferOwnershipForm(forms.ModelForm):
     new_owner_email = forms.EmailField(
@@ -0,0 +1,138 @@
+"""
+Адаптивные версии статических изображений
+
+Команда build_image_derivatives уменьшает исходники из RESPONSIVE_IMAGES до
+нескольких ширин в AVIF, WebP и JPEG (PNG для изображений с прозрачностью),
+добавляет хэш содержимого в имена и записывает манифест. Тег
+{% responsive_image %} (nko/templatetags/image_tags.py) по манифесту
+выводит <picture> с srcset/sizes, а без манифеста — обычный <img>.
+"""
+
+import hashlib
+import io
+import json
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from PIL import Image, features
+
+# Исходник (путь в static) -> ширины производных версий, px
+RESPONSIVE_IMAGES = {
+    "images/background1.jpg": (480, 960, 1280),
+    "images/background2.jpg": (480, 960, 1280),
+    "images/background3.jpg": (480, 960, 1280),
+    "images/background4.jpg": (480, 960, 1280),
+    "images/background5.JPG": (480, 960, 1280),
+    "images/rosatom_icon.png": (250, 500),
+}
+
+DERIVED_DIR = "images/derived"
+MANIFEST_NAME = f"{DERIVED_DIR}/manifest.json"
+
+# Формат -> (MIME-тип, параметры сохранения Pillow); порядок — порядок <source>
+FORMATS = {
+    "avif": ("image/avif", {"quality": 50}),
+    "webp": ("image/webp", {"quality": 70, "method": 6}),
+    "jpeg": ("image/jpeg", {"quality": 75, "optimize": True, "progressive": True}),
+    "png": ("image/png", {"optimize": True}),
+}
+
+
+def available_formats(has_alpha):
+    """Форматы производных: современные (если их умеет Pillow) и запасной"""
+    formats = [name for name in ("avif", "webp") if features.check(name)]
+    formats.append("png" if has_alpha else "jpeg")
+    return formats
+
+
+def has_alpha_channel(image):
+    """Есть ли у изображения прозрачность"""
+    return image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def encode(image, fmt):
+    """Закодировать изображение в формат из FORMATS"""
+    out = io.BytesIO()
+    image.save(out, format=fmt.upper(), **FORMATS[fmt][1])
+    return out.getvalue()
+
+
+def build(source_path, name, widths, output_root):
+    """
+    Создать производные одного изображения.
+
+    Args:
+        source_path: путь к исходнику на диске
+        name: путь исходника в static (ключ манифеста)
+        widths: ширины производных; большие ширины исходника пропускаются
+        output_root: каталог static, в который пишется DERIVED_DIR
+
+    Returns:
+        запись манифеста
+    """
+    with Image.open(source_path) as image:
+        image.load()
+    has_alpha = has_alpha_channel(image)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    width, height = image.size
+    stem = os.path.splitext(os.path.basename(name))[0].lower()
+
+    formats = available_formats(has_alpha)
+    entry = {
+        "width": width,
+        "height": height,
+        "fallback": formats[-1],
+        "variants": {fmt: [] for fmt in formats},
+    }
+    for target in sorted({min(w, width) for w in widths}):
+        resized = image
+        if target < width:
+            size = (target, round(height * target / width))
+            resized = image.resize(size, Image.Resampling.LANCZOS)
+        for fmt in formats:
+            data = encode(resized, fmt)
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            ext = "jpg" if fmt == "jpeg" else fmt
+            path = f"{DERIVED_DIR}/{stem}-{target}.{digest}.{ext}"
+            full_path = os.path.join(output_root, path)
+            if not os.path.exists(full_path):
+                with open(full_path, "wb") as f:
+                    f.write(data)
+            entry["variants"][fmt].append(
+                {"width": target, "path": path, "bytes": len(data)}
+            )
+    return entry
+
+
+def write_manifest(manifest, output_root):
+    path = os.path.join(output_root, MANIFEST_NAME)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+@lru_cache(maxsize=1)
+def load_manifest():
+    """Манифест производных ({} — если команда ещё не запускалась)"""
+    path = finders.find(MANIFEST_NAME)
+    if not path and settings.STATIC_ROOT:
+        path = os.path.join(settings.STATIC_ROOT, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, TypeError, ValueError):
+        return {}
+
+
+def pick(entry, fmt, css_width, density):
+    """Вариант, который браузер выберет при ширине css_width и плотности density"""
+    variants = entry["variants"][fmt]
+    needed = css_width * density
+    for variant in variants:
+        if variant["width"] >= needed:
+            return variant
+    return variants[-1]
@@ -0,0 +1,188 @@
+"""
+Фоновые задачи массовой модерации
+
+Админка создаёт задачу (enqueue), воркер ``python manage.py
+run_moderation_jobs`` забирает её (claim_next) и обрабатывает частями
+(process). Каждая часть и контрольная точка (cursor, счётчики, отметка
+активности) сохраняются в одной транзакции, поэтому после перезапуска воркера
+задача продолжается с места остановки. Задачу, воркер которой не отмечался
+дольше STALE_AFTER, забирает другой воркер.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import moderation
+from .db import serialized_write
+from .models import ModerationJob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 200
+STALE_AFTER = timedelta(minutes=5)
+# Сколько сообщений по отдельным объектам хранить в задаче
+MAX_MESSAGES = 100
+
+
+def should_enqueue(count):
+    """Выполнять ли действие над count объектами фоновой задачей"""
+    return count > settings.MODERATION_INLINE_LIMIT
+
+
+def enqueue(kind, object_ids, user=None, params=None):
+    return ModerationJob.objects.create(
+        kind=kind,
+        object_ids=sorted(object_ids),
+        params=params or {},
+        created_by=user,
+    )
+
+
+def _try_claim(pk, status, heartbeat_at, worker, now):
+    return ModerationJob.objects.filter(
+        pk=pk, status=status, heartbeat_at=heartbeat_at
+    ).update(
+        status=ModerationJob.STATUS_RUNNING,
+        worker=worker,
+        heartbeat_at=now,
+        started_at=Coalesce("started_at", Value(now, output_field=DateTimeField())),
+    )
+
+
+def claim_next(worker):
+    """Забрать следующую задачу из очереди (или зависшую) или вернуть None"""
+    now = timezone.now()
+    candidates = (
+        ModerationJob.objects.filter(
+            Q(status=ModerationJob.STATUS_PENDING)
+            | Q(status=ModerationJob.STATUS_RUNNING, heartbeat_at__lt=now - STALE_AFTER)
+        )
+        .order_by("created_at", "pk")
+        .values_list("pk", "status", "heartbeat_at", "worker")[:10]
+    )
+    for pk, status, heartbeat_at, previous_worker in candidates:
+        # Условный update: задачу получает только один из конкурирующих воркеров
+        if serialized_write(_try_claim, pk, status, heartbeat_at, worker, now):
+            if status == ModerationJob.STATUS_RUNNING:
+                logger.warning(
+                    "Job %s: worker %s is stale, resuming", pk, previous_worker
+                )
+            return ModerationJob.objects.get(pk=pk)
+    return None
+
+
+def _approve_versions(ids, params):
+    report = moderation.approve_versions(ids)
+    messages = [r.message for r in report.skipped] + [
+        f"Ошибка при одобрении версии {r.version}: {r.message}" for r in report.failed
+    ]
+    return len(report.done), len(report.skipped), len(report.failed), messages
+
+
+def _reject_versions(ids, params):
+    report = moderation.reject_versions(ids, params.get("reason", ""))
+    messages = [r.message for r in report.skipped + report.failed]
+    return len(report.done), len(report.skipped), len(report.failed), messages
+
+
+def _reject_nko(ids, params):
+    count = moderation.reject_nkos(ids)
+    return count, len(ids) - count, 0, []
+
+
+HANDLERS = {
+    ModerationJob.KIND_APPROVE_VERSIONS: _approve_versions,
+    ModerationJob.KIND_REJECT_VERSIONS: _reject_versions,
+    ModerationJob.KIND_REJECT_NKO: _reject_nko,
+}
+
+
+def _process_chunk(job, worker, chunk):
+    # Задачу могли забрать как зависшую — тогда чужой курсор не трогаем
+    state = (
+        ModerationJob.objects.select_for_update()
+        .filter(pk=job.pk)
+        .values_list("worker", "status", "cursor")
+        .first()
+    )
+    if state != (worker, ModerationJob.STATUS_RUNNING, job.cursor):
+        return False
+
+    succeeded, skipped, failed, messages = HANDLERS[job.kind](chunk, job.params)
+    job.messages = (job.messages + messages)[:MAX_MESSAGES]
+    ModerationJob.objects.filter(pk=job.pk).update(
+        cursor=F("cursor") + len(chunk),
+        succeeded=F("succeeded") + succeeded,
+        skipped=F("skipped") + skipped,
+        failed=F("failed") + failed,
+        messages=job.messages,
+        heartbeat_at=timezone.now(),
+    )
+    job.cursor += len(chunk)
+    job.succeeded += succeeded
+    job.skipped += skipped
+    job.failed += failed
+    return True
+
+
+def _finish(job, status, error=""):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    serialized_write(
+        ModerationJob.objects.filter(pk=job.pk).update,
+        status=status,
+        error=error,
+        finished_at=job.finished_at,
+    )
+
+
+def process(job, worker, chunk_size=CHUNK_SIZE):
+    """
+    Обработать задачу, начиная с её контрольной точки.
+
+    Returns:
+        False, если задачу во время работы забрал другой воркер
+    """
+    while job.cursor < job.total:
+        chunk = job.object_ids[job.cursor : job.cursor + chunk_size]
+        try:
+            if not serialized_write(_process_chunk, job, worker, chunk):
+                logger.warning("Job %s was taken over by another worker", job.pk)
+                return False
+        except Exception as e:
+            logger.exception("Job %s failed at cursor %s", job.pk, job.cursor)
+            _finish(job, ModerationJob.STATUS_FAILED, str(e))
+            return True
+        logger.info("Job %s: %s/%s", job.pk, job.cursor, job.total)
+
+    _finish(job, ModerationJob.STATUS_DONE)
+    return True
+
+
+def retry(queryset):
+    """Вернуть упавшие задачи в очередь; продолжатся с контрольной точки"""
+    return queryset.filter(status=ModerationJob.STATUS_FAILED).update(
+        status=ModerationJob.STATUS_PENDING,
+        error="",
+        finished_at=None,
+        worker="",
+        heartbeat_at=None,
+    )
+
+
+def release(job, worker):
+    """Вернуть задачу в очередь при остановке воркера (продолжится с контрольной точки)"""
+    return serialized_write(
+        ModerationJob.objects.filter(
+            pk=job.pk, worker=worker, status=ModerationJob.STATUS_RUNNING
+        ).update,
+        status=ModerationJob.STATUS_PENDING,
+        worker="",
+        heartbeat_at=None,
+    )
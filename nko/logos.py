@@ -0,0 +1,107 @@
+"""
+Миниатюры логотипов НКО
+
+Загруженный логотип сохраняется в MEDIA_ROOT как есть, запрос его не
+уменьшает. Воркер ``python manage.py process_logo_thumbnails`` находит НКО,
+у которых миниатюры построены не для текущего логотипа (pending), и пишет
+квадратные миниатюры THUMBNAIL_SIZES с хэшем содержимого в имени — nginx
+отдаёт /media/nko_logos/thumbs/ с бессрочным кэшем. Пока миниатюр нет,
+NKO.logo_thumb_url возвращает None и карта показывает логотип по умолчанию.
+"""
+
+import hashlib
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+from PIL import Image, ImageOps, features
+
+from . import cache as nko_cache
+from . import images, tiles
+from .db import serialized_write
+from .models import NKO
+
+logger = logging.getLogger(__name__)
+
+THUMBS_DIR = "nko_logos/thumbs"
+# Назначение -> сторона квадрата, px (с запасом на экраны 2x):
+# карточка списка и модальное окно — 56px, метка на карте — 40px
+THUMBNAIL_SIZES = {"card": 112, "placemark": 80}
+BATCH_SIZE = 20
+
+
+def pending():
+    """НКО с логотипом, миниатюры которых не построены для текущего файла"""
+    # Ключ извлекается как текст: в PostgreSQL logo_thumbs__source — jsonb,
+    # и сравнение с varchar-колонкой logo не выполняется
+    return (
+        NKO.objects.exclude(logo="")
+        .alias(thumbs_source=KeyTextTransform("source", "logo_thumbs"))
+        .filter(Q(thumbs_source__isnull=True) | ~Q(thumbs_source=F("logo")))
+        .order_by("pk")
+    )
+
+
+def _thumbnail(image, size):
+    """Логотип, вписанный в прозрачный квадрат size x size"""
+    fitted = ImageOps.contain(image, (size, size), Image.Resampling.LANCZOS)
+    canvas = Image.new("RGBA", (size, size))
+    canvas.paste(fitted, ((size - fitted.width) // 2, (size - fitted.height) // 2))
+    return canvas
+
+
+def build(nko):
+    """
+    Построить миниатюры логотипа НКО.
+
+    Returns:
+        значение logo_thumbs; при ошибке чтения файла — с ключом "error",
+        чтобы воркер не повторял обработку того же логотипа
+    """
+    source = nko.logo.name
+    fmt = "webp" if features.check("webp") else "png"
+    try:
+        with default_storage.open(source) as f, Image.open(f) as image:
+            image = ImageOps.exif_transpose(image).convert("RGBA")
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning("NKO %s: cannot read logo %s: %s", nko.pk, source, exc)
+        return {"source": source, "error": str(exc)}
+
+    thumbs = {"source": source}
+    for kind, size in THUMBNAIL_SIZES.items():
+        data = images.encode(_thumbnail(image, size), fmt)
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        path = f"{THUMBS_DIR}/{nko.pk}-{kind}.{digest}.{fmt}"
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(data))
+        thumbs[kind] = path
+    return thumbs
+
+
+def _store(pk, source, thumbs):
+    # Логотип могли заменить, пока строились миниатюры — тогда не записываем
+    return NKO.objects.filter(pk=pk, logo=source).update(logo_thumbs=thumbs)
+
+
+def _remove_old(previous, current):
+    for kind in THUMBNAIL_SIZES:
+        path = (previous or {}).get(kind)
+        if path and path != current.get(kind):
+            default_storage.delete(path)
+
+
+def process_pending(limit=BATCH_SIZE):
+    """Обработать до limit НКО из pending(); возвращает число обновлённых"""
+    updated = []
+    for nko in pending().only("pk", "logo", "logo_thumbs")[:limit]:
+        thumbs = build(nko)
+        if serialized_write(_store, nko.pk, thumbs["source"], thumbs):
+            _remove_old(nko.logo_thumbs, thumbs)
+            updated.append(nko.pk)
+    if updated:
+        # update() сигналов не шлёт
+        nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG)
+        tiles.schedule(updated)
+    return len(updated)
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from nko import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old reviewed NKO versions from the hot NKOVersion table into the "
+        "compressed archive table (optionally also to a JSONL.gz file). Current, "
+        "pending, keyframe and the most recent versions of each NKO stay."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=int,
+            default=180,
+            help="Archive versions created more than this many days ago",
+        )
+        parser.add_argument(
+            "--keep-recent",
+            type=int,
+            default=5,
+            help="Versions per NKO that always stay in the hot table",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after this many batches (default: until done)",
+        )
+        parser.add_argument(
+            "--export", metavar="PATH", help="Also append archived versions to PATH"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only count archivable versions"
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["older_than"])
+        keep_recent = options["keep_recent"]
+
+        if options["dry_run"]:
+            count = archive.archivable_versions(cutoff, keep_recent).count()
+            self.stdout.write(f"Archivable versions: {count}")
+            return
+
+        export = archive.open_export(options["export"]) if options["export"] else None
+        total = 0
+        batches = 0
+        try:
+            while options["max_batches"] is None or batches < options["max_batches"]:
+                # Обработанные версии удаляются, поэтому каждый раз берём с начала
+                ids = list(
+                    archive.archivable_versions(cutoff, keep_recent)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[: options["batch_size"]]
+                )
+                if not ids:
+                    break
+                total += archive.archive_batch(ids, export=export)
+                batches += 1
+                self.stdout.write(f"Batch {batches}: {len(ids)} versions")
+        finally:
+            if export is not None:
+                export.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Archived versions: {total}"))
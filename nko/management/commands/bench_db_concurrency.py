@@ -0,0 +1,157 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import (
+    connection,
+    connections,
+    close_old_connections,
+    transaction,
+    OperationalError,
+)
+
+from nko.db import serialized_write
+
+BENCH_MARKER = "[bench_db_concurrency]"
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency benchmark for the configured database: parallel writers "
+        "(submissions + moderation) and readers (public map) for a fixed time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument(
+            "--duration", type=float, default=10.0, help="Seconds to run"
+        )
+        parser.add_argument(
+            "--sqlite-baseline",
+            action="store_true",
+            help=(
+                "SQLite only: run with Django's default connection options "
+                "(rollback journal, deferred transactions, no write queue) to "
+                "compare against the tuned WAL profile"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        from nko.models import NKO
+
+        nko_ids = list(NKO.objects.values_list("id", flat=True)[:50])
+        if not nko_ids:
+            raise CommandError(
+                "No NKO rows found. Load data first: python manage.py load_initial_data"
+            )
+
+        self.baseline = options["sqlite_baseline"] and connection.vendor == "sqlite"
+        if self.baseline:
+            # journal_mode хранится в самом файле БД, поэтому явно возвращаем DELETE
+            connection.close()
+            connections.settings["default"]["OPTIONS"] = {
+                "init_command": "PRAGMA journal_mode=DELETE;"
+            }
+
+        self.stdout.write(
+            f"Backend: {connection.vendor}{' (baseline)' if self.baseline else ''}, writers={options['writers']}, "
+            f"readers={options['readers']}, duration={options['duration']}s"
+        )
+
+        deadline = time.monotonic() + options["duration"]
+        results = {"write": [], "read": []}
+        errors = Counter()
+        lock = threading.Lock()
+
+        def run(kind, worker_id):
+            latencies = []
+            try:
+                i = 0
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        if kind == "write":
+                            self._write(nko_ids[(worker_id + i) % len(nko_ids)])
+                        else:
+                            self._read()
+                    except OperationalError as e:
+                        with lock:
+                            errors[f"{kind}: {e}"] += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+                    i += 1
+            finally:
+                close_old_connections()
+                connection.close()
+                with lock:
+                    results[kind].extend(latencies)
+
+        threads = [
+            threading.Thread(target=run, args=("write", n))
+            for n in range(options["writers"])
+        ] + [
+            threading.Thread(target=run, args=("read", n))
+            for n in range(options["readers"])
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self._cleanup()
+
+        for kind, latencies in results.items():
+            self._report(kind, latencies, options["duration"])
+        if errors:
+            for message, count in errors.most_common():
+                self.stdout.write(self.style.ERROR(f"{count:>6} x {message}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("No database errors."))
+
+    def _write(self, nko_id):
+        from nko.models import NKO, NKOVersion
+
+        with transaction.atomic():
+            nko = NKO.objects.get(pk=nko_id)
+            version = NKOVersion.objects.create(
+                nko=nko,
+                name=nko.name,
+                description=nko.description,
+                created_by_id=nko.owner_id,
+                change_description=BENCH_MARKER,
+            )
+        # Имитация решения модератора отдельной транзакцией
+        reject = NKOVersion.objects.filter(pk=version.pk).update
+        if self.baseline:
+            reject(is_rejected=True, rejection_reason=BENCH_MARKER)
+        else:
+            serialized_write(reject, is_rejected=True, rejection_reason=BENCH_MARKER)
+
+    def _read(self):
+        from nko.models import NKO
+
+        list(
+            NKO.objects.filter(is_approved=True, is_active=True)
+            .select_related("city", "city__region")
+            .prefetch_related("categories")
+        )
+
+    def _cleanup(self):
+        from nko.models import NKOVersion
+
+        deleted, _ = NKOVersion.objects.filter(change_description=BENCH_MARKER).delete()
+        self.stdout.write(f"Removed {deleted} benchmark rows.")
+
+    def _report(self, kind, latencies, duration):
+        if not latencies:
+            self.stdout.write(f"{kind}: no successful operations")
+            return
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{kind}: {len(latencies)} ops, {len(latencies) / duration:.1f} ops/s, "
+            f"p50={statistics.median(latencies) * 1000:.1f}ms, p95={p95 * 1000:.1f}ms"
+        )
@@ -0,0 +1,163 @@
+import http.cookiejar
+import random
+import re
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+THROTTLED_TEXT = "Слишком много попыток входа"
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Login benchmark against a running server: attacker threads post "
+        "wrong passwords to the login form while a probe measures the latency "
+        "of another endpoint. Reports login attempts/sec by outcome (rejected, "
+        "throttled, accepted) and probe latency, i.e. whether workers stay "
+        "available during the attack."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--login-path", default="/accounts/login/")
+        parser.add_argument("--probe-path", default="/nko/api/categories/")
+        parser.add_argument("--attackers", type=int, default=8)
+        parser.add_argument(
+            "--duration", type=float, default=15.0, help="Seconds to run"
+        )
+        parser.add_argument(
+            "--email",
+            action="append",
+            help="Target account(s); random unknown emails by default",
+        )
+        parser.add_argument(
+            "--spoof-ips",
+            action="store_true",
+            help="Send a random X-Real-IP per request (distributed attack; "
+            "only meaningful when the server trusts LOGIN_CLIENT_IP_HEADER)",
+        )
+        parser.add_argument("--probe-timeout", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.base = options["url"].rstrip("/")
+        self.deadline = time.monotonic() + options["duration"]
+        self.lock = threading.Lock()
+        self.outcomes = Counter()
+        self.login_latencies = []
+        self.probe_latencies = []
+        self.probe_errors = Counter()
+
+        self.stdout.write(
+            f"Target: {self.base}{options['login_path']}, "
+            f"attackers={options['attackers']}, duration={options['duration']}s"
+        )
+        threads = [
+            threading.Thread(target=self._attacker, args=(n,))
+            for n in range(options["attackers"])
+        ]
+        threads.append(threading.Thread(target=self._probe))
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        total = sum(self.outcomes.values())
+        self.stdout.write(f"Login attempts: {total} ({total / elapsed:.1f}/s)")
+        for outcome, count in self.outcomes.most_common():
+            self.stdout.write(f"  {outcome}: {count} ({count / elapsed:.1f}/s)")
+        if self.login_latencies:
+            self.stdout.write(f"Login latency: {self._summary(self.login_latencies)}")
+
+        probes = len(self.probe_latencies)
+        failed = sum(self.probe_errors.values())
+        self.stdout.write(f"Probes: {probes} ok, {failed} failed")
+        if self.probe_latencies:
+            self.stdout.write(f"Probe latency: {self._summary(self.probe_latencies)}")
+        for error, count in self.probe_errors.most_common():
+            self.stdout.write(self.style.WARNING(f"  {count} x {error}"))
+
+    @staticmethod
+    def _summary(latencies):
+        latencies = sorted(latencies)
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+        return (
+            f"p50={statistics.median(latencies) * 1000:.1f}ms "
+            f"p95={p95 * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms"
+        )
+
+    def _headers(self):
+        if not self.options["spoof_ips"]:
+            return {}
+        ip = ".".join(str(random.randint(1, 254)) for _ in range(4))
+        return {"X-Real-IP": ip}
+
+    def _attacker(self, n):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect,
+        )
+        url = self.base + self.options["login_path"]
+        emails = self.options["email"] or [None]
+        token = None
+        while time.monotonic() < self.deadline:
+            try:
+                if token is None:
+                    with opener.open(url, timeout=30) as response:
+                        token = CSRF_RE.search(response.read().decode()).group(1)
+                email = random.choice(emails) or f"bench{random.random()}@example.com"
+                data = urllib.parse.urlencode(
+                    {
+                        "csrfmiddlewaretoken": token,
+                        "username": email,
+                        "password": f"wrong-{n}-{random.random()}",
+                    }
+                ).encode()
+                request = urllib.request.Request(
+                    url, data=data, headers={"Referer": url, **self._headers()}
+                )
+                started = time.monotonic()
+                try:
+                    with opener.open(request, timeout=30) as response:
+                        body = response.read().decode()
+                        outcome = "throttled" if THROTTLED_TEXT in body else "rejected"
+                except urllib.error.HTTPError as e:
+                    outcome = "accepted" if e.code == 302 else f"HTTP {e.code}"
+                latency = time.monotonic() - started
+            except Exception as e:
+                outcome, latency = type(e).__name__, None
+                token = None
+            with self.lock:
+                self.outcomes[outcome] += 1
+                if latency is not None:
+                    self.login_latencies.append(latency)
+
+    def _probe(self):
+        url = self.base + self.options["probe_path"]
+        while time.monotonic() < self.deadline:
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(
+                    url, timeout=self.options["probe_timeout"]
+                ) as response:
+                    response.read()
+                with self.lock:
+                    self.probe_latencies.append(time.monotonic() - started)
+            except Exception as e:
+                with self.lock:
+                    self.probe_errors[type(e).__name__] += 1
+            time.sleep(0.2)
@@ -0,0 +1,141 @@
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Slow-client benchmark against a running server: N clients trickle "
+        "their request headers byte by byte while probe requests measure the "
+        "latency of a read endpoint. Run it once against the sync gunicorn "
+        "(gunicorn_config.py) and once against the ASGI one "
+        "(gunicorn_asgi_config.py) to compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000/nko/api/nko-list/",
+            help="Endpoint to probe",
+        )
+        parser.add_argument("--slow-clients", type=int, default=50)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds between bytes sent by a slow client",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=20.0, help="Seconds to run"
+        )
+        parser.add_argument(
+            "--probe-timeout",
+            type=float,
+            default=10.0,
+            help="Probe requests slower than this count as timeouts",
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("Only plain http:// URLs are supported")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.path = url.path or "/"
+        if url.query:
+            self.path += f"?{url.query}"
+
+        self.stdout.write(
+            f"Target: {options['url']}, slow clients={options['slow_clients']}, "
+            f"interval={options['interval']}s, duration={options['duration']}s"
+        )
+        latencies, errors = asyncio.run(self._run(options))
+
+        self.stdout.write(f"Probes: {len(latencies)} ok, {sum(errors.values())} failed")
+        if latencies:
+            latencies.sort()
+            p95 = (
+                latencies[int(len(latencies) * 0.95) - 1]
+                if len(latencies) > 1
+                else latencies[0]
+            )
+            self.stdout.write(
+                f"Probe latency: p50={statistics.median(latencies) * 1000:.1f}ms "
+                f"p95={p95 * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms"
+            )
+        for error, count in errors.most_common():
+            self.stdout.write(self.style.WARNING(f"  {count} x {error}"))
+
+    def _request_bytes(self):
+        return (
+            f"GET {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+
+    async def _run(self, options):
+        deadline = time.monotonic() + options["duration"]
+        slow = [
+            asyncio.create_task(self._slow_client(deadline, options["interval"]))
+            for _ in range(options["slow_clients"])
+        ]
+        # Даём медленным клиентам занять соединения/воркеры
+        await asyncio.sleep(min(1.0, options["duration"] / 4))
+
+        latencies, errors = [], Counter()
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status = await asyncio.wait_for(
+                    self._probe(), timeout=options["probe_timeout"]
+                )
+            except asyncio.TimeoutError:
+                errors["timeout"] += 1
+            except OSError as e:
+                errors[type(e).__name__] += 1
+            else:
+                if status == 200:
+                    latencies.append(time.monotonic() - started)
+                else:
+                    errors[f"HTTP {status}"] += 1
+            await asyncio.sleep(0.1)
+
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+        return latencies, errors
+
+    async def _slow_client(self, deadline, interval):
+        request = self._request_bytes()
+        while time.monotonic() < deadline:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                await asyncio.sleep(interval)
+                continue
+            try:
+                for byte in request[:-1]:
+                    if time.monotonic() >= deadline:
+                        return
+                    writer.write(bytes([byte]))
+                    await writer.drain()
+                    await asyncio.sleep(interval)
+            except OSError:
+                pass
+            finally:
+                writer.close()
+
+    async def _probe(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(self._request_bytes())
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+        return int(status_line.split()[1])
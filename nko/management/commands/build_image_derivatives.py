@@ -0,0 +1,89 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+from nko import images
+
+# Ширина окна (CSS px), плотность пикселей — типичные первые просмотры
+VIEWPORTS = ((390, 3), (768, 2), (1440, 1), (1920, 2))
+# Ширина, которую браузер берёт из sizes в шаблонах: иконка — 250px,
+# размытый фон карусели — sizes="50vw"
+DISPLAY_WIDTHS = {"images/rosatom_icon.png": 250}
+BACKGROUND_SIZES_RATIO = 0.5
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate resized AVIF/WebP/JPEG derivatives with content hashes for "
+        "the images in nko.images.RESPONSIVE_IMAGES and write their manifest. "
+        "Run on every deploy before collectstatic; the output is not committed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.STATICFILES_DIRS[0],
+            help="Static directory to write images/derived/ into",
+        )
+        parser.add_argument(
+            "--report",
+            action="store_true",
+            help="Print image bytes per first page view, originals vs derivatives",
+        )
+
+    def handle(self, *args, **options):
+        output = str(options["output"])
+        os.makedirs(os.path.join(output, images.DERIVED_DIR), exist_ok=True)
+
+        manifest = {}
+        for name, widths in images.RESPONSIVE_IMAGES.items():
+            source = finders.find(name)
+            if not source:
+                raise CommandError(f"{name} not found in static files")
+            entry = images.build(source, name, widths, output)
+            manifest[name] = entry
+            formats = ", ".join(entry["variants"])
+            self.stdout.write(f"{name}: {formats}, {len(widths)} widths")
+        images.write_manifest(manifest, output)
+        images.load_manifest.cache_clear()
+        self._remove_stale(manifest, output)
+
+        if options["report"]:
+            self._report(manifest)
+
+    def _remove_stale(self, manifest, output):
+        used = {
+            variant["path"]
+            for entry in manifest.values()
+            for variants in entry["variants"].values()
+            for variant in variants
+        }
+        used.add(images.MANIFEST_NAME)
+        directory = os.path.join(output, images.DERIVED_DIR)
+        for filename in os.listdir(directory):
+            if f"{images.DERIVED_DIR}/{filename}" not in used:
+                os.remove(os.path.join(directory, filename))
+
+    def _report(self, manifest):
+        columns = ("avif", "webp", "fallback")
+        self.stdout.write("\nImage bytes per first page view (carousel + icon):")
+        self.stdout.write(
+            f"{'viewport':>10} {'original':>10} "
+            + " ".join(f"{column:>10}" for column in columns)
+        )
+        originals = sum(os.path.getsize(finders.find(name)) for name in manifest)
+        for width, density in VIEWPORTS:
+            totals = dict.fromkeys(columns, 0)
+            for name, entry in manifest.items():
+                css_width = DISPLAY_WIDTHS.get(name, width * BACKGROUND_SIZES_RATIO)
+                for column in columns:
+                    fmt = column if column in entry["variants"] else entry["fallback"]
+                    totals[column] += images.pick(entry, fmt, css_width, density)[
+                        "bytes"
+                    ]
+            self.stdout.write(
+                f"{f'{width}@{density}x':>10} {originals / 1024:>8.0f}KB "
+                + " ".join(f"{totals[column] / 1024:>8.0f}KB" for column in columns)
+            )
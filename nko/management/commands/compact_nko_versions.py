@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from nko.db import serialized_write
+from nko.models import NKOVersion, SNAPSHOT_FIELDS
+
+TEXT_FIELDS = [
+    name for name in SNAPSHOT_FIELDS if name not in ("latitude", "longitude")
+]
+
+
+def stored_bytes():
+    """Объём снимков в таблице версий (тексты + сжатые данные), байт"""
+    total = 0
+    rows = NKOVersion.objects.values_list(*TEXT_FIELDS, "packed_texts")
+    for row in rows.iterator():
+        total += sum(len(value.encode()) for value in row[:-1] if value)
+        total += len(row[-1] or b"")
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite existing NKO versions in the compact storage format "
+        "(NKO_VERSION_STORAGE=compact): fields equal to the NKO's current "
+        "approved version are inherited, long texts are compressed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report the current size"
+        )
+
+    def handle(self, *args, **options):
+        before = stored_bytes()
+        self.stdout.write(f"Snapshot data: {before / 1024:.1f} KiB")
+        if options["dry_run"]:
+            return
+
+        # Текущие версии, записанные дельтой, становятся полными опорными
+        def promote_current():
+            current = NKOVersion.objects.filter(
+                is_current=True, parent__isnull=False
+            ).select_related("parent")
+            for version in current:
+                version.save(update_fields=SNAPSHOT_FIELDS)
+
+        serialized_write(promote_current)
+
+        # Опорные версии (текущие и те, на которые уже ссылаются) не трогаем
+        candidates = (
+            NKOVersion.objects.filter(parent__isnull=True, is_current=False)
+            .exclude(Exists(NKOVersion.objects.filter(parent=OuterRef("pk"))))
+            .order_by("pk")
+        )
+        last_pk = 0
+        converted = 0
+        while True:
+            batch = list(candidates.filter(pk__gt=last_pk)[: options["batch_size"]])
+            if not batch:
+                break
+
+            def rewrite():
+                for version in batch:
+                    version.save(rebase=True)
+
+            serialized_write(rewrite)
+            converted += len(batch)
+            last_pk = batch[-1].pk
+
+        after = stored_bytes()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rewritten versions: {converted}. Snapshot data: "
+                f"{before / 1024:.1f} KiB -> {after / 1024:.1f} KiB"
+            )
+        )
@@ -248,6 +248,10 @@ class Command(BaseCommand):
                 defaults["city"] = city
             if owner:
                 defaults["owner"] = owner
+            if logo:
+                # Путь файла относительно MEDIA_ROOT (например, nko_logos/1.png);
+                # миниатюры построит process_logo_thumbnails
+                defaults["logo"] = logo.strip()
 
             if nkid:
                 obj, created = NKO.objects.update_or_create(
@@ -310,4 +314,9 @@ class Command(BaseCommand):
                 defaults={"email_confirmed": email_confirmed, "patronymic": patronymic},
             )
 
+        # Часть данных записана через queryset.update() в обход сигналов
+        from nko import cache as nko_cache
+
+        nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG, nko_cache.CATEGORIES_TAG)
+
         self.stdout.write(self.style.SUCCESS("Initial data import completed."))
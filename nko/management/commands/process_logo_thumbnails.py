@@ -0,0 +1,49 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from nko import logos
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker that builds content-hashed thumbnails of uploaded NKO logos "
+        "for map cards and placemarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the pending logos and exit instead of polling",
+        )
+        parser.add_argument("--batch-size", type=int, default=logos.BATCH_SIZE)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when there are no pending logos",
+        )
+
+    def handle(self, *args, **options):
+        # systemd останавливает сервис через SIGTERM
+        signal.signal(signal.SIGTERM, self._interrupt)
+        total = 0
+        try:
+            while True:
+                updated = logos.process_pending(options["batch_size"])
+                if updated:
+                    total += updated
+                    self.stdout.write(f"Built thumbnails for {updated} logos")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted")
+        self.stdout.write(f"Processed {total} logos")
+
+    @staticmethod
+    def _interrupt(signum, frame):
+        raise KeyboardInterrupt
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from nko import tiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Publish the map catalogue as static z/x/y JSON tiles into "
+        "MAP_TILES_ROOT for nginx. Run after deploy or a MAP_TILES_ZOOM change; "
+        "later catalogue changes update the affected tiles automatically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--nko",
+            type=int,
+            nargs="+",
+            help="Rebuild only the tiles affected by these NKO ids",
+        )
+
+    def handle(self, *args, **options):
+        if options["nko"]:
+            count = tiles.publish(options["nko"])
+            if count is not None:
+                self.stdout.write(f"Updated {count} tiles")
+                return
+            self.stdout.write("No published tiles yet, rebuilding all")
+        count = tiles.publish_all()
+        self.stdout.write(
+            f"Published {count} tiles (zoom {settings.MAP_TILES_ZOOM}) "
+            f"to {settings.MAP_TILES_ROOT}"
+        )
+        if not tiles.enabled():
+            self.stdout.write(
+                self.style.WARNING(
+                    "MAP_TILES_URL is empty: the map keeps using the API "
+                    "and tiles are not updated on changes"
+                )
+            )
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from captcha.models import CaptchaStore
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from nko.db import serialized_write
+from users.models import EmailConfirmationToken
+
+
+def purge(queryset, batch_size):
+    """Удалить строки queryset короткими транзакциями, вернуть их число"""
+    total = 0
+    while True:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return total
+        serialized_write(lambda: queryset.model.objects.filter(pk__in=pks).delete())
+        total += len(pks)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions, email confirmation tokens and captchas in "
+        "small batches, so the cleanup does not hold long write locks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options["batch_size"]
+
+        # Сессии в кэше и в cookie истекают сами, в таблице — нет. Таблицу
+        # чистим при любом движке, чтобы после его смены не оставались строки
+        sessions = purge(Session.objects.filter(expire_date__lt=now), batch_size)
+
+        expired_at = now - timedelta(seconds=settings.EMAIL_CONFIRMATION_MAX_AGE)
+        tokens = purge(
+            EmailConfirmationToken.objects.filter(created_at__lt=expired_at),
+            batch_size,
+        )
+        captchas = purge(CaptchaStore.objects.filter(expiration__lte=now), batch_size)
+
+        self.stdout.write(
+            f"Deleted {sessions} expired sessions, {tokens} confirmation tokens, "
+            f"{captchas} captchas"
+        )
@@ -0,0 +1,46 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import captcha_pool
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep a pool of pre-generated captchas (CAPTCHA_GET_FROM_POOL) with "
+        "their images rendered into the cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=settings.CAPTCHA_POOL_SIZE,
+            help="Number of captchas to keep available",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Refill every N seconds instead of running once",
+        )
+
+    def handle(self, *args, **options):
+        # systemd останавливает сервис через SIGTERM
+        signal.signal(signal.SIGTERM, self._interrupt)
+        try:
+            while True:
+                created = captcha_pool.refill(options["size"])
+                if created or not options["interval"]:
+                    self.stdout.write(f"Added {created} captchas to the pool")
+                if not options["interval"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Interrupted")
+
+    @staticmethod
+    def _interrupt(signum, frame):
+        raise KeyboardInterrupt
@@ -0,0 +1,67 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from nko import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker for background moderation jobs created by bulk admin actions. "
+        "Processes jobs in chunks with checkpoints; interrupted jobs are resumed "
+        "from the last checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process the queued jobs and exit instead of polling",
+        )
+        parser.add_argument("--chunk-size", type=int, default=jobs.CHUNK_SIZE)
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--worker-id",
+            default=f"{socket.gethostname()}:{os.getpid()}",
+            help="Worker name stored in the job (default: host:pid)",
+        )
+
+    def handle(self, *args, **options):
+        worker = options["worker_id"]
+        # systemd останавливает сервис через SIGTERM
+        signal.signal(signal.SIGTERM, self._interrupt)
+        self.stdout.write(f"Moderation worker {worker} started")
+        job = None
+        try:
+            while True:
+                job = jobs.claim_next(worker)
+                if job is None:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                self.stdout.write(f"{job}: {job.cursor}/{job.total}")
+                jobs.process(job, worker, chunk_size=options["chunk_size"])
+                self.stdout.write(
+                    f"{job}: {job.status}, succeeded={job.succeeded}, "
+                    f"skipped={job.skipped}, failed={job.failed}"
+                )
+                job = None
+        except KeyboardInterrupt:
+            if job is not None:
+                jobs.release(job, worker)
+                self.stdout.write(f"{job}: released at {job.cursor}/{job.total}")
+            self.stdout.write("Interrupted")
+
+    @staticmethod
+    def _interrupt(signum, frame):
+        raise KeyboardInterrupt
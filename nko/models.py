@@ -1,9 +1,23 @@
-from django.db import models
+import json
+import zlib
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models.query_utils import DeferredAttribute
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.core.validators import RegexValidator
+from django.core.validators import FileExtensionValidator, RegexValidator
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
 import re
 
+from . import cache as nko_cache
+
+if getattr(settings, "USE_POSTGIS", False):
+    from django.contrib.gis.db import models as gis_models
+    from django.contrib.gis.geos import Point
+
 
 # Валидатор для российского номера телефона (опционально)
 def validate_phone_optional(value):
@@ -26,6 +40,9 @@ def validate_phone_optional(value):
 # Keep old validator name for backwards compatibility
 phone_regex = validate_phone_optional
 
+LOGO_UPLOAD_TO = "nko_logos/"
+validate_logo_extension = FileExtensionValidator(["png", "jpg", "jpeg"])
+
 
 # Create your models here.
 class Region(models.Model):
@@ -95,11 +112,35 @@ class NKO(models.Model):
     latitude = models.FloatField(null=True, blank=True, verbose_name="Широта")
     longitude = models.FloatField(null=True, blank=True, verbose_name="Долгота")
 
+    if getattr(settings, "USE_POSTGIS", False):
+        # Только для профиля postgis: дублирует latitude/longitude в виде
+        # geography-точки, чтобы гео-запросы шли по пространственному индексу
+        location = gis_models.PointField(
+            geography=True,
+            srid=4326,
+            null=True,
+            blank=True,
+            editable=False,
+            verbose_name="Точка на карте",
+        )
+
     website = models.URLField(blank=True, verbose_name="Сайт")
     vk_link = models.URLField(blank=True, verbose_name="ВКонтакте")
     telegram_link = models.URLField(blank=True, verbose_name="Telegram")
     other_social = models.URLField(blank=True, verbose_name="Другие соцсети")
 
+    logo = models.ImageField(
+        upload_to=LOGO_UPLOAD_TO,
+        blank=True,
+        validators=[validate_logo_extension],
+        verbose_name="Логотип",
+    )
+    # Миниатюры логотипа строит воркер process_logo_thumbnails (nko/logos.py):
+    # {"source": имя логотипа, "card": путь, "placemark": путь}
+    logo_thumbs = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name="Миниатюры логотипа"
+    )
+
     owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Владелец")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
@@ -117,9 +158,36 @@ class NKO(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.sync_location():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and (
+                "latitude" in update_fields or "longitude" in update_fields
+            ):
+                kwargs["update_fields"] = {*update_fields, "location"}
+        super().save(*args, **kwargs)
+
+    def sync_location(self):
+        """Обновить geography-точку из latitude/longitude (только PostGIS)"""
+        if not getattr(settings, "USE_POSTGIS", False):
+            return False
+        if self.latitude is None or self.longitude is None:
+            self.location = None
+        else:
+            self.location = Point(self.longitude, self.latitude, srid=4326)
+        return True
+
     def get_absolute_url(self):
         return reverse("nko_detail", kwargs={"pk": self.pk})
 
+    def logo_thumb_url(self, kind):
+        """URL миниатюры логотипа (card, placemark) или None, пока её нет"""
+        thumbs = self.logo_thumbs or {}
+        if not self.logo or thumbs.get("source") != self.logo.name:
+            return None
+        path = thumbs.get(kind)
+        return default_storage.url(path) if path else None
+
     @property
     def region(self):
         return self.city.region
@@ -132,6 +200,42 @@ class NKO(models.Model):
         return self.versions.filter(is_approved=False, is_rejected=False).first()
 
 
+# Поля снимка НКО в версии, которые могут храниться компактно
+SNAPSHOT_FIELDS = [
+    "name",
+    "description",
+    "volunteer_functions",
+    "phone",
+    "address",
+    "latitude",
+    "longitude",
+    "website",
+    "vk_link",
+    "telegram_link",
+    "other_social",
+]
+# Длинные тексты от этого размера сжимаются zlib
+PACKED_FIELDS = ["description", "volunteer_functions"]
+PACK_THRESHOLD = 256
+
+
+class SnapshotAttribute(DeferredAttribute):
+    """
+    Дескриптор поля снимка NKOVersion.
+
+    Значения полей, унаследованных от опорной версии или сжатых, при загрузке
+    из БД не попадают в __dict__ экземпляра и восстанавливаются при первом
+    обращении к любому из них.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        if instance._restore_snapshot():
+            return instance.__dict__[self.field.attname]
+        return super().__get__(instance, cls)
+
+
 class NKOVersion(models.Model):
     nko = models.ForeignKey(
         NKO, on_delete=models.CASCADE, related_name="versions", verbose_name="НКО"
@@ -166,6 +270,13 @@ class NKOVersion(models.Model):
     vk_link = models.URLField(blank=True, verbose_name="ВКонтакте")
     telegram_link = models.URLField(blank=True, verbose_name="Telegram")
     other_social = models.URLField(blank=True, verbose_name="Другие соцсети")
+    # Пустой — логотип не меняется
+    logo = models.ImageField(
+        upload_to=LOGO_UPLOAD_TO,
+        blank=True,
+        validators=[validate_logo_extension],
+        verbose_name="Логотип",
+    )
 
     new_owner = models.ForeignKey(
         User,
@@ -188,6 +299,26 @@ class NKOVersion(models.Model):
     is_current = models.BooleanField(default=False, verbose_name="Текущая версия")
     change_description = models.TextField(blank=True, verbose_name="Описание изменений")
 
+    # Компактное хранение снимка (NKO_VERSION_STORAGE = "compact"): поля,
+    # совпадающие с опорной версией parent, не хранятся, а длинные тексты
+    # сжимаются в packed_texts. Опорная версия всегда одобрена и сама
+    # хранится целиком, поэтому цепочка не длиннее одного звена.
+    parent = models.ForeignKey(
+        "self",
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="deltas",
+        verbose_name="Опорная версия",
+    )
+    inherited_fields = models.JSONField(
+        default=list, blank=True, editable=False, verbose_name="Поля опорной версии"
+    )
+    packed_texts = models.BinaryField(
+        null=True, blank=True, editable=False, verbose_name="Сжатые тексты"
+    )
+
     class Meta:
         verbose_name = "Версия НКО"
         verbose_name_plural = "Версии НКО"
@@ -196,12 +327,125 @@ class NKOVersion(models.Model):
     def __str__(self):
         return f"Версия {self.nko.name} от {self.created_at}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        data = instance.__dict__
+        pending = list(data.get("inherited_fields") or [])
+        if data.get("packed_texts"):
+            pending += PACKED_FIELDS
+        if pending:
+            # Поля восстановит SnapshotAttribute при первом обращении
+            for name in pending:
+                data.pop(name, None)
+            data["_snapshot_pending"] = pending
+        return instance
+
+    def _restore_snapshot(self):
+        """Восстановить компактно сохранённые поля; False, если нечего"""
+        pending = self.__dict__.pop("_snapshot_pending", None)
+        if not pending:
+            return False
+        packed = {}
+        if self.packed_texts:
+            packed = json.loads(zlib.decompress(bytes(self.packed_texts)))
+        inherited = set(self.inherited_fields)
+        for name in pending:
+            if name in self.__dict__:
+                # Значение, присвоенное после загрузки, не перезаписываем
+                continue
+            if name in packed:
+                self.__dict__[name] = packed[name]
+            elif name in inherited:
+                self.__dict__[name] = getattr(self.parent, name)
+            else:
+                self.__dict__[name] = self._meta.get_field(name).get_default()
+        return True
+
+    def _choose_keyframe(self):
+        """Опорная версия для нового снимка: текущая одобренная версия НКО"""
+        current = (
+            NKOVersion.objects.filter(nko_id=self.nko_id, is_current=True)
+            .exclude(pk=self.pk)
+            .select_related("parent")
+            .first()
+        )
+        if current is None:
+            return None
+        return current.parent or current
+
+    def _encode_snapshot(self, rebase=False):
+        """
+        Подготовить поля снимка к записи; возвращает полный снимок.
+
+        В режиме compact поля, совпадающие с опорной версией, заменяются
+        пустыми значениями, а длинные тексты сжимаются.
+        """
+        snapshot = {name: getattr(self, name) for name in SNAPSHOT_FIELDS}
+        if getattr(settings, "NKO_VERSION_STORAGE", "full") != "compact":
+            self.parent = None
+            self.inherited_fields = []
+            self.packed_texts = None
+            return snapshot
+
+        parent = self.parent
+        if self.is_current:
+            # Одобренная текущая версия сама становится опорной для следующих
+            parent = None
+        elif self._state.adding or rebase:
+            parent = self._choose_keyframe()
+        inherited = []
+        if parent is not None:
+            inherited = [
+                name
+                for name in SNAPSHOT_FIELDS
+                if getattr(parent, name) == snapshot[name]
+            ]
+            # Слишком непохожий снимок выгоднее хранить целиком
+            if len(inherited) * 2 < len(SNAPSHOT_FIELDS):
+                parent, inherited = None, []
+        packed = {
+            name: snapshot[name]
+            for name in PACKED_FIELDS
+            if name not in inherited and len(snapshot[name] or "") >= PACK_THRESHOLD
+        }
+
+        self.parent = parent
+        self.inherited_fields = inherited
+        self.packed_texts = (
+            zlib.compress(json.dumps(packed, ensure_ascii=False).encode())
+            if packed
+            else None
+        )
+        for name in [*inherited, *packed]:
+            setattr(self, name, self._meta.get_field(name).get_default())
+        return snapshot
+
+    def save(self, *args, rebase=False, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        snapshot = None
+        if update_fields is None or set(update_fields) & set(SNAPSHOT_FIELDS):
+            snapshot = self._encode_snapshot(rebase=rebase)
+            if update_fields is not None:
+                kwargs["update_fields"] = {
+                    *update_fields,
+                    *SNAPSHOT_FIELDS,
+                    "parent",
+                    "inherited_fields",
+                    "packed_texts",
+                }
+        super().save(*args, **kwargs)
+        if snapshot is not None:
+            # В памяти экземпляр остаётся полным
+            self.__dict__.update(snapshot)
+
     def apply_changes(self):
         """Применить одобренные изменения к основной записи НКО"""
         if not self.is_approved:
             return False
 
         nko = self.nko
+        previous_owner_id = nko.owner_id
 
         # Проверка при передаче прав: новый владелец не должен иметь других НКО
         if self.new_owner:
@@ -256,6 +500,8 @@ class NKOVersion(models.Model):
         nko.vk_link = self.vk_link
         nko.telegram_link = self.telegram_link
         nko.other_social = self.other_social
+        if self.logo:
+            nko.logo = self.logo.name
 
         if self.new_owner:
             nko.owner = self.new_owner
@@ -270,6 +516,9 @@ class NKOVersion(models.Model):
 
         NKOVersion.objects.filter(nko=nko).exclude(pk=self.pk).update(is_current=False)
 
+        if previous_owner_id != nko.owner_id:
+            nko_cache.invalidate_user_nko(previous_owner_id)
+
         return True
 
     def reject_changes(self, reason=""):
@@ -294,6 +543,208 @@ class NKOVersion(models.Model):
         ).exclude(pk=self.pk)
 
         if not pending_versions.exists():
+            from . import tiles
+
             NKO.objects.filter(pk=nko.pk).update(has_pending_changes=False)
+            owner_id = nko.owner_id
+
+            def invalidate():
+                nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG)
+                nko_cache.invalidate_user_nko(owner_id)
+
+            # Кэш сбрасывается после фиксации транзакции (см. approve_versions)
+            transaction.on_commit(invalidate)
+            tiles.schedule([nko.pk])
 
         return True
+
+
+class NKOVersionArchive(models.Model):
+    """Архивная версия НКО: полный снимок, сжатый zlib (см. nko/archive.py)"""
+
+    original_id = models.PositiveIntegerField(unique=True, verbose_name="ID версии")
+    nko = models.ForeignKey(
+        NKO,
+        on_delete=models.CASCADE,
+        related_name="archived_versions",
+        verbose_name="НКО",
+    )
+    created_at = models.DateTimeField(verbose_name="Дата создания версии")
+    is_approved = models.BooleanField(default=False, verbose_name="Версия одобрена")
+    is_rejected = models.BooleanField(default=False, verbose_name="Версия отклонена")
+    data = models.BinaryField(verbose_name="Снимок")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="В архиве с")
+
+    class Meta:
+        verbose_name = "Архивная версия НКО"
+        verbose_name_plural = "Архив версий НКО"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Версия #{self.original_id} от {self.created_at}"
+
+    @property
+    def snapshot(self):
+        return json.loads(zlib.decompress(bytes(self.data)))
+
+
+class ModerationJob(models.Model):
+    """Фоновая задача массовой модерации (см. nko/jobs.py)"""
+
+    KIND_APPROVE_VERSIONS = "approve_versions"
+    KIND_REJECT_VERSIONS = "reject_versions"
+    KIND_REJECT_NKO = "reject_nko"
+    KIND_CHOICES = [
+        (KIND_APPROVE_VERSIONS, "Одобрение версий"),
+        (KIND_REJECT_VERSIONS, "Отклонение версий"),
+        (KIND_REJECT_NKO, "Отклонение НКО"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "В очереди"),
+        (STATUS_RUNNING, "Выполняется"),
+        (STATUS_DONE, "Завершена"),
+        (STATUS_FAILED, "Ошибка"),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES, verbose_name="Тип")
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+        verbose_name="Статус",
+    )
+    object_ids = models.JSONField(default=list, verbose_name="ID объектов")
+    params = models.JSONField(default=dict, blank=True, verbose_name="Параметры")
+
+    # Контрольная точка: сколько элементов object_ids уже обработано
+    cursor = models.PositiveIntegerField(default=0, verbose_name="Обработано")
+    succeeded = models.PositiveIntegerField(default=0, verbose_name="Успешно")
+    skipped = models.PositiveIntegerField(default=0, verbose_name="Пропущено")
+    failed = models.PositiveIntegerField(default=0, verbose_name="Ошибок")
+    messages = models.JSONField(default=list, blank=True, verbose_name="Сообщения")
+    error = models.TextField(blank=True, verbose_name="Ошибка выполнения")
+
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Кто запустил",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начата")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Воркер")
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Последняя активность"
+    )
+
+    class Meta:
+        verbose_name = "Задача модерации"
+        verbose_name_plural = "Задачи модерации"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk}"
+
+    @property
+    def total(self):
+        return len(self.object_ids)
+
+    @property
+    def progress(self):
+        """Доля обработанных элементов в процентах"""
+        if not self.object_ids:
+            return 100
+        return int(self.cursor * 100 / self.total)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+class ModerationLease(models.Model):
+    """Аренда версии модератором на время рассмотрения (см. nko/moderation_queue.py)"""
+
+    version = models.OneToOneField(
+        NKOVersion,
+        on_delete=models.CASCADE,
+        related_name="lease",
+        verbose_name="Версия",
+    )
+    moderator = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name="Модератор"
+    )
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    class Meta:
+        verbose_name = "Аренда заявки"
+        verbose_name_plural = "Аренды заявок"
+
+    def __str__(self):
+        return f"{self.version_id} → {self.moderator}"
+
+
+for _name in SNAPSHOT_FIELDS:
+    setattr(NKOVersion, _name, SnapshotAttribute(NKOVersion._meta.get_field(_name)))
+
+
+# Инвалидация кэша каталога. Массовые queryset.update() сигналов не шлют —
+# там invalidate_tags вызывается явно.
+@receiver(post_save, sender=NKO)
+@receiver(post_delete, sender=NKO)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(m2m_changed, sender=NKO.categories.through)
+def invalidate_catalogue_cache(sender, **kwargs):
+    nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG)
+
+
+@receiver(post_save, sender=NKO)
+@receiver(post_delete, sender=NKO)
+def invalidate_user_nko_cache(sender, instance, **kwargs):
+    nko_cache.invalidate_user_nko(instance.owner_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories_cache(sender, **kwargs):
+    nko_cache.invalidate_tags(nko_cache.CATEGORIES_TAG)
+
+
+# Статические тайлы карты (nko/tiles.py); массовые update() вызывают
+# tiles.schedule явно
+@receiver(post_save, sender=NKO)
+@receiver(post_delete, sender=NKO)
+def publish_nko_tiles(sender, instance, **kwargs):
+    from . import tiles
+
+    tiles.schedule([instance.pk])
+
+
+@receiver(m2m_changed, sender=NKO.categories.through)
+def publish_nko_categories_tiles(sender, instance, action, reverse, pk_set, **kwargs):
+    from . import tiles
+
+    if action.startswith("post_"):
+        tiles.schedule(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+def publish_all_tiles(sender, **kwargs):
+    from . import tiles
+
+    tiles.schedule()
@@ -0,0 +1,430 @@
+"""
+Пакетная модерация заявок (NKOVersion)
+
+approve_versions() одобряет и применяет сразу много версий в одной
+транзакции с фиксированным числом запросов, не зависящим от размера пакета
+(с точностью до деления на чанки): владельцы, города и регионы загружаются
+заранее, конфликты передачи прав проверяются в памяти, НКО и связи с
+категориями записываются пакетно.
+
+Результат повторяет последовательное применение apply_changes() версий в
+порядке их создания.
+"""
+
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache as nko_cache, tiles
+from .db import serialized_write
+from .email_utils import (
+    send_application_decision_notification,
+    send_transfer_notification_to_new_owner,
+)
+from .models import (
+    NKO,
+    SNAPSHOT_FIELDS,
+    City,
+    ModerationLease,
+    NKOVersion,
+    Region,
+)
+
+CHUNK_SIZE = 500
+DEFAULT_REGION_NAME = "Не указан"
+
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+# Поля НКО, которые переносятся из версии как есть
+COPIED_FIELDS = [
+    "name",
+    "description",
+    "volunteer_functions",
+    "phone",
+    "address",
+    "latitude",
+    "longitude",
+    "website",
+    "vk_link",
+    "telegram_link",
+    "other_social",
+]
+
+
+@dataclass
+class VersionResult:
+    version: NKOVersion
+    status: str
+    message: str = ""
+
+
+@dataclass
+class BatchReport:
+    results: list = field(default_factory=list)
+
+    def _with_status(self, status):
+        return [r for r in self.results if r.status == status]
+
+    @property
+    def done(self):
+        return self._with_status(DONE)
+
+    @property
+    def skipped(self):
+        return self._with_status(SKIPPED)
+
+    @property
+    def failed(self):
+        return self._with_status(FAILED)
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _user_display(user):
+    return user.get_full_name() or user.username
+
+
+def _city_key(version):
+    return version.city_name.strip().title().lower()
+
+
+def _find_by_names(model, names, **filters):
+    """
+    Найти объекты по именам без учёта регистра: {name.lower(): объект}.
+
+    Сравнение выполняется через name__iexact, как в apply_changes(), при
+    совпадении нескольких записей берётся запись с меньшим pk.
+    """
+    found = {}
+    for chunk in _chunks(sorted(names)):
+        condition = Q()
+        for name in chunk:
+            condition |= Q(name__iexact=name)
+        for obj in model.objects.filter(condition, **filters).order_by("-pk"):
+            found[obj.name.lower()] = obj
+    return found
+
+
+def _load_versions(version_ids):
+    versions = []
+    for chunk in _chunks(version_ids):
+        versions.extend(
+            NKOVersion.objects.filter(pk__in=chunk)
+            .select_related("nko", "nko__owner", "new_owner", "created_by", "parent")
+            .prefetch_related("categories")
+        )
+    versions.sort(key=lambda v: (v.created_at, v.pk))
+    # Несколько версий одного НКО должны менять один и тот же объект
+    nkos = {}
+    for version in versions:
+        version.nko = nkos.setdefault(version.nko_id, version.nko)
+    return versions
+
+
+def _check_owner_conflicts(versions, report):
+    """
+    Отфильтровать версии, передача прав в которых невозможна.
+
+    Повторяет проверку apply_changes(): новый владелец не должен владеть
+    другим НКО — с учётом НКО, переданных ему предыдущими версиями пакета.
+    """
+    new_owner_ids = {v.new_owner_id for v in versions if v.new_owner_id}
+    owned = {}  # owner_id -> {nko_id: name}
+    for chunk in _chunks(new_owner_ids):
+        for owner_id, nko_id, name in NKO.objects.filter(
+            owner_id__in=chunk
+        ).values_list("owner_id", "pk", "name"):
+            owned.setdefault(owner_id, {})[nko_id] = name
+    owners = {}  # nko_id -> владелец с учётом уже принятых версий пакета
+    for version in versions:
+        owners[version.nko_id] = version.nko.owner_id
+        owned.setdefault(version.nko.owner_id, {})[version.nko_id] = version.nko.name
+
+    accepted = []
+    for version in versions:
+        nko = version.nko
+        if version.new_owner_id:
+            others = {
+                pk: name
+                for pk, name in owned.get(version.new_owner_id, {}).items()
+                if pk != nko.pk
+            }
+            if others:
+                report.results.append(
+                    VersionResult(
+                        version,
+                        FAILED,
+                        f"Невозможно передать права: пользователь "
+                        f"{_user_display(version.new_owner)} уже является владельцем "
+                        f"НКО '{next(iter(others.values()))}'. "
+                        f"Один пользователь может владеть только одним НКО.",
+                    )
+                )
+                continue
+            owned[owners[nko.pk]].pop(nko.pk, None)
+            owned.setdefault(version.new_owner_id, {})[nko.pk] = version.name
+            owners[nko.pk] = version.new_owner_id
+        accepted.append(version)
+    return accepted
+
+
+def _resolve_cities(versions):
+    """Города для версий с city_name: {ключ города: City}, недостающие создаются"""
+    wanted = {}  # ключ города -> (city_name, region_name) первой версии
+    for version in versions:
+        if version.city_name:
+            city_name = version.city_name.strip().title()
+            region_name = (
+                version.region_name.strip().title()
+                if version.region_name
+                else DEFAULT_REGION_NAME
+            )
+            wanted.setdefault(_city_key(version), (city_name, region_name))
+    if not wanted:
+        return {}
+
+    cities = _find_by_names(City, [name for name, _ in wanted.values()])
+    missing = {key: value for key, value in wanted.items() if key not in cities}
+    if not missing:
+        return cities
+
+    region_names = {region_name for _, region_name in missing.values()}
+    regions = _find_by_names(Region, region_names)
+    new_regions = {}
+    for name in region_names:
+        if name.lower() not in regions:
+            new_regions.setdefault(name.lower(), Region(name=name))
+    if new_regions:
+        Region.objects.bulk_create(new_regions.values(), batch_size=CHUNK_SIZE)
+        regions.update(new_regions)
+
+    new_cities = {
+        key: City(name=city_name, region=regions[region_name.lower()])
+        for key, (city_name, region_name) in missing.items()
+    }
+    City.objects.bulk_create(new_cities.values(), batch_size=CHUNK_SIZE)
+    cities.update(new_cities)
+    return cities
+
+
+def _apply(versions, report):
+    accepted = _check_owner_conflicts(versions, report)
+    if not accepted:
+        return [], set()
+
+    cities = _resolve_cities(accepted)
+    now = timezone.now()
+    nkos = {}
+    current = {}  # nko_id -> последняя применённая версия
+    owner_ids = set()
+
+    for version in accepted:
+        nko = version.nko
+        owner_ids.add(nko.owner_id)
+        if version.city_name:
+            nko.city = cities[_city_key(version)]
+        for name in COPIED_FIELDS:
+            setattr(nko, name, getattr(version, name))
+        if version.logo:
+            nko.logo = version.logo.name
+        if version.new_owner_id:
+            nko.owner = version.new_owner
+            owner_ids.add(version.new_owner_id)
+        nko.has_pending_changes = False
+        nko.updated_at = now
+        nko.sync_location()
+        nkos[nko.pk] = nko
+        current[nko.pk] = version
+
+        version.is_approved = True
+        version.is_rejected = False
+        version.rejection_reason = ""
+        report.results.append(VersionResult(version, DONE))
+
+    fields = COPIED_FIELDS + [
+        "logo",
+        "city",
+        "owner",
+        "has_pending_changes",
+        "updated_at",
+    ]
+    if hasattr(NKO, "location"):
+        fields.append("location")
+    NKO.objects.bulk_update(nkos.values(), fields, batch_size=CHUNK_SIZE)
+
+    # Категории НКО — категории последней применённой версии
+    through = NKO.categories.through
+    for chunk in _chunks(nkos):
+        through.objects.filter(nko_id__in=chunk).delete()
+    through.objects.bulk_create(
+        [
+            through(nko_id=nko_id, category_id=category.pk)
+            for nko_id, version in current.items()
+            for category in version.categories.all()
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+    current_ids = [v.pk for v in current.values()]
+    for chunk in _chunks(nkos):
+        NKOVersion.objects.filter(nko_id__in=chunk, is_current=True).update(
+            is_current=False
+        )
+    for chunk in _chunks(v.pk for v in accepted):
+        NKOVersion.objects.filter(pk__in=chunk).update(
+            is_approved=True, is_rejected=False, rejection_reason=""
+        )
+    for chunk in _chunks(current_ids):
+        NKOVersion.objects.filter(pk__in=chunk).update(is_current=True)
+    for version in accepted:
+        version.is_current = version.pk in current_ids
+        if version.is_current and version.parent_id is not None:
+            # Новая опорная версия хранится без ссылки на прежнюю
+            version.save(update_fields=SNAPSHOT_FIELDS)
+    _release_leases(accepted)
+
+    return accepted, owner_ids
+
+
+def _release_leases(versions):
+    """Рассмотренные версии больше не держат аренду в очереди модерации"""
+    for chunk in _chunks(v.pk for v in versions):
+        ModerationLease.objects.filter(version_id__in=chunk).delete()
+
+
+def _invalidate(owner_ids, nko_ids):
+    nko_cache.invalidate_tags(nko_cache.CATALOGUE_TAG)
+    nko_cache.invalidate_user_nko(*owner_ids)
+    tiles.schedule(nko_ids)
+
+
+def _notify(versions):
+    for version in versions:
+        send_application_decision_notification(version, approved=True)
+        if version.new_owner:
+            send_transfer_notification_to_new_owner(version)
+
+
+def approve_versions(version_ids, notify=True):
+    """
+    Одобрить и применить версии НКО одним пакетом.
+
+    Args:
+        version_ids: id версий (или queryset версий)
+        notify: отправить авторам и новым владельцам уведомления после фиксации
+
+    Returns:
+        BatchReport с результатом по каждой версии
+    """
+    if hasattr(version_ids, "values_list"):
+        version_ids = version_ids.values_list("pk", flat=True)
+    version_ids = list(version_ids)
+
+    def run():
+        report = BatchReport()
+        versions = _load_versions(version_ids)
+        pending = []
+        for version in versions:
+            if version.is_rejected:
+                report.results.append(
+                    VersionResult(
+                        version,
+                        SKIPPED,
+                        f"Версия {version} уже была отклонена и не может быть одобрена",
+                    )
+                )
+            else:
+                pending.append(version)
+        applied, owner_ids = _apply(pending, report)
+        if notify and applied:
+            transaction.on_commit(lambda: _notify(applied))
+        return report, owner_ids
+
+    report, owner_ids = serialized_write(run)
+    if report.done:
+        nko_ids = [result.version.nko_id for result in report.done]
+        # bulk_create/bulk_update/update сигналов не шлют. Внутри внешней
+        # транзакции (задача модерации) кэш сбрасывается только после её
+        # фиксации, иначе параллельный запрос заполнил бы его старыми данными
+        transaction.on_commit(lambda: _invalidate(owner_ids, nko_ids))
+    return report
+
+
+def reject_versions(version_ids, reason, notify=True):
+    """
+    Отклонить версии НКО с указанием причины.
+
+    Уже одобренные версии пропускаются. Уведомления авторам отправляются
+    после фиксации транзакции.
+    """
+    version_ids = list(version_ids)
+
+    def run():
+        report = BatchReport()
+        rejected = []
+        versions = []
+        for chunk in _chunks(version_ids):
+            versions.extend(
+                NKOVersion.objects.filter(pk__in=chunk).select_related(
+                    "nko", "created_by", "new_owner"
+                )
+            )
+        for version in versions:
+            if version.is_approved:
+                report.results.append(
+                    VersionResult(
+                        version,
+                        SKIPPED,
+                        f"Версия {version} уже была одобрена и не может быть отклонена",
+                    )
+                )
+                continue
+            try:
+                if version.reject_changes(reason):
+                    report.results.append(VersionResult(version, DONE))
+                    rejected.append(version)
+                else:
+                    report.results.append(
+                        VersionResult(
+                            version, FAILED, f"Не удалось отклонить {version}"
+                        )
+                    )
+            except Exception as e:
+                report.results.append(
+                    VersionResult(
+                        version, FAILED, f"Ошибка при отклонении {version}: {str(e)}"
+                    )
+                )
+        _release_leases(rejected)
+        if notify and rejected:
+            transaction.on_commit(
+                lambda: [
+                    send_application_decision_notification(version, approved=False)
+                    for version in rejected
+                ]
+            )
+        return report
+
+    return serialized_write(run)
+
+
+def reject_nkos(nko_ids):
+    """Отклонить и удалить неодобренные НКО; возвращает число удалённых НКО"""
+    nko_ids = list(nko_ids)
+
+    def run():
+        count = 0
+        for chunk in _chunks(nko_ids):
+            _, deleted = NKO.objects.filter(pk__in=chunk, is_approved=False).delete()
+            count += deleted.get(NKO._meta.label, 0)
+        return count
+
+    return serialized_write(run)
@@ -0,0 +1,136 @@
+"""
+Очередь модерации с арендой заявок
+
+Модераторы работают параллельно: claim() выдаёт каждому пакет ожидающих
+версий, которые никто другой сейчас не рассматривает, и записывает аренду
+(ModerationLease) на LEASE_DURATION. Истёкшие аренды снова попадают в
+очередь, renew() продлевает их, release() возвращает заявки досрочно.
+
+На PostgreSQL кандидаты выбираются с SELECT ... FOR UPDATE SKIP LOCKED,
+так что одновременные claim() не ждут друг друга и не получают одни и те же
+строки. На SQLite записи и так идут по одной (BEGIN IMMEDIATE), а от гонок
+между процессами защищает уникальность version в таблице аренд.
+"""
+
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Count, Exists, Min, OuterRef
+from django.utils import timezone
+
+from .db import serialized_write
+from .models import ModerationLease, NKOVersion
+
+LEASE_DURATION = timedelta(minutes=15)
+DEFAULT_BATCH_SIZE = 20
+
+
+def _active_leases(now):
+    return ModerationLease.objects.filter(expires_at__gt=now)
+
+
+def pending_versions():
+    """Версии, ожидающие модерации, в порядке поступления"""
+    return NKOVersion.objects.filter(is_approved=False, is_rejected=False).order_by(
+        "created_at", "pk"
+    )
+
+
+def pending_metrics():
+    """Размер очереди и возраст самой старой заявки для /metrics/"""
+    stats = pending_versions().aggregate(count=Count("pk"), oldest=Min("created_at"))
+    age = (timezone.now() - stats["oldest"]).total_seconds() if stats["oldest"] else 0
+    return [
+        (
+            "gdm_pending_versions",
+            "gauge",
+            "NKO versions awaiting moderation",
+            [({}, stats["count"])],
+        ),
+        (
+            "gdm_pending_versions_oldest_age_seconds",
+            "gauge",
+            "Age of the oldest version awaiting moderation",
+            [({}, age)],
+        ),
+    ]
+
+
+def leased_by(user):
+    """Версии, арендованные пользователем (аренда ещё действует)"""
+    return NKOVersion.objects.filter(
+        lease__moderator=user, lease__expires_at__gt=timezone.now()
+    )
+
+
+def _claim(user, limit):
+    now = timezone.now()
+    mine = list(
+        _active_leases(now)
+        .filter(moderator=user, version__is_approved=False, version__is_rejected=False)
+        .values_list("version_id", flat=True)
+    )
+    needed = limit - len(mine)
+    if needed > 0:
+        candidates = pending_versions().filter(
+            ~Exists(_active_leases(now).filter(version=OuterRef("pk")))
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True, of=("self",))
+        ids = list(candidates.values_list("pk", flat=True)[:needed])
+
+        ModerationLease.objects.filter(version_id__in=ids, expires_at__lte=now).delete()
+        ModerationLease.objects.bulk_create(
+            [
+                ModerationLease(
+                    version_id=pk, moderator=user, expires_at=now + LEASE_DURATION
+                )
+                for pk in ids
+            ],
+            ignore_conflicts=True,
+        )
+    return list(
+        pending_versions()
+        .filter(lease__moderator=user, lease__expires_at__gt=now)
+        .select_related("nko", "created_by", "new_owner")
+    )
+
+
+def claim(user, limit=DEFAULT_BATCH_SIZE):
+    """
+    Взять в работу до limit ожидающих версий.
+
+    Уже арендованные пользователем версии засчитываются в limit, так что
+    повторный вызов только дополняет пакет.
+
+    Returns:
+        список арендованных пользователем версий
+    """
+    return serialized_write(_claim, user, limit)
+
+
+def renew(user, version_ids=None):
+    """Продлить аренду версий пользователя (всех или перечисленных)"""
+    now = timezone.now()
+    leases = _active_leases(now).filter(moderator=user)
+    if version_ids is not None:
+        leases = leases.filter(version_id__in=version_ids)
+    return serialized_write(leases.update, expires_at=now + LEASE_DURATION)
+
+
+def release(user, version_ids=None):
+    """Вернуть версии пользователя в очередь (все или перечисленные)"""
+    leases = ModerationLease.objects.filter(moderator=user)
+    if version_ids is not None:
+        leases = leases.filter(version_id__in=version_ids)
+    return serialized_write(leases.delete)[0]
+
+
+def leased_by_others(version_ids, user):
+    """id версий из списка, которые сейчас рассматривают другие модераторы"""
+    return set(
+        _active_leases(timezone.now())
+        .filter(version_id__in=version_ids)
+        .exclude(moderator=user)
+        .values_list("version_id", flat=True)
+    )
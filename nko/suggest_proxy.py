@@ -2,14 +2,70 @@
 Proxy views for Yandex Maps APIs to avoid CORS issues
 """
 
+import hashlib
+
 import requests
+from asgiref.sync import sync_to_async
 from django.http import JsonResponse
 from django.views.decorators.http import require_GET
 from django.conf import settings
 
+from good_deed_map import metrics
+from good_deed_map.instrumentation import timer
+
+from . import cache as nko_cache
+
+# Ответы Яндекса для одних и тех же запросов меняются редко
+SUGGEST_CACHE_TIMEOUT = 60 * 60
+GEOCODE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Обращения к Яндексу (промахи кэша); upstream — "suggest" или "geocode"
+UPSTREAM_DURATION = metrics.Histogram(
+    "gdm_upstream_duration_seconds", "Yandex API request time", ["upstream"]
+)
+UPSTREAM_ERRORS = metrics.Counter(
+    "gdm_upstream_errors_total", "Failed Yandex API requests", ["upstream", "reason"]
+)
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Yandex API error: {status_code}")
+        self.status_code = status_code
+
+
+def _cached_upstream_json(name, url, params, timeout):
+    """GET к API Яндекса с кэшированием успешных ответов в общем кэше"""
+    query = params.get("text") or params.get("geocode") or ""
+    key = nko_cache.make_key(name, hashlib.sha1(query.encode()).hexdigest())
+
+    def fetch():
+        try:
+            with timer("yandex"), UPSTREAM_DURATION.time(upstream=name):
+                response = requests.get(url, params=params, timeout=5)
+        except requests.RequestException as exc:
+            UPSTREAM_ERRORS.inc(upstream=name, reason=type(exc).__name__)
+            raise
+        if response.status_code != 200:
+            UPSTREAM_ERRORS.inc(upstream=name, reason=f"http_{response.status_code}")
+            raise UpstreamError(response.status_code)
+        try:
+            return response.json()
+        except ValueError:
+            UPSTREAM_ERRORS.inc(upstream=name, reason="invalid_json")
+            raise
+
+    return nko_cache.get_or_compute(key, fetch, timeout=timeout)
+
+
+# Медленный ответ Яндекса не должен занимать поток запроса: в режиме ASGI
+# вызов уходит в общий пул потоков, а event loop продолжает обслуживать
+# остальных клиентов
+_upstream_json = sync_to_async(_cached_upstream_json, thread_sensitive=False)
+
 
 @require_GET
-def suggest_proxy(request):
+async def suggest_proxy(request):
     """Proxy requests to Yandex Suggest API"""
     text = request.GET.get("text", "")
 
@@ -24,21 +80,16 @@ def suggest_proxy(request):
         url = "https://suggest-maps.yandex.ru/v1/suggest"
         params = {"apikey": api_key, "text": text, "results": 7}
 
-        response = requests.get(url, params=params, timeout=5)
-
-        if response.status_code == 200:
-            return JsonResponse(response.json())
-        else:
-            return JsonResponse(
-                {"error": f"Yandex API error: {response.status_code}"},
-                status=response.status_code,
-            )
+        data = await _upstream_json("suggest", url, params, SUGGEST_CACHE_TIMEOUT)
+        return JsonResponse(data)
+    except UpstreamError as e:
+        return JsonResponse({"error": str(e)}, status=e.status_code)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
 
 @require_GET
-def geocode_proxy(request):
+async def geocode_proxy(request):
     """Proxy requests to Yandex Geocoder API"""
     geocode = request.GET.get("geocode", "")
 
@@ -53,14 +104,9 @@ def geocode_proxy(request):
         url = "https://geocode-maps.yandex.ru/1.x/"
         params = {"apikey": api_key, "geocode": geocode, "format": "json", "results": 1}
 
-        response = requests.get(url, params=params, timeout=5)
-
-        if response.status_code == 200:
-            return JsonResponse(response.json())
-        else:
-            return JsonResponse(
-                {"error": f"Yandex API error: {response.status_code}"},
-                status=response.status_code,
-            )
+        data = await _upstream_json("geocode", url, params, GEOCODE_CACHE_TIMEOUT)
+        return JsonResponse(data)
+    except UpstreamError as e:
+        return JsonResponse({"error": str(e)}, status=e.status_code)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
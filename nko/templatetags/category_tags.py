@@ -1,15 +1,15 @@
 from django import template
 from django.utils.text import slugify as dj_slugify
 
-from nko.models import Category
+from nko.categories import category_registry
 
 register = template.Library()
 
 
 @register.simple_tag
 def get_categories():
-    """Return all categories for use in templates."""
-    return Category.objects.all()
+    """Return all categories for use in templates (cached registry)."""
+    return category_registry.all()
 
 
 @register.filter
@@ -0,0 +1,69 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from nko import images
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ", ".join(f"{static(v['path'])} {v['width']}w" for v in variants)
+
+
+@register.simple_tag
+def responsive_image(src, sizes="100vw", **attrs):
+    """
+    <picture> с AVIF/WebP/JPEG-версиями изображения из static (см. nko/images.py).
+
+    Пример: {% responsive_image 'images/background1.jpg' sizes='100vw' class='w-full' alt='' %}
+    Если производных нет (build_image_derivatives не запускалась), выводится <img>.
+    """
+    attrs.setdefault("alt", "")
+    attrs.setdefault("decoding", "async")
+    entry = images.load_manifest().get(src)
+    if entry is None:
+        return format_html('<img src="{}"{}>', static(src), _attrs(attrs))
+
+    fallback = entry["variants"][entry["fallback"]]
+    sources = _sources(entry, sizes, include_fallback=False)
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{}>'
+        "</picture>",
+        sources,
+        static(fallback[-1]["path"]),
+        _srcset(fallback),
+        sizes,
+        entry["width"],
+        entry["height"],
+        _attrs(attrs),
+    )
+
+
+@register.simple_tag
+def responsive_sources(src, sizes="100vw"):
+    """
+    Только элементы <source> для всех версий изображения — для <picture>,
+    в котором <img> пишется в шаблоне вручную. Без производных — пустая строка.
+    """
+    entry = images.load_manifest().get(src)
+    if entry is None:
+        return ""
+    return _sources(entry, sizes, include_fallback=True)
+
+
+def _sources(entry, sizes, include_fallback):
+    return format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (mime, _srcset(entry["variants"][fmt]), sizes)
+            for fmt, (mime, _) in images.FORMATS.items()
+            if fmt in entry["variants"]
+            and (include_fallback or fmt != entry["fallback"])
+        ),
+    )
+
+
+def _attrs(attrs):
+    return format_html_join("", ' {}="{}"', sorted(attrs.items()))
@@ -1,3 +1,1236 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.forms.models import model_to_dict
+from django.template import Context, Template
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+)
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+import requests
+
+from nko import (
+    archive,
+    cache as nko_cache,
+    db as nko_db,
+    email_utils,
+    images,
+    jobs,
+    logos,
+    moderation,
+    moderation_queue,
+    tiles,
+    views,
+)
+from nko.admin import NKOAdmin, NKOVersionAdmin
+from nko.categories import category_registry
+from nko.forms import NKOEditForm, NKOForm
+from nko.models import (
+    Category,
+    City,
+    ModerationJob,
+    ModerationLease,
+    NKO,
+    NKOVersion,
+    NKOVersionArchive,
+    Region,
+)
+from good_deed_map import instrumentation, log, metrics
+from good_deed_map.storage import CompressedManifestStaticFilesStorage
+from users.context_processors import user_nko
+
+
+class SerializedWriteTests(TransactionTestCase):
+    def test_retries_when_database_is_locked(self):
+        func = mock.Mock(
+            side_effect=[OperationalError("database is locked"), "ok"],
+            __name__="func",
+        )
+        with mock.patch.object(nko_db.time, "sleep"), self.assertLogs("nko.db"):
+            self.assertEqual(nko_db.serialized_write(func, 1, key="value"), "ok")
+        self.assertEqual(func.call_count, 2)
+        func.assert_called_with(1, key="value")
+
+    def test_other_operational_errors_are_not_retried(self):
+        func = mock.Mock(side_effect=OperationalError("no such table"), __name__="func")
+        with self.assertRaises(OperationalError):
+            nko_db.serialized_write(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_gives_up_after_max_attempts(self):
+        func = mock.Mock(
+            side_effect=OperationalError("database is locked"), __name__="func"
+        )
+        with mock.patch.object(nko_db.time, "sleep"), self.assertLogs("nko.db"):
+            with self.assertRaises(OperationalError):
+                nko_db.serialized_write(func)
+        self.assertEqual(func.call_count, nko_db.WRITE_RETRY_ATTEMPTS)
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_tag_invalidation(self):
+        key = nko_cache.make_key("test")
+        compute = mock.Mock(side_effect=[1, 2])
+        self.assertEqual(nko_cache.get_or_compute(key, compute, tags=("t",)), 1)
+        self.assertEqual(nko_cache.get_or_compute(key, compute, tags=("t",)), 1)
+        nko_cache.invalidate_tags("t")
+        self.assertEqual(nko_cache.get_or_compute(key, compute, tags=("t",)), 2)
+
+    def test_early_refresh_is_done_by_lock_holder_only(self):
+        key = nko_cache.make_key("test")
+        nko_cache.get_or_compute(key, lambda: "old", timeout=100)
+        # Запись близка к истечению, блокировку держит другой процесс
+        with mock.patch.object(nko_cache.time, "time", return_value=time.time() + 90):
+            cache.add(f"{key}:lock", 1)
+            self.assertEqual(
+                nko_cache.get_or_compute(key, lambda: "new", timeout=100), "old"
+            )
+            cache.delete(f"{key}:lock")
+            self.assertEqual(
+                nko_cache.get_or_compute(key, lambda: "new", timeout=100), "new"
+            )
+
+    def test_tag_version_created_once(self):
+        # Другой процесс успел создать версию тега между чтением и записью
+        tag_key = nko_cache.make_key("tag", "t")
+        get_many = cache.get_many
+
+        def racing_get_many(keys):
+            result = get_many(keys)
+            cache.add(tag_key, "other")
+            return result
+
+        with mock.patch.object(
+            nko_cache.cache, "get_many", side_effect=racing_get_many
+        ):
+            versions = nko_cache.get_tag_versions(["t"])
+        self.assertEqual(versions, {"t": "other"})
+        self.assertEqual(cache.get(tag_key), "other")
+
+    def test_file_cache_deploy_warning(self):
+        from nko.checks import check_atomic_cache
+
+        def backend(name):
+            return {"default": {"BACKEND": f"django.core.cache.backends.{name}"}}
+
+        with override_settings(CACHES=backend("redis.RedisCache")):
+            self.assertEqual(check_atomic_cache(None), [])
+        with override_settings(CACHES=backend("filebased.FileBasedCache")):
+            self.assertEqual(
+                [warning.id for warning in check_atomic_cache(None)], ["nko.W001"]
+            )
+
+    def test_catalogue_api_is_invalidated_on_change(self):
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        owner = User.objects.create_user("owner", "owner@example.com")
+        self.assertEqual(self.client.get("/nko/api/nko-list/").json(), [])
+        NKO.objects.create(
+            name="НКО", city=city, owner=owner, description="-", is_approved=True
+        )
+        self.assertEqual(len(self.client.get("/nko/api/nko-list/").json()), 1)
+
+
+class UserNKOCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", "owner@example.com")
+        region = Region.objects.create(name="Регион")
+        self.city = City.objects.create(name="Город", region=region)
+
+    def _request(self):
+        return RequestFactory().get("/")
+
+    def test_lookup_is_memoized_and_cached(self):
+        request = self._request()
+        request.user = self.owner
+        with self.assertNumQueries(1):
+            self.assertIsNone(nko_cache.get_user_nko(request))
+            self.assertIsNone(nko_cache.get_user_nko(request))
+        request = self._request()
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            self.assertIsNone(nko_cache.get_user_nko(request))
+
+    def test_invalidated_on_create_and_delete(self):
+        request = self._request()
+        request.user = self.owner
+        nko_cache.get_user_nko(request)
+        nko = NKO.objects.create(
+            name="НКО", city=self.city, owner=self.owner, description="-"
+        )
+        request = self._request()
+        request.user = self.owner
+        self.assertEqual(nko_cache.get_user_nko(request), nko)
+        nko.delete()
+        request = self._request()
+        request.user = self.owner
+        self.assertIsNone(nko_cache.get_user_nko(request))
+
+    def test_context_processor_is_lazy(self):
+        request = self._request()
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            context = user_nko(request)
+        with self.assertNumQueries(1):
+            self.assertFalse(context["user_nko"])
+
+
+class CategoryRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(name="Другое")
+        Category.objects.create(name="Экология")
+        Category.objects.create(name="Дети")
+
+    def test_order_and_slugs(self):
+        names = [c.name for c in category_registry.all()]
+        self.assertEqual(names, ["Дети", "Экология", "Другое"])
+        self.assertEqual(category_registry.all()[0].slug, "дети")
+
+    def test_memoized_until_category_changes(self):
+        category_registry.all()
+        with self.assertNumQueries(0):
+            category_registry.all()
+            NKOEditForm().as_p()
+        Category.objects.create(name="Спорт")
+        with self.assertNumQueries(1):
+            self.assertEqual(len(category_registry.all()), 4)
+
+    def test_form_validates_against_registry(self):
+        pk = category_registry.all()[0].pk
+        form = NKOForm(data={"categories": [str(pk), "999999"]})
+        form.is_valid()
+        self.assertIn("categories", form.errors)
+        form = NKOForm(data={"categories": [str(pk)]})
+        form.is_valid()
+        self.assertNotIn("categories", form.errors)
+        self.assertEqual([c.pk for c in form.cleaned_data["categories"]], [pk])
+
+
+class BatchModerationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.region = Region.objects.create(name="Регион")
+        self.city = City.objects.create(name="Город", region=self.region)
+        self.categories = [
+            Category.objects.create(name="Экология"),
+            Category.objects.create(name="Дети"),
+        ]
+        self.users = [
+            User.objects.create_user(f"user{i}", f"user{i}@example.com")
+            for i in range(4)
+        ]
+
+    def _nko(self, owner, name="НКО"):
+        return NKO.objects.create(
+            name=name, city=self.city, owner=owner, description="-", is_approved=True
+        )
+
+    def _version(self, nko, **kwargs):
+        kwargs.setdefault("name", nko.name)
+        version = NKOVersion.objects.create(
+            nko=nko, description="Новое описание", created_by=nko.owner, **kwargs
+        )
+        version.categories.set(self.categories)
+        return version
+
+    def test_applies_versions_and_creates_cities_once(self):
+        first = self._nko(self.users[0], "Первое")
+        second = self._nko(self.users[1], "Второе")
+        versions = [
+            self._version(first, name="Первое 2", city_name="новый город"),
+            self._version(second, city_name="Новый Город", region_name="новый регион"),
+        ]
+
+        report = moderation.approve_versions([v.pk for v in versions])
+
+        self.assertEqual(len(report.done), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.name, "Первое 2")
+        self.assertEqual(first.city, second.city)
+        self.assertEqual(first.city.name, "Новый Город")
+        self.assertEqual(first.city.region.name, "Не указан")
+        self.assertEqual(set(second.categories.all()), set(self.categories))
+        for version in versions:
+            version.refresh_from_db()
+            self.assertTrue(version.is_approved)
+            self.assertTrue(version.is_current)
+
+    def test_transfer_conflicts_within_batch(self):
+        first = self._nko(self.users[0], "Первое")
+        second = self._nko(self.users[1], "Второе")
+        self._nko(self.users[3], "Третье")
+        to_free_user = self._version(first, new_owner=self.users[2])
+        to_same_user = self._version(second, new_owner=self.users[2])
+        to_owner = self._version(second, new_owner=self.users[3])
+
+        report = moderation.approve_versions(
+            [to_free_user.pk, to_same_user.pk, to_owner.pk]
+        )
+
+        self.assertEqual([r.version.pk for r in report.done], [to_free_user.pk])
+        self.assertEqual(len(report.failed), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.owner, self.users[2])
+        self.assertEqual(second.owner, self.users[1])
+        to_same_user.refresh_from_db()
+        self.assertFalse(to_same_user.is_approved)
+
+    def test_cache_invalidated_after_commit(self):
+        nko = self._nko(self.users[0])
+        version = self._version(nko, name="Новое имя")
+        tags = nko_cache.get_tag_versions([nko_cache.CATALOGUE_TAG])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            moderation.approve_versions([version.pk])
+            # До фиксации параллельный запрос не должен заполнить кэш
+            # старыми данными под новой версией тега
+            self.assertEqual(
+                nko_cache.get_tag_versions([nko_cache.CATALOGUE_TAG]), tags
+            )
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(nko_cache.get_tag_versions([nko_cache.CATALOGUE_TAG]), tags)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        Region.objects.create(name=moderation.DEFAULT_REGION_NAME)
+
+        def approve(count):
+            versions = []
+            for i in range(count):
+                owner = User.objects.create_user(f"owner{count}-{i}")
+                versions.append(self._version(self._nko(owner), city_name=f"Город {i}"))
+            with CaptureQueriesContext(connection) as queries:
+                report = moderation.approve_versions([v.pk for v in versions])
+            self.assertEqual(len(report.done), count)
+            return len(queries)
+
+        self.assertEqual(approve(2), approve(20))
+
+
+class ApproveNKOActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        self.city = City.objects.create(name="Город", region=region)
+        self.model_admin = NKOAdmin(NKO, admin.site)
+        self.request = RequestFactory().post("/")
+
+    def _create(self, prefix, count):
+        users = User.objects.bulk_create(
+            User(username=f"{prefix}-{i}") for i in range(count)
+        )
+        NKO.objects.bulk_create(
+            NKO(name=f"{prefix}-{i}", city=self.city, owner=user, description="-")
+            for i, user in enumerate(users)
+        )
+        return NKO.objects.filter(name__startswith=f"{prefix}-")
+
+    def _approve(self, queryset):
+        with mock.patch.object(NKOAdmin, "message_user") as message_user:
+            with CaptureQueriesContext(connection) as queries:
+                self.model_admin.approve_nko(self.request, queryset)
+        return len(queries), message_user
+
+    def test_query_count_is_constant(self):
+        counts = set()
+        for size in (1, 100, 10_000):
+            queryset = self._create(f"batch{size}", size)
+            count, _ = self._approve(queryset)
+            counts.add(count)
+            self.assertEqual(queryset.filter(is_approved=True).count(), size)
+        self.assertEqual(len(counts), 1)
+
+    def test_conflicts_are_not_approved(self):
+        queryset = self._create("nko", 3)
+        owner, other_owner, transfer_owner = [nko.owner for nko in queryset]
+        # Второе НКО того же владельца в выборке и заявка на передачу прав
+        NKO.objects.create(name="nko-x", city=self.city, owner=owner, description="-")
+        NKOVersion.objects.create(
+            nko=NKO.objects.get(owner=other_owner),
+            name="-",
+            description="-",
+            created_by=other_owner,
+            new_owner=transfer_owner,
+        )
+
+        _, message_user = self._approve(queryset)
+
+        approved = NKO.objects.get(owner=other_owner)
+        self.assertEqual(list(queryset.filter(is_approved=True)), [approved])
+        messages = [call.args[1] for call in message_user.call_args_list]
+        self.assertIn("Ошибок при одобрении: 3", messages)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "x")
+        self.client.force_login(self.admin)
+        region = Region.objects.create(name="Регион")
+        self.city = City.objects.create(name="Город", region=region)
+        self.categories = [
+            Category.objects.create(name="Экология"),
+            Category.objects.create(name="Дети"),
+        ]
+
+    def _add_rows(self, count):
+        start = NKO.objects.count()
+        for i in range(start, start + count):
+            owner = User.objects.create_user(f"owner{i}", first_name="Имя")
+            nko = NKO.objects.create(
+                name=f"НКО {i}", city=self.city, owner=owner, description="-"
+            )
+            nko.categories.set(self.categories)
+            NKOVersion.objects.create(
+                nko=nko,
+                name=nko.name,
+                description="-",
+                created_by=owner,
+                new_owner=self.admin,
+            )
+
+    def _query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        urls = [
+            "/admin/nko/nko/",
+            "/admin/nko/nko/?city_name=Гор",
+            "/admin/nko/nkoversion/",
+            "/admin/auth/user/",
+        ]
+        self._add_rows(2)
+        small = [self._query_count(url) for url in urls]
+        self._add_rows(20)
+        large = [self._query_count(url) for url in urls]
+        self.assertEqual(small, large)
+
+
+class ModerationJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        self.city = City.objects.create(name="Город", region=region)
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "x")
+
+    def _nkos(self, count):
+        return [
+            NKO.objects.create(
+                name=f"НКО {i}",
+                city=self.city,
+                owner=User.objects.create_user(f"owner{i}"),
+                description="-",
+            )
+            for i in range(count)
+        ]
+
+    @override_settings(MODERATION_INLINE_LIMIT=1)
+    def test_bulk_action_is_enqueued_and_processed_in_chunks(self):
+        versions = [
+            NKOVersion.objects.create(
+                nko=nko, name="Новое имя", description="-", created_by=nko.owner
+            )
+            for nko in self._nkos(3)
+        ]
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            "/admin/nko/nkoversion/",
+            {
+                "action": "approve_versions",
+                "_selected_action": [v.pk for v in versions],
+            },
+        )
+        job = ModerationJob.objects.get()
+        self.assertRedirects(response, f"/admin/nko/moderationjob/{job.pk}/change/")
+        self.assertFalse(NKO.objects.filter(name="Новое имя").exists())
+
+        call_command(
+            "run_moderation_jobs", "--once", "--chunk-size=2", stdout=StringIO()
+        )
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ModerationJob.STATUS_DONE)
+        self.assertEqual((job.cursor, job.succeeded), (3, 3))
+        self.assertEqual(NKO.objects.filter(name="Новое имя").count(), 3)
+        response = self.client.get(f"/admin/nko/moderationjob/{job.pk}/change/")
+        self.assertContains(response, "3 / 3")
+
+    def test_stale_job_resumes_from_checkpoint(self):
+        nkos = self._nkos(3)
+        job = jobs.enqueue(ModerationJob.KIND_REJECT_NKO, [n.pk for n in nkos])
+        # Воркер упал после первой части и больше не отмечается
+        ModerationJob.objects.filter(pk=job.pk).update(
+            status=ModerationJob.STATUS_RUNNING,
+            worker="dead",
+            cursor=1,
+            heartbeat_at=timezone.now() - jobs.STALE_AFTER * 2,
+        )
+
+        with self.assertLogs("nko.jobs", "WARNING"):
+            call_command("run_moderation_jobs", "--once", stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ModerationJob.STATUS_DONE)
+        self.assertEqual(job.cursor, 3)
+        self.assertEqual(list(NKO.objects.all()), [nkos[0]])
+
+
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        self.versions = []
+        for i in range(95):
+            owner = User.objects.create_user(f"owner{i}")
+            nko = NKO.objects.create(
+                name=f"НКО {i}", city=city, owner=owner, description="-"
+            )
+            self.versions.append(
+                NKOVersion.objects.create(
+                    nko=nko, name=f"НКО {i}", description="-", created_by=owner
+                )
+            )
+        self.moderators = [
+            User.objects.create_user(f"moderator{i}", is_staff=True) for i in range(4)
+        ]
+
+    def test_claims_do_not_overlap(self):
+        first = moderation_queue.claim(self.moderators[0], limit=10)
+        second = moderation_queue.claim(self.moderators[1], limit=10)
+        self.assertEqual(len(first), 10)
+        self.assertFalse({v.pk for v in first} & {v.pk for v in second})
+        # Повторный claim дополняет пакет, а не выдаёт новый
+        self.assertEqual(
+            {v.pk for v in moderation_queue.claim(self.moderators[0], limit=10)},
+            {v.pk for v in first},
+        )
+
+    def test_expired_lease_returns_to_queue(self):
+        claimed = moderation_queue.claim(self.moderators[0], limit=95)
+        self.assertEqual(moderation_queue.claim(self.moderators[1]), [])
+        ModerationLease.objects.filter(version=claimed[0]).update(
+            expires_at=timezone.now()
+        )
+        self.assertEqual(moderation_queue.claim(self.moderators[1]), [claimed[0]])
+
+    def test_claim_view_requires_post(self):
+        self.client.force_login(self.moderators[0])
+        url = reverse("admin:nko_nkoversion_claim")
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertFalse(ModerationLease.objects.exists())
+
+        response = self.client.post(url)
+        self.assertRedirects(
+            response,
+            reverse("admin:nko_nkoversion_changelist") + "?lease=mine",
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(
+            ModerationLease.objects.filter(moderator=self.moderators[0]).count(),
+            moderation_queue.DEFAULT_BATCH_SIZE,
+        )
+
+    def test_change_form_respects_leases(self):
+        version = moderation_queue.claim(self.moderators[0], limit=1)[0]
+        model_admin = NKOVersionAdmin(NKOVersion, admin.site)
+        data = {
+            key: value
+            for key, value in model_to_dict(version).items()
+            if value is not None
+        }
+        data.update(
+            is_approved="on", categories=[Category.objects.create(name="Дети").pk]
+        )
+
+        def form_for(moderator):
+            request = RequestFactory().post("/")
+            request.user = moderator
+            form_class = model_admin.get_form(request, version)
+            return request, form_class(data, instance=version)
+
+        request, form = form_for(self.moderators[1])
+        self.assertFalse(form.is_valid())
+        self.assertIn("другой модератор", str(form.non_field_errors()))
+
+        request, form = form_for(self.moderators[0])
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch.object(NKOVersionAdmin, "message_user"):
+            model_admin.save_model(request, form.save(commit=False), form, True)
+        version.refresh_from_db()
+        self.assertTrue(version.is_approved)
+        self.assertFalse(ModerationLease.objects.filter(version=version).exists())
+
+
+class ParallelModerationTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        self.versions = []
+        for i in range(95):
+            owner = User.objects.create_user(f"owner{i}")
+            nko = NKO.objects.create(
+                name=f"НКО {i}", city=city, owner=owner, description="-"
+            )
+            self.versions.append(
+                NKOVersion.objects.create(
+                    nko=nko, name=f"НКО {i}", description="-", created_by=owner
+                )
+            )
+        self.moderators = [
+            User.objects.create_user(f"moderator{i}", is_staff=True) for i in range(4)
+        ]
+
+    def test_parallel_moderators_throughput(self):
+        # Каждый модератор — отдельный поток со своим соединением с БД
+        start = threading.Barrier(len(self.moderators))
+        claimed = []
+        decided = []
+        errors = []
+
+        def work(moderator):
+            try:
+                start.wait()
+                while batch := moderation_queue.claim(moderator, limit=10):
+                    ids = [v.pk for v in batch]
+                    claimed.extend(ids)
+                    half = len(ids) // 2
+                    moderation.approve_versions(ids[:half], notify=False)
+                    moderation.reject_versions(ids[half:], "-", notify=False)
+                    decided.extend(ids)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=work, args=(moderator,))
+            for moderator in self.moderators
+        ]
+        started = time.perf_counter()
+        with self.assertNoLogs("nko.db", "WARNING"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        # Ни одна версия не выдана двум модераторам и не решена дважды
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(sorted(decided), sorted(v.pk for v in self.versions))
+        self.assertFalse(
+            NKOVersion.objects.filter(is_approved=False, is_rejected=False).exists()
+        )
+        self.assertFalse(ModerationLease.objects.exists())
+        sys.stderr.write(
+            f"\n{len(decided)} decisions by {len(threads)} moderators in "
+            f"{elapsed:.2f}s ({len(decided) / elapsed:.0f}/s) "
+        )
+
+
+@override_settings(NKO_VERSION_STORAGE="compact")
+class CompactVersionStorageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        self.owner = User.objects.create_user("owner")
+        self.nko = NKO.objects.create(
+            name="НКО", city=city, owner=self.owner, description="-"
+        )
+        self.fields = {
+            "name": "НКО",
+            "description": "Очень длинное описание. " * 50,
+            "phone": "+7 900 000-00-00",
+            "website": "https://example.com",
+            "latitude": 55.75,
+            "longitude": 37.61,
+        }
+        self.keyframe = self._version(**self.fields)
+        moderation.approve_versions([self.keyframe.pk], notify=False)
+
+    def _version(self, **fields):
+        return NKOVersion.objects.create(nko=self.nko, created_by=self.owner, **fields)
+
+    def _raw(self, version):
+        return NKOVersion.objects.values("name", "description", "latitude").get(
+            pk=version.pk
+        )
+
+    def test_unchanged_fields_are_inherited_from_keyframe(self):
+        new_owner = User.objects.create_user("new_owner")
+        version = self._version(new_owner=new_owner, **self.fields)
+
+        self.assertEqual(version.parent, self.keyframe)
+        self.assertEqual(
+            self._raw(version), {"name": "", "description": "", "latitude": None}
+        )
+        with self.assertNumQueries(1):
+            loaded = NKOVersion.objects.select_related("parent").get(pk=version.pk)
+            for name, value in self.fields.items():
+                self.assertEqual(getattr(loaded, name), value)
+
+    def test_changed_fields_and_long_texts(self):
+        description = "Новое описание. " * 50
+        version = self._version(**{**self.fields, "description": description})
+
+        self.assertEqual(self._raw(version)["description"], "")
+        self.assertIsNotNone(version.packed_texts)
+        loaded = NKOVersion.objects.get(pk=version.pk)
+        self.assertEqual(loaded.description, description)
+        self.assertEqual(loaded.phone, self.fields["phone"])
+        self.assertEqual(self.keyframe.deltas.get(), loaded)
+
+    def test_assigned_field_of_loaded_delta_is_saved(self):
+        version = self._version(**{**self.fields, "phone": "+7 900 111-11-11"})
+        loaded = NKOVersion.objects.get(pk=version.pk)
+        loaded.name = "Переименовано"
+        loaded.save()
+
+        self.assertEqual(NKOVersion.objects.get(pk=version.pk).name, "Переименовано")
+        self.assertEqual(self._raw(version)["name"], "Переименовано")
+
+    def test_approved_version_becomes_keyframe(self):
+        changed = {**self.fields, "phone": "+7 900 111-11-11"}
+        version = self._version(**changed)
+        self.assertEqual(version.parent, self.keyframe)
+        moderation.approve_versions([version.pk], notify=False)
+
+        version.refresh_from_db()
+        self.assertIsNone(version.parent_id)
+        self.assertEqual(version.inherited_fields, [])
+        self.assertEqual(self._raw(version)["name"], "НКО")
+        self.assertEqual(version.description, self.fields["description"])
+        # Следующие заявки сравниваются с новой опорной версией
+        self.assertEqual(self._version(**changed).parent, version)
+
+        # То же при одобрении через apply_changes
+        edited = self._version(**{**changed, "website": "https://example.org"})
+        edited.is_approved = True
+        edited.apply_changes()
+        self.assertIsNone(NKOVersion.objects.get(pk=edited.pk).parent_id)
+        self.assertEqual(self._version(**changed).parent, edited)
+
+    @override_settings(NKO_VERSION_STORAGE="full")
+    def test_full_mode_stores_complete_snapshot(self):
+        version = self._version(**self.fields)
+        self.assertIsNone(version.parent)
+        self.assertEqual(self._raw(version)["description"], self.fields["description"])
+
+
+class VersionArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        self.owner = User.objects.create_user("owner")
+        self.nko = NKO.objects.create(
+            name="НКО", city=city, owner=self.owner, description="-"
+        )
+        self.category = Category.objects.create(name="Дети")
+
+    def _version(self, days_ago, **fields):
+        version = NKOVersion.objects.create(
+            nko=self.nko,
+            created_by=self.owner,
+            name="НКО",
+            description=f"Описание {days_ago}",
+            **fields,
+        )
+        version.categories.set([self.category])
+        NKOVersion.objects.filter(pk=version.pk).update(
+            created_at=timezone.now() - timedelta(days=days_ago)
+        )
+        return version
+
+    def test_old_reviewed_versions_are_archived(self):
+        old = [self._version(400 + i, is_rejected=True) for i in range(3)]
+        recent = self._version(10, is_rejected=True)
+        pending = self._version(500)
+        current = self._version(450, is_approved=True, is_current=True)
+
+        call_command(
+            "archive_versions", "--keep-recent=1", "--batch-size=2", stdout=StringIO()
+        )
+
+        self.assertEqual(
+            set(NKOVersion.objects.values_list("pk", flat=True)),
+            {recent.pk, pending.pk, current.pk},
+        )
+        self.assertEqual(NKOVersionArchive.objects.count(), 3)
+        snapshot = archive.get_archived(old[0].pk)
+        self.assertEqual(snapshot["description"], "Описание 400")
+        self.assertEqual(snapshot["categories"], [self.category.pk])
+        self.assertTrue(snapshot["is_rejected"])
+        self.assertEqual(len(archive.history(self.nko)), 3)
+
+
+class MyApplicationsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        self.owner = User.objects.create_user("owner")
+        self.nko = NKO.objects.create(
+            name="НКО", city=city, owner=self.owner, description="-"
+        )
+        self.category = Category.objects.create(name="Дети")
+        now = timezone.now()
+        for i in range(7):
+            version = NKOVersion.objects.create(
+                nko=self.nko,
+                created_by=self.owner,
+                name=f"НКО {i}",
+                description="-",
+                is_approved=i % 3 == 0,
+                is_rejected=i % 3 == 1,
+            )
+            version.categories.set([self.category])
+            # Одинаковое время у пар записей проверяет тай-брейк по id
+            NKOVersion.objects.filter(pk=version.pk).update(
+                created_at=now - timedelta(hours=i // 2)
+            )
+        self.client.force_login(self.owner)
+
+    def _fetch(self, **params):
+        with mock.patch("nko.views.APPLICATIONS_PAGE_SIZE", 2):
+            response = self.client.get(reverse("my_applications_api"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_history_is_paginated_by_cursor(self):
+        self._fetch()
+        with CaptureQueriesContext(connection) as ctx:
+            page = self._fetch()
+        # сессия, пользователь, заявки, категории
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+        self.assertEqual([v["status"] for v in page["pending"]], ["pending"] * 2)
+        self.assertEqual(page["pending"][0]["categories"], [self.category.pk])
+
+        seen = []
+        while True:
+            seen += [v["id"] for v in page["history"]]
+            if not page["next_cursor"]:
+                break
+            page = self._fetch(cursor=page["next_cursor"])
+            self.assertEqual(page["pending"], [])
+
+        expected = NKOVersion.objects.exclude(
+            is_approved=False, is_rejected=False
+        ).order_by("-created_at", "-pk")
+        self.assertEqual(seen, [v.pk for v in expected])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("my_applications_api"), {"cursor": "oops"})
+        self.assertEqual(response.status_code, 400)
+        for name in ("my_requests", "my_requests_tsx"):
+            response = self.client.get(reverse(name), {"cursor": "oops"})
+            self.assertEqual(response.status_code, 400)
+
+    def test_pending_transfer_on_cursor_page(self):
+        NKOVersion.objects.filter(is_approved=False, is_rejected=False).update(
+            new_owner=User.objects.create_user("new_owner")
+        )
+        page = self._fetch()
+        self.assertTrue(page["has_pending_transfer"])
+        page = self._fetch(cursor=page["next_cursor"])
+        self.assertTrue(page["has_pending_transfer"])
+
+    def test_my_requests_links_next_page(self):
+        with mock.patch("nko.views.APPLICATIONS_PAGE_SIZE", 2):
+            response = self.client.get(reverse("my_requests"))
+            fragment = self.client.get(reverse("my_requests"), {"fragment": "1"})
+        cursor = response.context["next_cursor"]
+        self.assertTrue(cursor)
+        self.assertContains(response, f"?cursor={quote(cursor)}")
+        self.assertContains(fragment, f"?cursor={quote(cursor)}")
+        # Счётчик отклонённых — по всей истории, а не по странице
+        self.assertEqual(response.context["rejected_count"], 2)
+        self.assertContains(response, "Отклоненные заявки (2)")
+
+
+class StaticStorageTests(SimpleTestCase):
+    def test_hashed_names_and_compressed_copies(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = CompressedManifestStaticFilesStorage(location=root)
+            source = FileSystemStorage(location=root)
+            source.save("js/app.js", ContentFile(b"console.log('good deed');\n" * 50))
+            source.save("js/tiny.js", ContentFile(b"1;"))
+
+            list(
+                storage.post_process(
+                    {name: (source, name) for name in ("js/app.js", "js/tiny.js")}
+                )
+            )
+
+            hashed = storage.stored_name("js/app.js")
+            self.assertRegex(hashed, r"^js/app\.[0-9a-f]{12}\.js$")
+            with open(storage.path(hashed + ".gz"), "rb") as f:
+                self.assertEqual(gzip.decompress(f.read()), storage.open(hashed).read())
+            self.assertFalse(storage.exists(storage.stored_name("js/tiny.js") + ".gz"))
+
+
+class ResponsiveImageTests(SimpleTestCase):
+    def test_picture_with_srcset(self):
+        template = Template(
+            "{% load image_tags %}"
+            "{% responsive_image 'images/background1.jpg' sizes='50vw' class='bg' %}"
+        )
+        with tempfile.TemporaryDirectory() as root:
+            source = os.path.join(root, "bg.png")
+            Image.new("RGB", (800, 400), "#15256D").save(source)
+            os.makedirs(os.path.join(root, images.DERIVED_DIR))
+            entry = images.build(source, "images/background1.jpg", (400, 1600), root)
+
+        self.assertEqual([v["width"] for v in entry["variants"]["jpeg"]], [400, 800])
+        with mock.patch(
+            "nko.images.load_manifest",
+            return_value={"images/background1.jpg": entry},
+        ):
+            html = template.render(Context())
+        self.assertIn('<source type="image/webp"', html)
+        self.assertRegex(html, r'srcset="/static/images/derived/background1-400\.\w+\.jpg 400w')
+        self.assertIn('sizes="50vw" width="800" height="400"', html)
+
+        with mock.patch("nko.images.load_manifest", return_value={}):
+            html = template.render(Context())
+        self.assertEqual(
+            html,
+            '<img src="/static/images/background1.jpg" alt="" class="bg" decoding="async">',
+        )
+
+
+def _png(size=(300, 150), color="#56C02B"):
+    out = io.BytesIO()
+    Image.new("RGB", size, color).save(out, format="PNG")
+    return out.getvalue()
+
+
+class LogoThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        self.owner = User.objects.create_user("owner")
+        self.nko = NKO.objects.create(
+            name="НКО",
+            city=city,
+            owner=self.owner,
+            description="-",
+            latitude=55.0,
+            longitude=37.0,
+            is_approved=True,
+        )
+
+    def _api_item(self):
+        return self.client.get(reverse("nko_list_api")).json()[0]
+
+    def test_thumbnails_are_built_in_background(self):
+        self.nko.logo.save("logo.png", ContentFile(_png()))
+        self.assertEqual(list(logos.pending()), [self.nko])
+        self.assertIsNone(self._api_item()["logo_url"])
+
+        self.assertEqual(logos.process_pending(), 1)
+        self.assertFalse(logos.pending().exists())
+        self.nko.refresh_from_db()
+        card = self.nko.logo_thumbs["card"]
+        self.assertRegex(card, rf"^nko_logos/thumbs/{self.nko.pk}-card\.\w{{10}}\.")
+        with default_storage.open(card) as f, Image.open(f) as thumb:
+            self.assertEqual(thumb.size, (112, 112))
+        item = self._api_item()
+        self.assertEqual(item["logo_url"], default_storage.url(card))
+        self.assertTrue(item["logo_placemark_url"])
+
+        # Новый логотип: старые миниатюры не отдаются и удаляются воркером
+        self.nko.logo.save("logo.png", ContentFile(_png(color="#15256D")))
+        self.assertIsNone(self.nko.logo_thumb_url("card"))
+        self.assertEqual(logos.process_pending(), 1)
+        self.assertFalse(default_storage.exists(card))
+
+    def test_unreadable_logo_is_not_retried(self):
+        self.nko.logo.save("logo.png", ContentFile(b"not an image"))
+        with self.assertLogs("nko.logos", "WARNING"):
+            self.assertEqual(logos.process_pending(), 1)
+        self.assertFalse(logos.pending().exists())
+        self.assertIsNone(self._api_item()["logo_url"])
+
+    def test_form_validation(self):
+        data = {"name": "НКО", "description": "-", "categories": []}
+        form = NKOEditForm(
+            data, {"logo": SimpleUploadedFile("logo.png", b"not an image")}
+        )
+        self.assertIn("logo", form.errors)
+        with override_settings(NKO_LOGO_MAX_PIXELS=1000):
+            form = NKOEditForm(data, {"logo": SimpleUploadedFile("logo.png", _png())})
+            self.assertIn("logo", form.errors)
+        form = NKOEditForm(data, {"logo": SimpleUploadedFile("logo.png", _png())})
+        self.assertNotIn("logo", form.errors)
+
+    def test_approved_version_replaces_logo(self):
+        version = NKOVersion.objects.create(
+            nko=self.nko, created_by=self.owner, name="НКО", description="-"
+        )
+        version.logo.save("new.png", ContentFile(_png()))
+        version.is_approved = True
+        version.apply_changes()
+        self.nko.refresh_from_db()
+        self.assertEqual(self.nko.logo.name, version.logo.name)
+        self.assertEqual(list(logos.pending()), [self.nko])
+
+        # Пакетное одобрение тоже переносит логотип, пустой — не меняет
+        batch = NKOVersion.objects.create(
+            nko=self.nko, created_by=self.owner, name="НКО", description="-"
+        )
+        moderation.approve_versions([batch.pk], notify=False)
+        self.nko.refresh_from_db()
+        self.assertEqual(self.nko.logo.name, version.logo.name)
+
+
+class MapTilesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = root.name
+        self.enterContext(
+            override_settings(
+                MAP_TILES_URL="/map-tiles/", MAP_TILES_ROOT=self.root, MAP_TILES_ZOOM=4
+            )
+        )
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        owner = User.objects.create_user("owner")
+        self.moscow, self.petersburg = [
+            NKO.objects.create(
+                name=name,
+                city=city,
+                owner=owner,
+                description="-",
+                latitude=lat,
+                longitude=lon,
+                is_approved=True,
+            )
+            for name, lat, lon in (("Москва", 55.75, 37.62), ("Питер", 59.94, 30.31))
+        ]
+
+    def _read(self, name):
+        with open(os.path.join(self.root, name), encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_tile_for(self):
+        self.assertEqual(tiles.tile_for(55.75, 37.62, 4), "4/9/5")
+        self.assertEqual(tiles.tile_for(89, -200, 2), "2/0/0")
+
+    def test_publish_all(self):
+        self.assertEqual(tiles.publish_all(), 2)
+        manifest = self._read("manifest.json")
+        self.assertEqual(set(manifest["tiles"]), {"4/9/5", "4/9/4"})
+        tile = self._read("4/9/5.json")
+        self.assertEqual([item["name"] for item in tile], ["Москва"])
+        self.assertEqual(
+            tile[0], views.nko_list_items(NKO.objects.filter(pk=self.moscow.pk))[0]
+        )
+        with gzip.open(os.path.join(self.root, "4/9/5.json.gz")) as f:
+            self.assertEqual(json.load(f), tile)
+        self.assertIsInstance(self._read("categories.json"), list)
+
+    def test_changes_rebuild_only_affected_tiles(self):
+        tiles.publish_all()
+        untouched = self._read("manifest.json")["tiles"]["4/9/4"]
+
+        # Перенос точки во Владивосток: старый тайл удаляется, новый создаётся
+        with self.captureOnCommitCallbacks(execute=True):
+            self.moscow.latitude, self.moscow.longitude = 43.1, 131.9
+            self.moscow.save()
+        manifest = self._read("manifest.json")
+        self.assertEqual(set(manifest["tiles"]), {"4/9/4", "4/13/5"})
+        self.assertEqual(manifest["tiles"]["4/9/4"], untouched)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "4/9/5.json")))
+
+        # Массовое снятие одобрения в админке
+        request = RequestFactory().post("/")
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(
+            NKOAdmin, "message_user"
+        ):
+            NKOAdmin(NKO, admin.site).disapprove_nko(
+                request, NKO.objects.filter(pk=self.petersburg.pk)
+            )
+        self.assertEqual(set(self._read("manifest.json")["tiles"]), {"4/13/5"})
+
+    def test_disabled_without_url(self):
+        with override_settings(MAP_TILES_URL=""), self.captureOnCommitCallbacks(
+            execute=True
+        ):
+            self.moscow.save()
+        self.assertEqual(os.listdir(self.root), [])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Category.objects.create(name="Экология")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("nko_list_api"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn("total;dur=", timing)
+
+    def test_template_timing(self):
+        response = self.client.get(reverse("users:login"))
+        self.assertIn("tpl;dur=", response["Server-Timing"])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_header_disabled(self):
+        response = self.client.get(reverse("nko_list_api"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_logged_with_queries(self):
+        with self.assertLogs("good_deed_map.instrumentation", "WARNING") as logs:
+            self.client.get(reverse("nko_list_api"))
+        self.assertIn("Slow request GET /nko/api/nko-list/", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    def test_timer_outside_request(self):
+        with instrumentation.timer("yandex"):
+            pass
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.enterContext(mock.patch.object(metrics, "_store", metrics._Store()))
+        region = Region.objects.create(name="Регион")
+        city = City.objects.create(name="Город", region=region)
+        owner = User.objects.create_user("owner")
+        nko = NKO.objects.create(name="НКО", city=city, owner=owner, description="-")
+        NKOVersion.objects.create(nko=nko, name="НКО", description="-", created_by=owner)
+
+    def _scrape(self, **extra):
+        extra.setdefault("REMOTE_ADDR", "127.0.0.1")
+        response = self.client.get(reverse("metrics"), **extra)
+        return response.status_code, response.content.decode()
+
+    def test_request_and_queue_metrics(self):
+        self.client.get(reverse("nko_list_api"))
+        self.client.get(reverse("nko_list_api"))
+        status, body = self._scrape()
+        self.assertEqual(status, 200)
+        self.assertIn("# TYPE gdm_request_duration_seconds histogram", body)
+        self.assertIn(
+            'gdm_request_duration_seconds_bucket{view="nko_list_api",le="+Inf"} 2', body
+        )
+        self.assertIn('gdm_response_size_bytes_count{view="nko_list_api"} 2', body)
+        self.assertIn(
+            'gdm_cache_lookups_total{name="nko_list_api",result="hit"} 1', body
+        )
+        self.assertIn("gdm_pending_versions 1\n", body)
+
+    def test_upstream_errors(self):
+        with override_settings(YANDEX_MAPS_GEO_API_KEY="key"), mock.patch(
+            "nko.suggest_proxy.requests.get", side_effect=requests.Timeout
+        ):
+            self.client.get(reverse("suggest_proxy"), {"text": "Моск"})
+        _, body = self._scrape()
+        self.assertIn(
+            'gdm_upstream_errors_total{upstream="suggest",reason="Timeout"} 1', body
+        )
+        self.assertIn('gdm_upstream_duration_seconds_count{upstream="suggest"} 1', body)
+
+    def test_only_direct_local_requests(self):
+        self.assertEqual(self._scrape(REMOTE_ADDR="10.0.0.1")[0], 404)
+        self.assertEqual(self._scrape(HTTP_X_FORWARDED_FOR="10.0.0.1")[0], 404)
+
+    def test_processes_aggregated(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_DIR=directory))
+        sample = ["gdm_email_failures_total", [["kind", "decision"]], 2]
+        for name in ("4000001-aa.json", "4000002-bb.json"):
+            with open(os.path.join(directory, name), "w") as f:
+                json.dump([sample], f)
+        email_utils.EMAIL_FAILURES.inc(kind="decision")
+
+        # Процесс 4000001 завершился: его значения переносятся в архив
+        with mock.patch.object(metrics, "_alive", lambda pid: pid != 4000001):
+            for _ in range(2):
+                _, body = self._scrape()
+                self.assertIn('gdm_email_failures_total{kind="decision"} 5', body)
+        self.assertNotIn("4000001-aa.json", os.listdir(directory))
+        self.assertIn("archive.json", os.listdir(directory))
+
+
+class LoggingTests(SimpleTestCase):
+    def _record(self, level=logging.INFO, exc_info=None):
+        return logging.LogRecord(
+            "nko.views", level, __file__, 1, "city %s", ("Москва",), exc_info
+        )
+
+    def test_json_formatter(self):
+        record = self._record()
+        record.nko_id = 5
+        data = json.loads(log.JsonFormatter().format(record))
+        self.assertEqual(data["message"], "city Москва")
+        self.assertEqual(data["logger"], "nko.views")
+        self.assertEqual(data["nko_id"], 5)
+
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            record = self._record(exc_info=sys.exc_info())
+        data = json.loads(log.JsonFormatter().format(record))
+        self.assertIn("ZeroDivisionError", data["exc_info"])
+
+    def test_debug_sampler(self):
+        sampler = log.DebugSampler(rate=0.25)
+        with mock.patch("random.random", side_effect=[0.1, 0.9]):
+            self.assertTrue(sampler.filter(self._record(logging.DEBUG)))
+            self.assertFalse(sampler.filter(self._record(logging.DEBUG)))
+        self.assertTrue(log.DebugSampler(rate=0).filter(self._record(logging.WARNING)))
+
+    def test_queue_handler_writes_in_background(self):
+        stream = StringIO()
+        handler = log.QueueStreamHandler(stream)
+        handler.setFormatter(log.JsonFormatter())
+        handler.handle(self._record())
+        handler.close()
+        self.assertEqual(json.loads(stream.getvalue())["message"], "city Москва")
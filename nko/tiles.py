@@ -0,0 +1,219 @@
+"""
+Статические тайлы точек НКО для карты
+
+Каталог для карты раскладывается по тайлам z/x/y (веб-меркатор, уровень
+MAP_TILES_ZOOM) в JSON-файлы в MAP_TILES_ROOT, которые nginx отдаёт по
+MAP_TILES_URL без участия Django:
+
+- ``manifest.json`` — хэши содержимого тайлов и ``categories.json``;
+  клиент запрашивает файлы с ``?v=<хэш>``, поэтому их можно кэшировать
+  бессрочно, а без кэша отдаётся только манифест;
+- ``<z>/<x>/<y>.json`` — элементы nko-list (views.nko_list_items) точек тайла;
+- ``state.json`` — id НКО в каждом тайле, чтобы при изменении находить
+  тайл, где точка была раньше.
+
+Изменения каталога (сигналы моделей и массовые операции модерации) вызывают
+schedule(): после фиксации транзакции перестраиваются только тайлы, в которых
+точки изменённых НКО были или оказались. Изменения категорий, городов и
+регионов перестраивают всё. Файлы пишутся атомарно (временный файл +
+os.replace) вместе со сжатой копией .gz для gzip_static.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .categories import category_registry
+from .models import NKO
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+CATEGORIES_NAME = "categories.json"
+STATE_NAME = "state.json"
+LOCK_NAME = ".lock"
+# Широта, за которой веб-меркатор не определён
+MAX_LATITUDE = 85.05112878
+
+
+def enabled():
+    return bool(settings.MAP_TILES_URL)
+
+
+def tile_for(latitude, longitude, zoom):
+    """Ключ "z/x/y" тайла, в который попадает точка"""
+    n = 2**zoom
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude)))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)
+    return f"{zoom}/{min(max(x, 0), n - 1)}/{min(max(y, 0), n - 1)}"
+
+
+def _published():
+    return NKO.objects.filter(
+        is_approved=True,
+        is_active=True,
+        latitude__isnull=False,
+        longitude__isnull=False,
+    )
+
+
+def _path(name):
+    return os.path.join(settings.MAP_TILES_ROOT, *name.split("/"))
+
+
+def _write(name, data):
+    """Атомарно записать JSON и его .gz; возвращает хэш содержимого"""
+    content = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    path = _path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for target, payload in (
+        (path, content),
+        (path + ".gz", gzip.compress(content, compresslevel=9, mtime=0)),
+    ):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, target)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return hashlib.sha256(content).hexdigest()[:10]
+
+
+def _remove(name):
+    for path in (_path(name), _path(name) + ".gz"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _read(name):
+    try:
+        with open(_path(name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _lock():
+    """Публикации из разных процессов выполняются по очереди"""
+    os.makedirs(settings.MAP_TILES_ROOT, exist_ok=True)
+    with open(_path(LOCK_NAME), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _items_by_tile(queryset, zoom):
+    # Импорт здесь: views импортирует модели и формы приложения
+    from .views import nko_list_items
+
+    tiles = {}
+    for item in nko_list_items(queryset):
+        key = tile_for(item["latitude"], item["longitude"], zoom)
+        tiles.setdefault(key, []).append(item)
+    return tiles
+
+
+def _write_tiles(tiles, manifest, state):
+    for key, items in tiles.items():
+        manifest["tiles"][key] = _write(f"{key}.json", items)
+        state["tiles"][key] = sorted(item["id"] for item in items)
+
+
+def publish_all():
+    """Перестроить все тайлы; возвращает число тайлов"""
+    zoom = settings.MAP_TILES_ZOOM
+    with _lock():
+        previous = _read(STATE_NAME) or {"tiles": {}}
+        tiles = _items_by_tile(_published(), zoom)
+        manifest = {"zoom": zoom, "tiles": {}}
+        state = {"zoom": zoom, "tiles": {}}
+        manifest["categories"] = _write(CATEGORIES_NAME, category_registry.as_dicts())
+        _write_tiles(tiles, manifest, state)
+        _write(STATE_NAME, state)
+        _write(MANIFEST_NAME, manifest)
+        for key in set(previous["tiles"]) - set(tiles):
+            _remove(f"{key}.json")
+    return len(tiles)
+
+
+def publish(nko_ids):
+    """
+    Перестроить тайлы, затронутые изменением НКО nko_ids.
+
+    Returns:
+        число перезаписанных или удалённых тайлов
+    """
+    zoom = settings.MAP_TILES_ZOOM
+    with _lock():
+        state = _read(STATE_NAME)
+        manifest = _read(MANIFEST_NAME)
+        if not state or not manifest or state.get("zoom") != zoom:
+            return None
+        located = {nko_id: key for key, ids in state["tiles"].items() for nko_id in ids}
+
+        # Тайлы, где точки были, и тайлы, куда они попали; в них входят и
+        # другие НКО — добираем их, пока набор тайлов не перестанет расти
+        affected = {located[pk] for pk in nko_ids if pk in located}
+        members = set(nko_ids)
+        while True:
+            members.update(*(state["tiles"].get(key, ()) for key in affected))
+            tiles = _items_by_tile(_published().filter(pk__in=members), zoom)
+            if set(tiles) <= affected:
+                break
+            affected.update(tiles)
+
+        for key in affected:
+            state["tiles"].pop(key, None)
+            manifest["tiles"].pop(key, None)
+        _write_tiles(tiles, manifest, state)
+        _write(STATE_NAME, state)
+        _write(MANIFEST_NAME, manifest)
+        for key in affected - set(tiles):
+            _remove(f"{key}.json")
+    return len(affected)
+
+
+def _run(nko_ids):
+    try:
+        if nko_ids is None or publish(nko_ids) is None:
+            publish_all()
+    except Exception:
+        # Тайлы догонит следующее изменение или publish_map_tiles
+        logger.exception("Map tiles publishing failed")
+
+
+def schedule(nko_ids=None):
+    """
+    Перестроить тайлы после фиксации текущей транзакции.
+
+    Args:
+        nko_ids: изменённые НКО; None — перестроить все тайлы
+    """
+    if not enabled():
+        return
+    if nko_ids is not None:
+        nko_ids = set(nko_ids)
+        if not nko_ids:
+            return
+    transaction.on_commit(lambda: _run(nko_ids))
@@ -9,6 +9,9 @@ urlpatterns = [
     path("transfer-tsx/", views.transfer_ownership_tsx, name="transfer_ownership_tsx"),
     path("my-requests/", views.my_requests, name="my_requests"),
     path("my-requests/tsx/", views.my_requests_tsx, name="my_requests_tsx"),
+    path(
+        "api/my-applications/", views.my_applications_api, name="my_applications_api"
+    ),
     path("api/nko-list/", views.nko_list_api, name="nko_list_api"),
     path("api/categories/", views.categories_api, name="categories_api"),
     path("api/suggest/", suggest_proxy, name="suggest_proxy"),
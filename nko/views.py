@@ -1,12 +1,24 @@
+import json
+import logging
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, Q, Value, When
+from django.utils.dateparse import parse_datetime
 from django.utils.text import slugify
 from django.contrib.auth import get_user_model
-from .models import City, Category, NKO, NKOVersion
+from .models import City, NKO, NKOVersion
 from .forms import NKOForm, NKOEditForm, TransferOwnershipForm
 from .email_utils import send_new_application_notification
+from . import cache as nko_cache
+from .categories import category_registry
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -14,34 +26,55 @@ User = get_user_model()
 # Create your views here.
 def index(request):
     cities = City.objects.all()
-    categories = Category.objects.all()
+    categories = category_registry.all()
     return render(request, "index.html", {"cities": cities, "categories": categories})
 
 
-def index_tsx(request):
+async def index_tsx(request):
     """Alternative index page using the TSX-inspired template.
 
     Prepares a simplified `ngos` list where each item contains a single
     representative category (the first) for rendering in the sidebar cards.
+    The list itself is shared by all visitors and comes from the cache;
+    only the per-user `is_owner` flag is computed per request.
     """
-    import json
+    data = await sync_to_async(nko_cache.get_or_compute)(
+        nko_cache.make_key("index_tsx"),
+        _index_tsx_data,
+        tags=(nko_cache.CATALOGUE_TAG, nko_cache.CATEGORIES_TAG),
+    )
+
+    # Cache owner check for authenticated user
+    user = await request.auser()
+    user_id = user.id if user.is_authenticated else None
+
+    ngos = [
+        {**ngo, "is_owner": user_id and owner_id == user_id}
+        for owner_id, ngo in data["ngos"]
+    ]
+
+    user_has_ngo = await sync_to_async(nko_cache.get_user_nko)(request) is not None
+
+    context = {
+        "cities": data["cities"],
+        "categories": data["categories"],
+        "ngos": ngos,
+        "cities_json": json.dumps(data["cities"]),
+        "is_authenticated": user.is_authenticated,
+        "user_has_ngo": user_has_ngo,
+    }
 
+    return await sync_to_async(render)(request, "index_tsx.html", context)
+
+
+def _index_tsx_data():
     # Optimize queries by selecting only needed fields and using select_related
     cities_qs = City.objects.select_related("region").only("id", "name", "region__name")
-    categories_qs = Category.objects.only("id", "name", "icon", "color")
-
-    # Prepare cities for JSON
-    cities_json = json.dumps(
-        [
-            {"id": city.id, "name": city.name, "region": city.region.name}
-            for city in cities_qs
-        ]
-    )
 
     # Select approved, active NKOs with optimized query
     nko_qs = (
         NKO.objects.filter(is_approved=True, is_active=True)
-        .select_related("city", "city__region", "owner")
+        .select_related("city", "city__region")
         .prefetch_related("categories")
         .only(
             "id",
@@ -56,97 +89,105 @@ def index_tsx(request):
             "vk_link",
             "telegram_link",
             "other_social",
+            "logo",
+            "logo_thumbs",
             "city__id",
             "city__name",
             "city__region__id",
             "city__region__name",
-            "owner__id",
+            "owner_id",
         )
     )
 
-    # Cache owner check for authenticated user
-    user_id = request.user.id if request.user.is_authenticated else None
-
     ngos = []
     for nko in nko_qs:
         # Use prefetched categories to avoid additional queries
         categories_list = list(nko.categories.all())
         first_cat = categories_list[0] if categories_list else None
-        is_owner = user_id and nko.owner_id == user_id
-        ngos.append(
-            {
-                "id": nko.id,
-                "name": nko.name,
-                "address": nko.address,
-                "lat": nko.latitude,
-                "lng": nko.longitude,
-                "description": nko.description,
-                "volunteer_functions": nko.volunteer_functions,
-                "phone": nko.phone,
-                "website": nko.website,
-                "vk_link": nko.vk_link,
-                "telegram_link": nko.telegram_link,
-                "other_social": nko.other_social,
-                "city": {
-                    "id": nko.city.id,
-                    "name": nko.city.name,
-                }
-                if nko.city
-                else None,
-                "is_owner": is_owner,
-                "category": {
-                    "id": first_cat.id,
-                    "name": first_cat.name,
-                    "color": first_cat.color,
-                    "icon": first_cat.icon,
-                }
-                if first_cat
-                else None,
+        ngo = {
+            "id": nko.id,
+            "name": nko.name,
+            "address": nko.address,
+            "lat": nko.latitude,
+            "lng": nko.longitude,
+            "description": nko.description,
+            "volunteer_functions": nko.volunteer_functions,
+            "phone": nko.phone,
+            "website": nko.website,
+            "vk_link": nko.vk_link,
+            "telegram_link": nko.telegram_link,
+            "other_social": nko.other_social,
+            "logo_url": nko.logo_thumb_url("card"),
+            "city": {
+                "id": nko.city.id,
+                "name": nko.city.name,
             }
-        )
-
-    user_has_ngo = False
-    if request.user.is_authenticated:
-        user_has_ngo = NKO.objects.filter(owner=request.user).exists()
+            if nko.city
+            else None,
+            "category": {
+                "id": first_cat.id,
+                "name": first_cat.name,
+                "color": first_cat.color,
+                "icon": first_cat.icon,
+            }
+            if first_cat
+            else None,
+        }
+        ngos.append((nko.owner_id, ngo))
 
     # Make JSON-serializable lists for template and client-side JS
     categories = [
         {"id": c.id, "name": c.name, "icon": c.icon, "color": c.color}
-        for c in categories_qs
+        for c in category_registry.all()
     ]
     cities = [
         {"id": ct.id, "name": ct.name, "region": ct.region.name} for ct in cities_qs
     ]
 
-    context = {
-        "cities": cities,
-        "categories": categories,
-        "ngos": ngos,
-        "cities_json": cities_json,
-        "is_authenticated": request.user.is_authenticated,
-        "user_has_ngo": user_has_ngo,
-    }
+    return {"cities": cities, "categories": categories, "ngos": ngos}
+
 
-    return render(request, "index_tsx.html", context)
+def _json_bytes(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
 
 
-def nko_list_api(request):
-    nko_list = NKO.objects.filter(is_approved=True, is_active=True).prefetch_related(
-        "categories"
+async def nko_list_api(request):
+    payload = await sync_to_async(nko_cache.get_or_compute)(
+        nko_cache.make_key("nko_list_api"),
+        lambda: _json_bytes(nko_list_items()),
+        tags=(nko_cache.CATALOGUE_TAG, nko_cache.CATEGORIES_TAG),
     )
+    return HttpResponse(payload, content_type="application/json")
+
+
+def nko_list_items(nko_list=None):
+    """
+    Элементы списка НКО для карты (nko-list и статические тайлы nko/tiles.py).
+
+    Args:
+        nko_list: queryset НКО; по умолчанию — все одобренные активные
+    """
+    if nko_list is None:
+        nko_list = NKO.objects.filter(is_approved=True, is_active=True)
+    nko_list = nko_list.select_related("city", "city__region")
+
+    # Категории берём из реестра, из БД нужны только связи
+    category_ids = defaultdict(list)
+    links = (
+        NKO.categories.through.objects.filter(nko__in=nko_list)
+        .order_by("id")
+        .values_list("nko_id", "category_id")
+    )
+    for nko_id, category_id in links:
+        category_ids[nko_id].append(category_id)
+
     data = []
     for nko in nko_list:
-        categories_data = []
-        for category in nko.categories.all():
-            categories_data.append(
-                {
-                    "id": category.id,
-                    "name": category.name,
-                    "slug": slugify(category.name, allow_unicode=True),
-                    "icon": category.icon,
-                    "color": category.color,
-                }
-            )
+        categories_data = [
+            category_registry.as_dict(category)
+            for category in map(category_registry.get, category_ids[nko.id])
+            if category is not None
+        ]
 
         data.append(
             {
@@ -163,27 +204,18 @@ def nko_list_api(request):
                 "address": nko.address,
                 "website": nko.website,
                 "description": nko.description,
+                "logo_url": nko.logo_thumb_url("card"),
+                "logo_placemark_url": nko.logo_thumb_url("placemark"),
                 "has_pending_changes": nko.has_pending_changes,
             }
         )
 
-    return JsonResponse(data, safe=False)
+    return data
 
 
-def categories_api(request):
-    categories = Category.objects.all()
-    cats = []
-    for category in categories:
-        cats.append(
-            {
-                "id": category.id,
-                "name": category.name,
-                "slug": slugify(category.name, allow_unicode=True),
-                "icon": category.icon,
-                "color": category.color,
-            }
-        )
-    return JsonResponse(cats, safe=False)
+async def categories_api(request):
+    categories = await sync_to_async(category_registry.as_dicts)()
+    return JsonResponse(categories, safe=False)
 
 
 @login_required
@@ -212,21 +244,17 @@ def add_nko(request):
         return redirect("index")
 
     if request.method == "POST":
-        # Debug: log phone field value
-        phone_value = request.POST.get("phone", "")
-        print(
-            f"[DEBUG add_nko] phone from POST: '{phone_value}' (type: {type(phone_value)}, len: {len(phone_value)})"
-        )
-
         form = NKOForm(request.POST, request.FILES)
 
         # Handle city_name field
         city_name = request.POST.get("city_name", "").strip()
         city_id = request.POST.get("city")
-
-        # Debug logging
-        print(f"[DEBUG add_nko] city_name from POST: '{city_name}'")
-        print(f"[DEBUG add_nko] city_id from POST: '{city_id}'")
+        logger.debug(
+            "add_nko: phone=%r city_name=%r city_id=%r",
+            request.POST.get("phone", ""),
+            city_name,
+            city_id,
+        )
 
         if city_id:
             # User selected existing city from dropdown
@@ -262,9 +290,6 @@ def add_nko(request):
 
             # Create initial version with city_name if custom
             if city_name and not city_id:
-                print(
-                    f"[DEBUG add_nko] Creating NKOVersion with city_name: '{city_name}'"
-                )
                 version = NKOVersion.objects.create(
                     nko=nko,
                     name=nko.name,
@@ -278,21 +303,20 @@ def add_nko(request):
                     vk_link=nko.vk_link,
                     telegram_link=nko.telegram_link,
                     other_social=nko.other_social,
+                    logo=nko.logo.name,
                     city_name=city_name,
                     created_by=request.user,
                     is_approved=False,
                 )
                 version.categories.set(nko.categories.all())
-                print(
-                    f"[DEBUG add_nko] Created NKOVersion id={version.id}, city_name='{version.city_name}'"
+                logger.debug(
+                    "add_nko: created NKOVersion %s with city_name=%r",
+                    version.id,
+                    city_name,
                 )
 
                 # Отправляем уведомление администраторам о новой заявке
                 send_new_application_notification(version)
-            else:
-                print(
-                    f"[DEBUG add_nko] Skipping NKOVersion creation. city_name='{city_name}', city_id='{city_id}'"
-                )
 
             messages.success(
                 request,
@@ -342,10 +366,9 @@ def edit_nko(request, pk):
         city_name = request.POST.get("city_name", "").strip()
         city_id = request.POST.get("city")
 
-        # Debug logging
-        print(f"[DEBUG edit_nko] city_name from POST: '{city_name}'")
-        print(f"[DEBUG edit_nko] city_id from POST: '{city_id}'")
-        print(f"[DEBUG edit_nko] nko_id: {pk}")
+        logger.debug(
+            "edit_nko: nko=%s city_name=%r city_id=%r", pk, city_name, city_id
+        )
 
         if form.is_valid():
             version = form.save(commit=False)
@@ -358,10 +381,7 @@ def edit_nko(request, pk):
 
             # Store city_name if custom city entered
             if city_name and not city_id:
-                print(f"[DEBUG edit_nko] Setting city_name on version: '{city_name}'")
                 version.city_name = city_name
-            else:
-                print(f"[DEBUG edit_nko] No custom city. city_id='{city_id}'")
 
             version.save()
             form.save_m2m()
@@ -369,8 +389,10 @@ def edit_nko(request, pk):
             nko.has_pending_changes = True
             nko.save()
 
-            print(
-                f"[DEBUG edit_nko] Saved NKOVersion id={version.id}, city_name='{version.city_name}'"
+            logger.debug(
+                "edit_nko: saved NKOVersion %s with city_name=%r",
+                version.id,
+                version.city_name,
             )
 
             # Отправляем уведомление администраторам о новой заявке
@@ -519,27 +541,161 @@ def transfer_ownership(request, pk):
     return render(request, "nko/transfer_ownership.html", {"form": form, "nko": nko})
 
 
-@login_required
-def my_requests(request):
-    """Просмотр заявок пользователя (ожидающих и отклоненных)"""
-    user_nko = NKO.objects.filter(owner=request.user).first()
+# Размер страницы истории (одобренные и отклонённые заявки)
+APPLICATIONS_PAGE_SIZE = 50
+
+
+def _encode_cursor(version):
+    return f"{version.created_at.isoformat()}_{version.pk}"
+
 
-    pending_versions = []
-    rejected_versions = []
+def _decode_cursor(cursor):
+    created_at, _, pk = cursor.rpartition("_")
+    created_at = parse_datetime(created_at)
+    if created_at is None:
+        raise ValueError(cursor)
+    return created_at, int(pk)
 
-    if user_nko:
-        pending_versions = NKOVersion.objects.filter(
-            nko=user_nko, is_approved=False, is_rejected=False
-        ).order_by("-created_at")
 
-        rejected_versions = NKOVersion.objects.filter(
+def _my_applications(user_nko, cursor=None, limit=None):
+    """
+    Заявки НКО пользователя одним запросом (+ prefetch категорий).
+
+    Ожидающие заявки идут первыми и возвращаются только на первой странице,
+    история (одобренные и отклонённые) — страницами по limit с курсором по
+    (created_at, id).
+
+    Returns:
+        словарь pending, approved, rejected, next_cursor, has_pending_transfer
+    """
+    result = {
+        "pending": [],
+        "approved": [],
+        "rejected": [],
+        "next_cursor": None,
+        "has_pending_transfer": False,
+    }
+    if user_nko is None:
+        return result
+    if limit is None:
+        limit = APPLICATIONS_PAGE_SIZE
+
+    is_pending = Q(is_approved=False, is_rejected=False)
+    history = ~is_pending
+    if cursor is not None:
+        created_at, pk = _decode_cursor(cursor)
+        history &= Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+    versions = (
+        NKOVersion.objects.filter(Q(nko=user_nko) & (history | is_pending))
+        .select_related("nko", "new_owner", "parent")
+        .prefetch_related("categories")
+        .annotate(
+            pending_first=Case(When(is_pending, then=Value(0)), default=Value(1))
+        )
+        .order_by("pending_first", "-created_at", "-pk")
+    )
+    if cursor is not None:
+        versions = versions.exclude(is_pending)
+
+    # Курсор читает строки порциями и останавливается после limit записей истории
+    count = 0
+    last = None
+    for version in versions.iterator(chunk_size=limit + 1):
+        if version.is_approved or version.is_rejected:
+            if count == limit:
+                result["next_cursor"] = _encode_cursor(last)
+                break
+            count += 1
+            last = version
+            key = "approved" if version.is_approved else "rejected"
+        else:
+            key = "pending"
+            if version.new_owner_id:
+                result["has_pending_transfer"] = True
+        result[key].append(version)
+
+    if cursor is not None:
+        # Ожидающие заявки на страницах курсора не выбираются
+        result["has_pending_transfer"] = (
+            NKOVersion.objects.filter(is_pending, nko=user_nko)
+            .exclude(new_owner=None)
+            .exists()
+        )
+    return result
+
+
+def _application_json(version):
+    if version.is_approved:
+        status = "approved"
+    elif version.is_rejected:
+        status = "rejected"
+    else:
+        status = "pending"
+    new_owner = version.new_owner
+    return {
+        "id": version.pk,
+        "status": status,
+        "kind": "transfer" if new_owner else "edit",
+        "name": version.name,
+        "nko_name": version.nko.name,
+        "created_at": version.created_at,
+        "change_description": version.change_description,
+        "new_owner": (new_owner.get_full_name() or new_owner.username)
+        if new_owner
+        else None,
+        "rejection_reason": version.rejection_reason,
+        "is_current": version.is_current,
+        "categories": [category.pk for category in version.categories.all()],
+    }
+
+
+@login_required
+def my_applications_api(request):
+    """Заявки пользователя в компактном JSON для модального окна"""
+    user_nko = nko_cache.get_user_nko(request)
+    try:
+        applications = _my_applications(user_nko, cursor=request.GET.get("cursor"))
+    except ValueError:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+
+    history = sorted(
+        applications["approved"] + applications["rejected"],
+        key=lambda v: (v.created_at, v.pk),
+        reverse=True,
+    )
+    return JsonResponse(
+        {
+            "nko": {"id": user_nko.pk, "name": user_nko.name} if user_nko else None,
+            "pending": [_application_json(v) for v in applications["pending"]],
+            "history": [_application_json(v) for v in history],
+            "next_cursor": applications["next_cursor"],
+            "has_pending_transfer": applications["has_pending_transfer"],
+        }
+    )
+
+
+@login_required
+def my_requests(request):
+    """Просмотр заявок пользователя (ожидающих и отклоненных)"""
+    user_nko = nko_cache.get_user_nko(request)
+    try:
+        applications = _my_applications(user_nko, cursor=request.GET.get("cursor"))
+    except ValueError:
+        return HttpResponseBadRequest("invalid cursor")
+
+    rejected_count = len(applications["rejected"])
+    if request.GET.get("cursor") or applications["next_cursor"]:
+        # На странице только часть истории — в заголовке общее число
+        rejected_count = NKOVersion.objects.filter(
             nko=user_nko, is_rejected=True
-        ).order_by("-created_at")
+        ).count()
 
     context = {
         "user_nko": user_nko,
-        "pending_versions": pending_versions,
-        "rejected_versions": rejected_versions,
+        "pending_versions": applications["pending"],
+        "rejected_versions": applications["rejected"],
+        "rejected_count": rejected_count,
+        "next_cursor": applications["next_cursor"],
     }
     # If fragment requested (for modal), render the compact fragment matching React layout
     if request.GET.get("fragment") == "1":
@@ -551,35 +707,19 @@ def my_requests(request):
 @login_required
 def my_requests_tsx(request):
     """Render the TSX-styled My Applications page (full-page view)."""
-    user_nko = NKO.objects.filter(owner=request.user).first()
-
-    approved_versions = []
-    pending_versions = []
-    rejected_versions = []
-
-    has_pending_transfer = False
-    if user_nko:
-        approved_versions = NKOVersion.objects.filter(
-            nko=user_nko, is_approved=True
-        ).order_by("-created_at")
-
-        pending_versions = NKOVersion.objects.filter(
-            nko=user_nko, is_approved=False, is_rejected=False
-        ).order_by("-created_at")
-
-        rejected_versions = NKOVersion.objects.filter(
-            nko=user_nko, is_rejected=True
-        ).order_by("-created_at")
-
-        # Check if there's a pending ownership transfer
-        has_pending_transfer = pending_versions.filter(new_owner__isnull=False).exists()
+    user_nko = nko_cache.get_user_nko(request)
+    try:
+        applications = _my_applications(user_nko, cursor=request.GET.get("cursor"))
+    except ValueError:
+        return HttpResponseBadRequest("invalid cursor")
 
     context = {
         "user_nko": user_nko,
-        "approved_versions": approved_versions,
-        "pending_versions": pending_versions,
-        "rejected_versions": rejected_versions,
-        "has_pending_transfer": has_pending_transfer,
+        "approved_versions": applications["approved"],
+        "pending_versions": applications["pending"],
+        "rejected_versions": applications["rejected"],
+        "has_pending_transfer": applications["has_pending_transfer"],
+        "next_cursor": applications["next_cursor"],
     }
 
     return render(request, "nko/my_requests_tsx.html", context)
@@ -1,6 +1,6 @@
 // main_tsx.js - clean implementation for TSX-like index page
 // Responsibilities:
-// - fetch categories and NKO list
+// - fetch categories and NKO list (static map tiles or the API)
 // - render sidebar cards with React-like hover styles
 // - initialize Yandex map with placemarks
 // - open modal as a cloned, focus-trapped element
@@ -44,7 +44,8 @@ function initMapAndUI(pointsData) {
     Object.keys(categoriesMap).forEach((catId) => {
       const cat = categoriesMap[catId];
       iconLayouts[catId] = ymaps.templateLayoutFactory.createClass(
-        `<div style="background-color:${cat.color};width:40px;height:40px;border-radius:50%;display:flex;align-items:center;justify-content:center;color:#fff;font-weight:600;">${cat.icon || ''}</div>`
+        // properties.logo — миниатюра логотипа НКО (если уже построена)
+        `<div style="background-color:${cat.color};width:40px;height:40px;border-radius:50%;display:flex;align-items:center;justify-content:center;color:#fff;font-weight:600;overflow:hidden;">{% if properties.logo %}<img src="{{ properties.logo }}" alt="" width="40" height="40" style="width:40px;height:40px;object-fit:contain;background:#fff;">{% else %}${cat.icon || ''}{% endif %}</div>`
       );
     });
 
@@ -99,11 +100,54 @@ function initMapAndUI(pointsData) {
   });
 }
 
+// Catalogue from static tiles published by nko/tiles.py (served by nginx).
+// Tiles and categories are requested with their content hash from the
+// manifest, so the browser keeps them until they actually change.
+async function fetchFromTiles(baseUrl) {
+  const base = baseUrl.endsWith("/") ? baseUrl : baseUrl + "/";
+  const manifestResp = await fetch(base + "manifest.json", { cache: "no-cache" });
+  if (!manifestResp.ok) throw new Error("Failed to fetch tiles manifest");
+  const manifest = await manifestResp.json();
+
+  const getJson = async (name, hash) => {
+    const resp = await fetch(`${base}${name}?v=${hash}`);
+    if (!resp.ok) throw new Error(`Failed to fetch ${name}`);
+    return resp.json();
+  };
+  const [categories, ...tiles] = await Promise.all([
+    getJson("categories.json", manifest.categories),
+    ...Object.entries(manifest.tiles || {}).map(([key, hash]) => getJson(`${key}.json`, hash)),
+  ]);
+  const list = tiles.flat().sort((a, b) => (a.name || "").localeCompare(b.name || "", "ru"));
+  return { categories, list };
+}
+
+async function fetchFromApi() {
+  const categoriesResp = await fetch("/nko/api/categories/");
+  if (!categoriesResp.ok) throw new Error("Failed to fetch categories");
+  const categories = await categoriesResp.json();
+
+  const resp = await fetch("/nko/api/nko-list/");
+  if (!resp.ok) throw new Error("Failed to fetch NKO list");
+  const list = await resp.json();
+  return { categories, list };
+}
+
+async function fetchCatalogue() {
+  const tilesUrl = window.MAP_TILES_URL;
+  if (tilesUrl) {
+    try {
+      return await fetchFromTiles(tilesUrl);
+    } catch (e) {
+      // Tiles are not published yet or unavailable - fall back to the API
+    }
+  }
+  return fetchFromApi();
+}
+
 async function fetchAndInit() {
   try {
-    const categoriesResp = await fetch("/nko/api/categories/");
-    if (!categoriesResp.ok) throw new Error("Failed to fetch categories");
-    const categories = await categoriesResp.json();
+    const { categories, list } = await fetchCatalogue();
 
     categoriesMap = {};
     categories.forEach((cat) => {
@@ -116,9 +160,6 @@ async function fetchAndInit() {
       };
     });
 
-    const resp = await fetch("/nko/api/nko-list/");
-    if (!resp.ok) throw new Error("Failed to fetch NKO list");
-    const list = await resp.json();
     rawNkoList = list;
 
     const pointsData = list
@@ -134,6 +175,7 @@ async function fetchAndInit() {
             hintContent: nko.name,
             balloonContent: `${nko.address || ""}<br>${(nko.categories || []).map((c) => c.name).join(", ")}`,
             category: primaryCategoryId,
+            logo: nko.logo_placemark_url || "",
           },
           title: nko.name,
           address: nko.address,
@@ -189,7 +231,7 @@ function renderPointsList(pointsData, rawList) {
     item.innerHTML = `
       <div class="flex items-center gap-4">
           <div class="flex-shrink-0 w-12 h-12 rounded-lg transition-transform group-hover:scale-110 shadow-sm" style="background-color: ${catColor}; display:flex; align-items:center; justify-content:center;">
-          ${catIcon ? `<span class="text-white">${catIcon}</span>` : '<span class="text-white">🏢</span>'}
+          ${raw.logo_url ? `<img src="${raw.logo_url}" alt="" width="48" height="48" loading="lazy" class="w-12 h-12 rounded-lg bg-white" style="object-fit:contain;">` : catIcon ? `<span class="text-white">${catIcon}</span>` : '<span class="text-white">🏢</span>'}
         </div>
         <div class="flex-1 min-w-0">
           <h3 class="font-bold text-slate-800 text-lg group-hover:text-brand-green-dark transition-colors truncate">${p.title || ""}</h3>
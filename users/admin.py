@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from nko.admin_utils import EstimatedCountPaginator
 from .models import Profile
 
 
@@ -51,8 +52,9 @@ class CustomUserAdmin(BaseUserAdmin):
     # Сортировка по умолчанию (новые сверху)
     ordering = ("-date_joined",)
 
-    # Дата иерархия для быстрой навигации
-    date_hierarchy = "date_joined"
+    # Без date_hierarchy: она агрегирует даты по всей таблице пользователей
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 # Перерегистрируем User с новой админкой
@@ -1,24 +1,214 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.utils.crypto import get_random_string
+
+from nko import cache as nko_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: слоты ограничивают только потоки процесса
+    fcntl = None
 
+logger = logging.getLogger(__name__)
 
 UserModel = get_user_model()
- 
+
+HASH_SLOT_POLL_INTERVAL = 0.05  # секунды
+
+_dummy_hash = None
+_hash_slots = None
+_hash_slots_lock = threading.Lock()
+
+
+def _get_dummy_hash():
+    # Хэш тем же алгоритмом, что и у пользователей, чтобы проверка для
+    # неизвестного email занимала столько же времени
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = make_password(get_random_string(32))
+    return _dummy_hash
+
+
+def client_ip(request):
+    """IP клиента; за nginx — из заголовка LOGIN_CLIENT_IP_HEADER"""
+    if request is None:
+        return None
+    header = settings.LOGIN_CLIENT_IP_HEADER
+    if header and request.META.get(header):
+        return request.META[header].split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR")
+
+
+def _ip_key(ip):
+    return nko_cache.make_key("login", "ip", ip)
+
+
+def _account_key(email):
+    digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+    return nko_cache.make_key("login", "account", digest)
+
+
+def _count(key):
+    """
+    Увеличить счётчик окна LOGIN_THROTTLE_WINDOW и вернуть новое значение.
+
+    Атомарно только в Redis: в файловом кэше одновременные попытки могут
+    потерять инкремент, и лимиты соблюдаются приблизительно (nko.W001).
+    """
+    cache.add(key, 0, timeout=settings.LOGIN_THROTTLE_WINDOW)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключ истёк между add и incr
+        cache.set(key, 1, timeout=settings.LOGIN_THROTTLE_WINDOW)
+        return 1
+
+
+def is_throttled(request, email):
+    """Превышены ли лимиты попыток для IP или учётной записи"""
+    ip = client_ip(request)
+    if ip and (cache.get(_ip_key(ip)) or 0) >= settings.LOGIN_IP_LIMIT:
+        return True
+    return (cache.get(_account_key(email)) or 0) >= settings.LOGIN_ACCOUNT_LIMIT
+
+
+def reset_throttle(email):
+    cache.delete(_account_key(email))
+
+
+class _FileSlot:
+    """Слот, занятый блокировкой flock на файле в LOGIN_HASH_SLOTS_DIR"""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def release(self):
+        # Закрытие файла снимает блокировку
+        os.close(self.fd)
+
+
+def _try_file_slot(prefix, count):
+    """Занять свободный слот без ожидания; None, если все заняты"""
+    directory = settings.LOGIN_HASH_SLOTS_DIR
+    os.makedirs(directory, exist_ok=True)
+    for slot in range(count):
+        path = os.path.join(directory, f"{prefix}-{slot}.lock")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return _FileSlot(fd)
+    return None
+
+
+def _get_hash_slots():
+    global _hash_slots
+    with _hash_slots_lock:
+        if _hash_slots is None:
+            _hash_slots = threading.BoundedSemaphore(settings.LOGIN_HASH_CONCURRENCY)
+        return _hash_slots
+
+
+def _acquire_hash_slot():
+    """
+    Занять один из LOGIN_HASH_CONCURRENCY слотов проверки пароля.
+
+    PBKDF2 с миллионом итераций занимает CPU почти на секунду, поэтому
+    одновременно хэшируют не больше N запросов на все воркеры сервера —
+    остальные продолжают обслуживать обычные запросы. Слот — файл в
+    LOGIN_HASH_SLOTS_DIR с блокировкой flock: ядро снимает её, когда
+    процесс завершается, так что упавший воркер слот не удерживает.
+    Свободный слот ждут не дольше LOGIN_HASH_WAIT секунд и не больше
+    LOGIN_HASH_CONCURRENCY запросов сразу.
+
+    Returns:
+        занятый слот (с методом release()) или None
+    """
+    if fcntl is None:
+        slots = _get_hash_slots()
+        return slots if slots.acquire(timeout=settings.LOGIN_HASH_WAIT) else None
+
+    concurrency = settings.LOGIN_HASH_CONCURRENCY
+    slot = _try_file_slot("slot", concurrency)
+    if slot is not None:
+        return slot
+    # Ждущий sync-воркер тоже занят: ждут не больше concurrency запросов,
+    # остальным сразу отказ
+    waiting = _try_file_slot("wait", concurrency)
+    if waiting is None:
+        return None
+    try:
+        deadline = time.monotonic() + settings.LOGIN_HASH_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(HASH_SLOT_POLL_INTERVAL)
+            slot = _try_file_slot("slot", concurrency)
+            if slot is not None:
+                return slot
+        return None
+    finally:
+        waiting.release()
+
+
+def _mark_throttled(request):
+    if request is not None:
+        request.login_throttled = True
+
 
 class EmailOnlyBackend(ModelBackend):
-    """Authenticate users strictly by email (case-insensitive)."""
+    """
+    Authenticate users strictly by email (case-insensitive).
+
+    До хэширования проверяются лимиты попыток по IP и по учётной записи
+    (счётчики в общем кэше), сама проверка пароля идёт не более чем в
+    LOGIN_HASH_CONCURRENCY воркерах одновременно. Отказ из-за лимитов
+    отмечается в request.login_throttled.
+    """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
         # 'username' param is what Django passes from authentication forms;
         # we treat it as email here.
         email = username or kwargs.get(UserModel.USERNAME_FIELD)
-        if email is None:
+        if email is None or password is None:
             return None
-        try:
-            user = UserModel.objects.get(email__iexact=email)
-        except UserModel.DoesNotExist:
+
+        if is_throttled(request, email):
+            _mark_throttled(request)
             return None
+        ip = client_ip(request)
+        if ip and _count(_ip_key(ip)) == settings.LOGIN_IP_LIMIT:
+            logger.warning("Login attempt limit reached for IP %s", ip)
 
-        if user.check_password(password) and self.user_can_authenticate(user):
+        slot = _acquire_hash_slot()
+        if slot is None:
+            logger.info("No free password hashing slot, login refused")
+            _mark_throttled(request)
+            return None
+        try:
+            user = UserModel.objects.filter(email__iexact=email).first()
+            if user is None:
+                check_password(password, _get_dummy_hash())
+                valid = False
+            else:
+                valid = user.check_password(password)
+        finally:
+            slot.release()
+
+        if not valid:
+            if _count(_account_key(email)) == settings.LOGIN_ACCOUNT_LIMIT:
+                logger.warning("Failed login limit reached for %s", email)
+            return None
+        reset_throttle(email)
+        if self.user_can_authenticate(user):
             return user
         return None
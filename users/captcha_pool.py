@@ -0,0 +1,85 @@
+"""
+Пул заранее подготовленных капч
+
+Команда refill_captcha_pool держит в CaptchaStore не меньше N действующих
+задач и заранее рисует их PNG в общий кэш. При CAPTCHA_GET_FROM_POOL
+форма берёт готовую задачу из пула (без записи в БД), а картинка отдаётся
+из кэша, так что в запросе не работают ни генератор, ни PIL.
+"""
+
+import hashlib
+import secrets
+from datetime import timedelta
+
+from captcha import views as captcha_views
+from captcha.conf import settings as captcha_settings
+from captcha.models import CaptchaStore
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from nko import cache as nko_cache
+from nko.db import serialized_write
+
+IMAGE_SCALES = (1,)
+
+
+def _image_key(hashkey, scale):
+    return nko_cache.make_key("captcha", hashkey, scale)
+
+
+def _lifetime():
+    return timedelta(minutes=settings.CAPTCHA_POOL_LIFETIME)
+
+
+def render_image(hashkey, scale=1):
+    """PNG капчи: из кэша или отрисованный библиотекой (и сохранённый в кэш)"""
+    key = _image_key(hashkey, scale)
+    png = cache.get(key)
+    if png is not None:
+        return png
+    response = captcha_views.captcha_image(None, hashkey, scale=scale)
+    if response.status_code != 200:
+        return None
+    png = response.content
+    cache.set(key, png, timeout=int(_lifetime().total_seconds()))
+    return png
+
+
+def available():
+    """Число задач в пуле, которые ещё можно выдать"""
+    min_expiration = timezone.now() + timedelta(
+        minutes=int(captcha_settings.CAPTCHA_GET_FROM_POOL_TIMEOUT)
+    )
+    return CaptchaStore.objects.filter(expiration__gt=min_expiration).count()
+
+
+def refill(size):
+    """
+    Дополнить пул до size задач и отрисовать их картинки.
+
+    Returns:
+        число созданных задач
+    """
+    missing = size - available()
+    if missing <= 0:
+        return 0
+
+    expiration = timezone.now() + _lifetime()
+    stores = []
+    for _ in range(missing):
+        challenge, response = captcha_settings.get_challenge()()
+        stores.append(
+            CaptchaStore(
+                challenge=challenge,
+                response=response.lower(),
+                hashkey=hashlib.sha1(secrets.token_bytes(32)).hexdigest(),
+                expiration=expiration,
+            )
+        )
+    serialized_write(CaptchaStore.objects.bulk_create, stores)
+
+    for store in stores:
+        for scale in IMAGE_SCALES:
+            render_image(store.hashkey, scale)
+    return len(stores)
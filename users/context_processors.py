@@ -1,19 +1,25 @@
-from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
 
 def user_nko(request):
     """
     Context processor that adds user's NKO (if any) to templates as `user_nko`.
 
+    The lookup is lazy: the database (or cache) is only hit if a template
+    actually uses the variable.
+
     Use in templates: `{% if user_nko %}...{% endif %}`
     """
     user = getattr(request, "user", None)
     if not user or not user.is_authenticated:
         return {}
-    try:
-        from nko.models import NKO
 
-        nko = NKO.objects.filter(owner=user).first()
-    except Exception:
-        nko = None
-    return {"user_nko": nko}
+    def load():
+        try:
+            from nko.cache import get_user_nko
+
+            return get_user_nko(request)
+        except Exception:
+            return None
+
+    return {"user_nko": SimpleLazyObject(load)}
@@ -6,10 +6,36 @@ from django.contrib.auth.forms import (
 )
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives
+from django.template import loader
 from captcha.fields import CaptchaField
+from nko.email_utils import send_email_async
 from .models import Profile
 
 
+class AsyncPasswordResetMixin:
+    """Письмо сброса пароля отправляется в фоне, запрос не ждёт SMTP"""
+
+    def send_mail(
+        self,
+        subject_template_name,
+        email_template_name,
+        context,
+        from_email,
+        to_email,
+        html_email_template_name=None,
+    ):
+        subject = loader.render_to_string(subject_template_name, context)
+        subject = "".join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+
+        email_message = EmailMultiAlternatives(subject, body, from_email, [to_email])
+        if html_email_template_name is not None:
+            html_email = loader.render_to_string(html_email_template_name, context)
+            email_message.attach_alternative(html_email, "text/html")
+        send_email_async(email_message)
+
+
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField(
         required=True,
@@ -162,6 +188,15 @@ class CustomAuthenticationForm(AuthenticationForm):
                 }
             )
 
+    def get_invalid_login_error(self):
+        # EmailOnlyBackend отметил запрос: превышен лимит попыток входа
+        if getattr(self.request, "login_throttled", False):
+            return forms.ValidationError(
+                "Слишком много попыток входа. Попробуйте через несколько минут.",
+                code="throttled",
+            )
+        return super().get_invalid_login_error()
+
     def confirm_login_allowed(self, user):
         """Проверка, может ли пользователь войти"""
         if not user.is_active:
@@ -199,7 +234,7 @@ class ResendConfirmationForm(forms.Form):
     )
 
 
-class CustomPasswordResetForm(PasswordResetForm):
+class CustomPasswordResetForm(AsyncPasswordResetMixin, PasswordResetForm):
     """Форма восстановления пароля с капчей"""
 
     captcha = CaptchaField(
@@ -227,7 +262,7 @@ class CustomPasswordResetForm(PasswordResetForm):
         )
 
 
-class CustomPasswordResetTsxForm(PasswordResetForm):
+class CustomPasswordResetTsxForm(AsyncPasswordResetMixin, PasswordResetForm):
     """Форма восстановления пароля с капчей для TSX версии"""
 
     captcha = CaptchaField(
@@ -1,3 +1,286 @@
-from django.test import TestCase
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from captcha.models import CaptchaStore
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users import captcha_pool, tokens
+from users.backends import EmailOnlyBackend
+from users.models import EmailConfirmationToken
+
+
+@mock.patch("captcha.conf.settings.CAPTCHA_TEST_MODE", True)
+class EmailConfirmationTests(TestCase):
+    def _register(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("register"),
+                {
+                    "email": "user@example.com",
+                    "full_name": "Иванов Иван",
+                    "password1": "Sup3r-secret-pass",
+                    "password2": "Sup3r-secret-pass",
+                    "captcha_0": "test",
+                    "captcha_1": "PASSED",
+                },
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        return re.search(r"https?://\S+", mail.outbox[0].body).group(0)
+
+    def test_signed_link_activates_once(self):
+        url = self._register()
+        self.assertIn("/accounts/confirm-email/s/", url)
+        self.assertFalse(EmailConfirmationToken.objects.exists())
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(email="user@example.com")
+        self.assertTrue(user.is_active)
+        self.assertTrue(user.profile.email_confirmed)
+
+        # После активации состояние пользователя изменилось — ссылка недействительна
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_expired_and_forged_links(self):
+        user = User.objects.create_user("u", "u@example.com", is_active=False)
+        token = tokens.make_token(user)
+
+        self.assertEqual(tokens.check_token(token), user)
+        self.assertIsNone(tokens.check_token(token[:-1] + "x"))
+        with override_settings(EMAIL_CONFIRMATION_MAX_AGE=-1):
+            with self.assertRaises(tokens.TokenExpired):
+                tokens.check_token(token)
+
+    @override_settings(EMAIL_CONFIRMATION_TOKENS="db")
+    def test_legacy_database_tokens(self):
+        url = self._register()
+        token = EmailConfirmationToken.objects.get()
+        self.assertIn(str(token.token), url)
+        self.client.get(url)
+        self.assertTrue(User.objects.get(email="user@example.com").is_active)
+        self.assertFalse(EmailConfirmationToken.objects.exists())
+
+    def test_resend_queues_mail_without_reporting_delivery(self):
+        User.objects.create_user("u", "u@example.com", is_active=False)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                reverse("resend_confirmation"),
+                {"email": "u@example.com", "captcha_0": "test", "captcha_1": "PASSED"},
+            )
+        self.assertEqual(response.status_code, 200)
+        # Письмо уходит только после ответа, ошибка SMTP попадает в журнал
+        self.assertEqual(mail.outbox, [])
+        with mock.patch(
+            "django.core.mail.EmailMessage.send", side_effect=OSError("smtp down")
+        ), self.assertLogs("nko.email_utils", "ERROR"):
+            for callback in callbacks:
+                callback()
+
+
+class PasswordResetTests(TestCase):
+    @mock.patch("captcha.conf.settings.CAPTCHA_TEST_MODE", True)
+    def test_reset_mail_is_sent_after_commit(self):
+        User.objects.create_user("u", "u@example.com", "pass")
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(
+                reverse("password_reset"),
+                {"email": "u@example.com", "captcha_0": "x", "captcha_1": "PASSED"},
+            )
+        self.assertEqual(mail.outbox, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["u@example.com"])
+
+
+class PurgeExpiredTests(TestCase):
+    def test_expired_rows_are_deleted_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            Session(session_key=f"s{i}", session_data="", expire_date=now + delta)
+            for i, delta in enumerate([timedelta(days=-1)] * 5 + [timedelta(days=1)])
+        )
+        user = User.objects.create_user("u", "u@example.com")
+        old = EmailConfirmationToken.objects.create(user=user)
+        EmailConfirmationToken.objects.filter(pk=old.pk).update(
+            created_at=now - timedelta(days=2)
+        )
+        fresh = EmailConfirmationToken.objects.create(user=user)
+        CaptchaStore.objects.create(challenge="1+1", response="2", expiration=now)
+
+        out = StringIO()
+        call_command("purge_expired", "--batch-size=2", stdout=out)
+
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), ["s5"])
+        self.assertEqual(list(EmailConfirmationToken.objects.all()), [fresh])
+        self.assertIn(
+            "Deleted 5 expired sessions, 1 confirmation tokens, 1 captchas",
+            out.getvalue(),
+        )
+
+
+class CaptchaPoolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("captcha.conf.settings.CAPTCHA_GET_FROM_POOL", True)
+    def test_form_uses_pooled_captcha_and_cached_image(self):
+        self.assertEqual(captcha_pool.refill(3), 3)
+        self.assertEqual(captcha_pool.refill(3), 0)
+
+        response = self.client.get(reverse("register"))
+        self.assertEqual(CaptchaStore.objects.count(), 3)
+        key = re.search(r"/captcha/image/(\w+)/", response.content.decode()).group(1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            image = self.client.get(f"/captcha/image/{key}/")
+        self.assertEqual(image["Content-Type"], "image/png")
+        self.assertTrue(image.content.startswith(b"\x89PNG"))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        self.assertEqual(self.client.get("/captcha/image/missing/").status_code, 410)
+
+
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    LOGIN_IP_LIMIT=5,
+    LOGIN_ACCOUNT_LIMIT=3,
+)
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user("u", "u@example.com", "right-password")
+
+    def _login(self, email, password, ip="10.0.0.1"):
+        return self.client.post(
+            reverse("login"),
+            {"username": email, "password": password},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_account_is_throttled_before_hashing(self):
+        with self.assertLogs("users.backends", "WARNING"):
+            for i in range(3):
+                self._login("U@example.com", "wrong", ip=f"10.0.0.{i}")
+
+        with mock.patch("django.contrib.auth.hashers.check_password") as check:
+            response = self._login("u@example.com", "right-password", ip="10.0.1.1")
+        check.assert_not_called()
+        self.assertContains(response, "Слишком много попыток входа")
+
+        self.assertEqual(self._login("other@example.com", "x").status_code, 200)
+
+    def test_ip_limit_and_unknown_email(self):
+        with mock.patch(
+            "users.backends.check_password", return_value=False
+        ) as dummy_check, self.assertLogs("users.backends", "WARNING"):
+            for i in range(5):
+                self._login(f"nobody{i}@example.com", "x")
+        self.assertEqual(dummy_check.call_count, 5)
+
+        response = self._login("u@example.com", "right-password")
+        self.assertContains(response, "Слишком много попыток входа")
+        response = self._login("u@example.com", "right-password", ip="10.0.0.2")
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ConcurrentLoginTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        for name in ("a", "b"):
+            User.objects.create_user(name, f"{name}@example.com", "right-password")
+        slots_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(slots_dir.cleanup)
+        self.enterContext(override_settings(LOGIN_HASH_SLOTS_DIR=slots_dir.name))
+
+    def test_two_valid_logins_hash_concurrently(self):
+        # Обе проверки пароля должны идти одновременно: барьер ждёт второй
+        barrier = threading.Barrier(2, timeout=5)
+        check_password = User.check_password
+
+        def blocking_check(user, password):
+            barrier.wait()
+            return check_password(user, password)
+
+        results = {}
+
+        def login(email):
+            try:
+                results[email] = EmailOnlyBackend().authenticate(
+                    None, username=email, password="right-password"
+                )
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=login, args=(email,))
+            for email in ("a@example.com", "b@example.com")
+        ]
+        with mock.patch.object(
+            User, "check_password", blocking_check
+        ), override_settings(LOGIN_HASH_CONCURRENCY=2):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(
+            {email: user.username for email, user in results.items()},
+            {"a@example.com": "a", "b@example.com": "b"},
+        )
+
+    @override_settings(LOGIN_HASH_CONCURRENCY=1, LOGIN_HASH_WAIT=0.2)
+    def test_slot_is_shared_between_processes(self):
+        # Слот держит другой воркер: отдельный процесс с flock на файле слота
+        holder = subprocess.Popen(
+            [sys.executable, "-c", HOLD_SLOT, settings.LOGIN_HASH_SLOTS_DIR],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        self.addCleanup(holder.kill)
+        self.assertEqual(holder.stdout.readline().strip(), "locked")
+
+        request = mock.Mock(META={})
+        with mock.patch.object(User, "check_password") as check:
+            self.assertIsNone(
+                EmailOnlyBackend().authenticate(
+                    request, username="a@example.com", password="right-password"
+                )
+            )
+        check.assert_not_called()
+        self.assertTrue(request.login_throttled)
+
+        # Завершённый процесс слот не удерживает
+        holder.kill()
+        holder.wait()
+        user = EmailOnlyBackend().authenticate(
+            None, username="a@example.com", password="right-password"
+        )
+        self.assertEqual(user.username, "a")
+
+
+HOLD_SLOT = """
+import fcntl, os, sys, time
+fd = os.open(os.path.join(sys.argv[1], "slot-0.lock"), os.O_RDWR | os.O_CREAT)
+fcntl.flock(fd, fcntl.LOCK_EX)
+print("locked", flush=True)
+time.sleep(60)
+"""
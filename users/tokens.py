@@ -0,0 +1,52 @@
+"""
+Подписанные токены подтверждения email
+
+Токен содержит id пользователя и хэш его состояния, подписанные SECRET_KEY
+с меткой времени, поэтому для проверки не нужна таблица в БД. После
+активации аккаунта (или смены email/пароля) хэш состояния меняется, и
+выданные ранее ссылки перестают действовать.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+SALT = "users.email_confirmation"
+
+
+class TokenExpired(Exception):
+    """Подпись верна, но срок действия ссылки истёк"""
+
+
+def _state_hash(user):
+    value = f"{user.pk}{user.is_active}{user.email}{user.password}"
+    return salted_hmac(SALT, value, algorithm="sha256").hexdigest()[:16]
+
+
+def make_token(user):
+    """Токен для ссылки подтверждения email пользователя"""
+    return signing.TimestampSigner(salt=SALT).sign(f"{user.pk}.{_state_hash(user)}")
+
+
+def check_token(token):
+    """
+    Пользователь, которому выдан токен, или None, если токен неверен
+    или уже использован.
+
+    Raises:
+        TokenExpired: ссылка старше EMAIL_CONFIRMATION_MAX_AGE
+    """
+    signer = signing.TimestampSigner(salt=SALT)
+    try:
+        value = signer.unsign(token, max_age=settings.EMAIL_CONFIRMATION_MAX_AGE)
+    except signing.SignatureExpired:
+        raise TokenExpired(token)
+    except signing.BadSignature:
+        return None
+
+    pk, _, state = value.partition(".")
+    user = User.objects.filter(pk=pk).first() if pk.isdigit() else None
+    if user is None or not constant_time_compare(state, _state_hash(user)):
+        return None
+    return user
@@ -1,20 +1,37 @@
+import logging
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import logout, views as auth_views
 from django.conf import settings
-from django.http import HttpResponseNotAllowed
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.views.decorators.http import require_http_methods
+from nko.email_utils import send_mail_async
 from .forms import (
     UserRegisterForm,
     UserRegisterTsxForm,
     CustomAuthenticationForm,
     ResendConfirmationForm,
 )
+from . import captcha_pool, tokens
 from .models import EmailConfirmationToken
 
+logger = logging.getLogger(__name__)
+
+
+def _confirmation_url(request, user):
+    """Ссылка подтверждения email: подписанная или через токен в БД"""
+    if settings.EMAIL_CONFIRMATION_TOKENS == "db":
+        # Старые токены пользователя больше не нужны
+        EmailConfirmationToken.objects.filter(user=user).delete()
+        token = EmailConfirmationToken.objects.create(user=user)
+        url = reverse("confirm_email", kwargs={"token": token.token})
+    else:
+        url = reverse("confirm_email_signed", kwargs={"token": tokens.make_token(user)})
+    return request.build_absolute_uri(url)
+
 
 def register(request):
     if request.method == "POST":
@@ -24,22 +41,12 @@ def register(request):
             user.is_active = False  # Деактивируем пользователя до подтверждения email
             user.save()
 
-            # Создаем токен подтверждения
-            token = EmailConfirmationToken.objects.create(user=user)
-
-            # Формируем ссылку подтверждения
-            confirmation_url = request.build_absolute_uri(
-                reverse("confirm_email", kwargs={"token": token.token})
-            )
+            confirmation_url = _confirmation_url(request, user)
 
-            # Отправляем письмо
-            try:
-                print(f"[DEBUG register] Attempting to send email to: {user.email}")
-                print(f"[DEBUG register] FROM: {settings.DEFAULT_FROM_EMAIL}")
-                print(f"[DEBUG register] EMAIL_BACKEND: {settings.EMAIL_BACKEND}")
-                send_mail(
-                    subject="Подтверждение регистрации на Карте добрых дел",
-                    message=f"""Здравствуйте, {user.get_full_name() or user.username}!
+            # Письмо уходит в фоне, ошибки SMTP только логируются
+            send_mail_async(
+                subject="Подтверждение регистрации на Карте добрых дел",
+                message=f"""Здравствуйте, {user.get_full_name() or user.username}!
 
 Спасибо за регистрацию на сайте "Карта добрых дел".
 
@@ -53,28 +60,14 @@ def register(request):
 С уважением,
 Команда "Карта добрых дел"
 """,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    fail_silently=False,
-                )
-                print(f"[DEBUG register] Email sent successfully to {user.email}")
-                messages.success(
-                    request,
-                    f"На адрес {user.email} отправлено письмо с подтверждением. "
-                    f"Пожалуйста, проверьте почту и перейдите по ссылке для активации аккаунта.",
-                )
-            except Exception as e:
-                import traceback
-                import logging
-
-                logger = logging.getLogger(__name__)
-                error_details = traceback.format_exc()
-                logger.error(f"Email sending error in register(): {e}")
-                logger.error(f"Full traceback:\n{error_details}")
-                messages.error(
-                    request,
-                    f"Ошибка при отправке письма подтверждения: {str(e)}. Пожалуйста, обратитесь к администратору.",
-                )
+                recipient_list=[user.email],
+            )
+            messages.success(
+                request,
+                f"На адрес {user.email} отправляется письмо с подтверждением. "
+                "Пожалуйста, проверьте почту и перейдите по ссылке для активации "
+                "аккаунта. Если письмо не придёт, запросите его повторно.",
+            )
 
             return render(
                 request,
@@ -95,22 +88,12 @@ def register_tsx(request):
             user.is_active = False  # Деактивируем пользователя до подтверждения email
             user.save()
 
-            # Создаем токен подтверждения
-            token = EmailConfirmationToken.objects.create(user=user)
-
-            # Формируем ссылку подтверждения
-            confirmation_url = request.build_absolute_uri(
-                reverse("confirm_email", kwargs={"token": token.token})
-            )
+            confirmation_url = _confirmation_url(request, user)
 
-            # Отправляем письмо
-            try:
-                print(f"[DEBUG register_tsx] Attempting to send email to: {user.email}")
-                print(f"[DEBUG register_tsx] FROM: {settings.DEFAULT_FROM_EMAIL}")
-                print(f"[DEBUG register_tsx] EMAIL_BACKEND: {settings.EMAIL_BACKEND}")
-                send_mail(
-                    subject="Подтверждение регистрации на Карте добрых дел",
-                    message=f"""Здравствуйте!
+            # Письмо уходит в фоне, ошибки SMTP только логируются
+            send_mail_async(
+                subject="Подтверждение регистрации на Карте добрых дел",
+                message=f"""Здравствуйте!
 
 Спасибо за регистрацию на сайте "Карта добрых дел".
 
@@ -124,28 +107,14 @@ def register_tsx(request):
 С уважением,
 Команда "Карта добрых дел"
 """,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    fail_silently=False,
-                )
-                print(f"[DEBUG register_tsx] Email sent successfully to {user.email}")
-                messages.success(
-                    request,
-                    f"На адрес {user.email} отправлено письмо с подтверждением. "
-                    f"Пожалуйста, проверьте почту и перейдите по ссылке для активации аккаунта.",
-                )
-            except Exception as e:
-                import traceback
-                import logging
-
-                logger = logging.getLogger(__name__)
-                error_details = traceback.format_exc()
-                logger.error(f"Email sending error in register_tsx(): {e}")
-                logger.error(f"Full traceback:\n{error_details}")
-                messages.error(
-                    request,
-                    f"Ошибка при отправке письма подтверждения: {str(e)}. Пожалуйста, обратитесь к администратору.",
-                )
+                recipient_list=[user.email],
+            )
+            messages.success(
+                request,
+                f"На адрес {user.email} отправляется письмо с подтверждением. "
+                "Пожалуйста, проверьте почту и перейдите по ссылке для активации "
+                "аккаунта. Если письмо не придёт, запросите его повторно.",
+            )
 
             return render(
                 request,
@@ -170,40 +139,55 @@ def register_tsx(request):
 
 
 def confirm_email(request, token):
-    """Подтверждение email по токену"""
+    """Подтверждение email по токену из БД (ссылки, выданные до подписанных токенов)"""
     token_obj = get_object_or_404(EmailConfirmationToken, token=token)
 
     if not token_obj.is_valid():
-        messages.error(
-            request,
-            "Ссылка подтверждения истекла. Пожалуйста, зарегистрируйтесь заново.",
-        )
-        return redirect("register")
+        return _confirmation_expired(request)
+
+    _activate(token_obj.user)
 
-    user = token_obj.user
+    # Удаляем использованный токен
+    token_obj.delete()
+
+    return render(request, "registration/email_confirmed_tsx.html")
+
+
+def confirm_email_signed(request, token):
+    """Подтверждение email по подписанному токену, без обращения к таблице токенов"""
+    try:
+        user = tokens.check_token(token)
+    except tokens.TokenExpired:
+        return _confirmation_expired(request)
+    if user is None:
+        raise Http404("Ссылка подтверждения недействительна")
+
+    _activate(user)
+    return render(request, "registration/email_confirmed_tsx.html")
+
+
+def _confirmation_expired(request):
+    messages.error(
+        request,
+        "Ссылка подтверждения истекла. Пожалуйста, зарегистрируйтесь заново.",
+    )
+    return redirect("register")
+
+
+def _activate(user):
     user.is_active = True
     user.save()
 
     # Обновляем профиль
     if hasattr(user, "profile"):
-        print(
-            f"[DEBUG confirm_email] Setting email_confirmed and receive_nko_notifications for user: {user.username}"
-        )
         user.profile.email_confirmed = True
         user.profile.receive_nko_notifications = (
             True  # Автоматически включаем уведомления после подтверждения email
         )
         user.profile.save()
-        print(
-            f"[DEBUG confirm_email] Profile updated. email_confirmed={user.profile.email_confirmed}, receive_nko_notifications={user.profile.receive_nko_notifications}"
-        )
+        logger.debug("Email confirmed for user %s", user.pk)
     else:
-        print(f"[DEBUG confirm_email] WARNING: User {user.username} has no profile!")
-
-    # Удаляем использованный токен
-    token_obj.delete()
-
-    return render(request, "registration/email_confirmed_tsx.html")
+        logger.warning("User %s has no profile, email confirmation not saved", user.pk)
 
 
 def login_view(request, *args, **kwargs):
@@ -225,22 +209,12 @@ def resend_confirmation(request):
             try:
                 user = User.objects.get(email=email, is_active=False)
 
-                # Удаляем старые токены для этого пользователя
-                EmailConfirmationToken.objects.filter(user=user).delete()
+                confirmation_url = _confirmation_url(request, user)
 
-                # Создаем новый токен
-                token = EmailConfirmationToken.objects.create(user=user)
-
-                # Формируем ссылку подтверждения
-                confirmation_url = request.build_absolute_uri(
-                    reverse("confirm_email", kwargs={"token": token.token})
-                )
-
-                # Отправляем письмо
-                try:
-                    send_mail(
-                        subject="Повторное подтверждение регистрации на Карте добрых дел",
-                        message=f"""Здравствуйте, {user.get_full_name() or user.username}!
+                # Письмо уходит в фоне, ошибки SMTP только логируются
+                send_mail_async(
+                    subject="Повторное подтверждение регистрации на Карте добрых дел",
+                    message=f"""Здравствуйте, {user.get_full_name() or user.username}!
 
 Вы запросили повторную отправку письма подтверждения регистрации.
 
@@ -254,25 +228,13 @@ def resend_confirmation(request):
 С уважением,
 Команда "Карта добрых дел"
 """,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[user.email],
-                        fail_silently=False,
-                    )
-                    return render(
-                        request,
-                        "registration/email_confirmation_sent_tsx.html",
-                        {"email": user.email},
-                    )
-                except Exception as e:
-                    import logging
-
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"Email sending error in resend_confirmation: {e}")
-                    messages.error(
-                        request,
-                        "Ошибка при отправке письма подтверждения. Пожалуйста, обратитесь к администратору.",
-                    )
-
+                    recipient_list=[user.email],
+                )
+                return render(
+                    request,
+                    "registration/email_confirmation_sent_tsx.html",
+                    {"email": user.email},
+                )
             except User.DoesNotExist:
                 # Не сообщаем, что пользователь не найден (безопасность)
                 pass
@@ -287,6 +249,14 @@ def resend_confirmation(request):
     return render(request, "registration/resend_confirmation_tsx.html", {"form": form})
 
 
+def captcha_image(request, key, scale=1):
+    """Картинка капчи из кэша пула; ненайденные ключи — 410, как в captcha.views"""
+    png = captcha_pool.render_image(key, scale)
+    if png is None:
+        return HttpResponse(status=410)
+    return HttpResponse(png, content_type="image/png")
+
+
 def logout_view(request):
     if request.method not in ("GET", "POST"):
         return HttpResponseNotAllowed(["GET", "POST"])